@@ -0,0 +1,670 @@
+"""asyncio 版のスクレイピングエンジン（aiohttp が必要）
+
+EHF / IHF のチームページ取得、clubdetails API、画像バリアントの探索、画像のダウンロードを
+すべて1つのイベントループ上のコルーチンとして実行する。大会全体のように数千件のリクエストを
+同時に待つ場合でも、スレッドを増やさずに1プロセスで処理できる。
+
+パースやレコードの組み立て、画像の取得手順（image_utils.iter_image_fetch）、プローブキャッシュ、
+画像ストア、レスポンスキャッシュ、リトライ方針・サーキットブレーカー、計測は同期版（ehf.py / ihf.py /
+image_utils.py / http_client.py）と同じものを使う。キャッシュ・画像ストアのファイル操作は既定の
+スレッドプールで、画像の再エンコードは TranscodePool（または既定のスレッドプール）で行い、ループを止めない。
+
+差分同期（--incremental）・選手ページの詳細（--details）・チームをまたいだ重複排除は同期版のみで、
+scrap.py は --engine async とこれらのオプションの組み合わせをエラーにする。
+
+aiohttp はオプションの依存なので、既定の同期版（scrap.py の --engine sync）はこれが無くても動く。
+
+    import async_engine
+    results = async_engine.run(['https://www.eurohandball.com/en/team/.../'])
+"""
+import asyncio
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # 同期版だけ使う場合は不要
+    aiohttp = None
+
+from http_client import DEFAULT_HEADERS, DEFAULT_TIMEOUT, RECENT_BODIES
+from metrics import get_default_metrics
+from probe_cache import iter_probes
+from rate_limit import (DEFAULT_RATE, DEFAULT_BURST, DEFAULT_RETRY_AFTER, MAX_RETRY_AFTER, PRIORITIES,
+                        THROTTLE_STATUSES, parse_retry_after)
+from response_cache import cache_key
+from retry import RetryPolicy, CircuitBreaker, classify_status, TRANSIENT, THROTTLED, CONNECTION, TIMEOUT
+
+# 全体とホストごとの同時接続数（スレッドではなく接続の上限）
+DEFAULT_LIMIT = 256
+DEFAULT_LIMIT_PER_HOST = 16
+# 同時に処理するチーム数
+DEFAULT_TEAMS = 64
+DOWNLOAD_CHUNK = 64 * 1024
+
+
+def require_aiohttp():
+    if aiohttp is None:
+        raise ImportError("async_engine には aiohttp が必要です: pip install aiohttp")
+
+
+class AsyncResponse:
+    """本文まで読み終えた応答（requests.Response と同じ名前の属性だけを持つ）。"""
+
+    def __init__(self, url, status_code, headers, content=b''):
+        self.url = url
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.from_cache = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error for url: {self.url}", response=self)
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class _Host:
+    def __init__(self, burst):
+        self.cond = asyncio.Condition()
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.waiting = []
+
+
+class AsyncScheduler:
+    """rate_limit.RequestScheduler の asyncio 版（ホストごとのトークンバケットと優先度、Retry-After）。"""
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.rate = rate or None
+        self.burst = max(1, burst)
+        self._hosts = {}
+        self._seq = 0
+
+    def _host(self, url):
+        host = urlparse(url).netloc.lower()
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _Host(self.burst)
+        return state
+
+    async def acquire(self, url, phase='page'):
+        state = self._host(url)
+        self._seq += 1
+        ticket = (PRIORITIES.get(phase, PRIORITIES['page']), self._seq)
+        async with state.cond:
+            state.waiting.append(ticket)
+            try:
+                while True:
+                    now = time.monotonic()
+                    if self.rate:
+                        state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+                    state.updated = now
+                    if min(state.waiting) != ticket:
+                        await state.cond.wait()
+                        continue
+                    delay = state.blocked_until - now
+                    if delay <= 0 and self.rate and state.tokens < 1:
+                        delay = (1 - state.tokens) / self.rate
+                    if delay <= 0:
+                        if self.rate:
+                            state.tokens -= 1
+                        return
+                    try:
+                        await asyncio.wait_for(state.cond.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            finally:
+                state.waiting.remove(ticket)
+                state.cond.notify_all()
+
+    def observe(self, url, status, headers):
+        if status not in THROTTLE_STATUSES:
+            return
+        delay = parse_retry_after(headers.get('Retry-After'))
+        delay = min(MAX_RETRY_AFTER, DEFAULT_RETRY_AFTER if delay is None else delay)
+        state = self._host(url)
+        state.blocked_until = max(state.blocked_until, time.monotonic() + delay)
+
+
+class AsyncHttpClient:
+    """
+    HttpClient の asyncio 版。
+
+    Args:
+        timeout (float): 1リクエストの既定タイムアウト（秒）。
+        limit (int): 全体の同時接続数。
+        limit_per_host (int): ホストごとの同時接続数。
+        headers (dict): 全リクエストに付与する既定ヘッダー。
+        probe_cache (ProbeCache): 画像バリアント探索の結果（同期版と共有できる）。
+        response_cache (ResponseCache): cacheable=True の GET に使う条件付きリクエスト用キャッシュ。
+        scheduler (AsyncScheduler): ホストごとのレート制限（省略時は制限なし）。
+        retry (RetryPolicy): 一時的な失敗の再試行方針。
+        breaker (CircuitBreaker): ホストごとのサーキットブレーカー。
+        metrics (Metrics): リクエストの記録先。省略時はプロセス共有の Metrics。
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, limit=DEFAULT_LIMIT, limit_per_host=DEFAULT_LIMIT_PER_HOST,
+                 headers=None, probe_cache=None, response_cache=None, scheduler=None, retry=None,
+                 breaker=None, metrics=None):
+        require_aiohttp()
+        self.timeout = timeout
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self.probe_cache = probe_cache
+        self.response_cache = response_cache
+        self.scheduler = scheduler
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or get_default_metrics()
+        self._session = None
+        self._bodies = OrderedDict()
+
+    def _get_session(self):
+        # セッションはイベントループの中で作る必要がある
+        if self._session is None:
+            connector = aiohttp.TCPConnector(limit=self.limit, limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, headers=self.headers)
+        return self._session
+
+    async def request(self, method, url, phase='page', cache_lookup=False, params=None, headers=None,
+                      timeout=None, allow_redirects=True, sink=None, read=True):
+        """
+        リクエストを送り、AsyncResponse を返す（再試行・計測は HttpClient.request と同じ）。
+
+        sink を渡すと本文はメモリに溜めずに sink(chunk) へ順に渡す（画像のダウンロード用）。
+        sink が真を返したらそこで読むのをやめて接続を閉じる（ヘッダーだけを読む場合）。
+        read=False なら本文を読まずに接続を閉じる（存在確認用）。
+        """
+        session = self._get_session()
+        client_timeout = aiohttp.ClientTimeout(total=timeout or self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.before(url)
+            if self.scheduler is not None:
+                await self.scheduler.acquire(url, phase)
+            started = time.perf_counter()
+            kind = None
+            try:
+                async with session.request(method, url, params=params, headers=headers, timeout=client_timeout,
+                                           allow_redirects=allow_redirects) as r:
+                    latency = time.perf_counter() - started
+                    content = b''
+                    received = 0
+                    if method != 'HEAD' and read:
+                        if sink is not None and r.status < 300:
+                            async for chunk in r.content.iter_chunked(DOWNLOAD_CHUNK):
+                                received += len(chunk)
+                                if sink(chunk):
+                                    break
+                        else:
+                            content = await r.read()
+                            received = len(content)
+                    resp = AsyncResponse(str(r.url), r.status, r.headers, content)
+            except asyncio.TimeoutError as e:
+                kind, error = TIMEOUT, requests.exceptions.Timeout(f"{url}: {e!r}")
+            except aiohttp.ClientConnectionError as e:
+                kind, error = CONNECTION, requests.exceptions.ConnectionError(f"{url}: {e}")
+            except aiohttp.ClientError as e:
+                raise requests.exceptions.RequestException(f"{url}: {e}") from e
+            if kind is not None:
+                self.metrics.record_request(method, url, phase, None, time.perf_counter() - started)
+                self.breaker.failure(url)
+                if not self.retry.should_retry(kind, attempt, method):
+                    raise error
+                await asyncio.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+
+            cache = ('hit' if resp.status_code == 304 else 'miss') if cache_lookup else ''
+            self.metrics.record_request(method, url, phase, resp.status_code, latency, cache=cache,
+                                        nbytes=received)
+            if self.scheduler is not None:
+                self.scheduler.observe(url, resp.status_code, resp.headers)
+            kind = classify_status(resp.status_code)
+            if kind not in TRANSIENT:
+                self.breaker.success(url)
+                return resp
+            if kind != THROTTLED:
+                self.breaker.failure(url)
+            if not self.retry.should_retry(kind, attempt, method):
+                return resp
+            await asyncio.sleep(self.retry.delay(attempt, parse_retry_after(resp.headers.get('Retry-After'))))
+            attempt += 1
+
+    async def get(self, url, cacheable=False, params=None, **kwargs):
+        """
+        GET。cacheable=True なら response_cache の ETag / Last-Modified で条件付きリクエストにする。
+
+        キャッシュのファイル操作は既定のスレッドプールで行い、ループを止めない。
+        """
+        cache = self.response_cache if cacheable else None
+        if cache is None:
+            return await self.request('GET', url, params=params, **kwargs)
+        loop = asyncio.get_running_loop()
+        key = cache_key(url, params)
+        entry = await loop.run_in_executor(None, cache.lookup, key)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+        resp = await self.request('GET', url, params=params, headers=headers, cache_lookup=True, **kwargs)
+        if resp.status_code == 304 and entry:
+            try:
+                resp.content = await loop.run_in_executor(None, cache.read_body, key)
+            except OSError:
+                return await self.request('GET', url, params=params, **kwargs)
+            resp.status_code = 200
+            resp.from_cache = True
+        elif resp.status_code == 200:
+            try:
+                await loop.run_in_executor(None, cache.store, key, url, resp)
+            except OSError as e:
+                print(f"レスポンスキャッシュに保存できませんでした: {e}")
+        return resp
+
+    async def head(self, url, **kwargs):
+        kwargs.setdefault('allow_redirects', False)
+        kwargs.setdefault('phase', 'probe')
+        return await self.request('HEAD', url, **kwargs)
+
+    async def download(self, url, local_path, timeout=15):
+        """
+        画像をストリームで local_path に保存し、sha256 を返す（image_utils.download_to_file と同じ手順）。
+        """
+        from image_utils import _temp_path, _remove_quietly
+        digest = hashlib.sha256()
+        size = [0]
+        wf, tmp = _temp_path(local_path)
+
+        def sink(chunk):
+            wf.write(chunk)
+            digest.update(chunk)
+            size[0] += len(chunk)
+
+        try:
+            with wf:
+                resp = await self.request('GET', url, phase='download', timeout=timeout, sink=sink)
+                resp.raise_for_status()
+            expected = resp.headers.get('Content-Length')
+            if expected and not resp.headers.get('Content-Encoding') and int(expected) != size[0]:
+                raise IOError(f"incomplete download: {size[0]}/{expected} bytes")
+            os.replace(tmp, local_path)
+        except BaseException:
+            _remove_quietly(tmp)
+            raise
+        return digest.hexdigest()
+
+    def remember_body(self, url, body):
+        self._bodies[url] = body
+        self._bodies.move_to_end(url)
+        while len(self._bodies) > RECENT_BODIES:
+            self._bodies.popitem(last=False)
+
+    def recent_body(self, url):
+        return self._bodies.get(url)
+
+    def flush_caches(self):
+        if self.probe_cache is not None:
+            self.probe_cache.save()
+        if self.response_cache is not None:
+            try:
+                self.response_cache.save()
+            except OSError as e:
+                print(f"レスポンスキャッシュに保存できませんでした: {e}")
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self.flush_caches)
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+async def resolve_variant(base_url, candidates, probe, cache=None):
+    """probe_cache.resolve_variant の asyncio 版（probe はコルーチン関数）。"""
+    steps = iter_probes(base_url, candidates, cache)
+    try:
+        url = next(steps)
+        while True:
+            url = steps.send(await probe(url))
+    except StopIteration as done:
+        return done.value
+
+
+async def head_ok(client, url):
+    """image_utils.head_ok と同じ判定（True / False / 判定不能なら None）。"""
+    try:
+        status = (await client.head(url, timeout=5)).status_code
+    except requests.RequestException:
+        return None
+    if status in THROTTLE_STATUSES:
+        return None
+    return status == 200
+
+
+async def probe_url(client, url):
+    """ehf.probe_url と同じ判定（HEAD で分からなければ本文を読まない GET で確認する）。"""
+    try:
+        head = await client.head(url, allow_redirects=True, timeout=5)
+        if head.status_code == 200 and head.headers.get('Content-Length'):
+            return True
+        if head.status_code in THROTTLE_STATUSES:
+            return None
+        resp = await client.request('GET', url, phase='probe', timeout=7, read=False)
+    except requests.RequestException:
+        return None
+    if resp.status_code in THROTTLE_STATUSES:
+        return None
+    return resp.status_code == 200
+
+
+async def content_type(client, url):
+    """image_utils.content_type の asyncio 版。"""
+    try:
+        resp = await client.head(url, allow_redirects=True, timeout=7, phase='content_type')
+    except requests.RequestException:
+        return ''
+    return resp.headers.get('Content-Type', '')
+
+
+async def probe_image_size(client, url, max_bytes=None):
+    """image_utils.probe_image_size の asyncio 版（ヘッダーを解析できた時点で読むのをやめる）。"""
+    from image_utils import HEADER_BYTES
+    from PIL import ImageFile
+    max_bytes = max_bytes or HEADER_BYTES
+    parser = ImageFile.Parser()
+    state = {'read': 0, 'failed': False}
+
+    def sink(chunk):
+        try:
+            parser.feed(chunk)
+        except Exception:
+            state['failed'] = True
+            return True
+        state['read'] += len(chunk)
+        return parser.image is not None or state['read'] >= max_bytes
+
+    try:
+        resp = await client.request('GET', url, phase='probe', timeout=15, sink=sink,
+                                    headers={'Range': f'bytes=0-{max_bytes - 1}'})
+    except requests.RequestException:
+        return None
+    if resp.status_code not in (200, 206) or state['failed'] or parser.image is None:
+        return None
+    return parser.image.size
+
+
+def _advance(steps, value):
+    """手順を次の I/O まで進める。終わったら (None, 保存先のパス)。"""
+    try:
+        return steps.send(value), None
+    except StopIteration as done:
+        return None, done.value or ''
+
+
+async def run_image_fetch(steps, client, probe, transcoder=None):
+    """
+    image_utils.run_image_fetch の asyncio 版。
+
+    ネットワークはループ上で待ち、手順（画像ストア・プローブキャッシュのファイル操作）は既定の
+    スレッドプールで、変換は transcoder（省略時はスレッドプール）で進めてループを止めない。
+    """
+    from image_utils import PROBE, CONTENT_TYPE, IMAGE_SIZE, DOWNLOAD, TRANSCODE, transcode_image
+    loop = asyncio.get_running_loop()
+    op, path = await loop.run_in_executor(None, _advance, steps, None)
+    while op is not None:
+        kind = op[0]
+        if kind == PROBE:
+            result = await probe(op[1])
+        elif kind == CONTENT_TYPE:
+            result = await content_type(client, op[1])
+        elif kind == IMAGE_SIZE:
+            result = await probe_image_size(client, op[1])
+        elif kind == DOWNLOAD:
+            try:
+                result = await client.download(op[1], op[2])
+            except Exception:
+                result = None
+        elif kind == TRANSCODE:
+            started = time.perf_counter()
+            if transcoder is not None:
+                result = await asyncio.wrap_future(transcoder.submit(op[1], op[2], False))
+                client.metrics.add_time('encode.pool', time.perf_counter() - started)
+            else:
+                result = await loop.run_in_executor(None, transcode_image, op[1], op[2], False)
+                client.metrics.add_time('encode', time.perf_counter() - started)
+        else:
+            raise ValueError(f"unknown step: {kind}")
+        op, path = await loop.run_in_executor(None, _advance, steps, result)
+    return path
+
+
+async def fetch_ehf_image(client, img_url, images_dir, pid, name, store):
+    """ehf.fetch_player_image の asyncio 版。"""
+    import ehf
+    from image_utils import iter_image_fetch
+    steps = iter_image_fetch(img_url, images_dir, pid, name, store, variants=(ehf.photo_candidates,),
+                             probe_cache=client.probe_cache)
+    return await run_image_fetch(steps, client, lambda u: probe_url(client, u))
+
+
+async def fetch_ihf_image(client, img_url, images_dir, name, player_id, store, transcoder=None):
+    """ihf.fetch_player_image の asyncio 版。"""
+    import ihf
+    from image_utils import iter_image_fetch, resolution_candidates
+    steps = iter_image_fetch(img_url, images_dir, player_id, name, store,
+                             variants=(ihf.query_variants, resolution_candidates), probe_cache=client.probe_cache,
+                             check_size=True, transcode=True)
+    return await run_image_fetch(steps, client, lambda u: head_ok(client, u), transcoder)
+
+
+async def _fill_images(jobs):
+    """[(レコード, コルーチン), ...] を並行に実行し、結果のパスを record['Image'] に入れる。"""
+    results = await asyncio.gather(*(coro for _, coro in jobs), return_exceptions=True)
+    for (record, _), result in zip(jobs, results):
+        if isinstance(result, BaseException):
+            print(f"画像取得エラー: {result}")
+            result = ''
+        record['Image'] = result or ''
+
+
+async def _default_store():
+    """プロセス共有の画像ストア（初回はインデックスを読むのでループの外で作る）。"""
+    from image_store import get_default_store
+    return await asyncio.get_running_loop().run_in_executor(None, get_default_store)
+
+
+async def scrape_ehf(url, client, store=None, transcoder=None, images=True):
+    """
+    ehf.scrape_player_data の asyncio 版（EHF の画像は変換しないので transcoder は使わない）。
+
+    差分同期（state）・チームをまたいだ重複排除（players）・選手ページの詳細（details）は同期版のみ。
+    """
+    import ehf
+    if images and store is None:
+        store = await _default_store()
+
+    try:
+        response = await client.get(url, cacheable=True)
+        response.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"エラー: URL '{url}' にアクセスできませんでした。詳細: {e}")
+        return []
+    body = response.content
+    client.remember_body(url, body)
+    with client.metrics.timer('parse.page'):
+        club_attrs = ehf.scan_club_details(body)
+
+    api_request = ehf.club_details_request(url, club_attrs) if club_attrs else None
+    if api_request:
+        api_url, params = api_request
+        try:
+            api_resp = await client.get(api_url, params=params, cacheable=True, phase='api')
+            api_resp.raise_for_status()
+            with client.metrics.timer('parse.api'):
+                json_data = api_resp.json()
+        except requests.exceptions.RequestException as e:
+            print(f"API呼び出しに失敗しました: {e}")
+        except ValueError:
+            print("APIの応答がJSONとして解析できませんでした")
+        else:
+            images_dir = os.path.join('images', 'ehf')
+            if images:
+                os.makedirs(images_dir, exist_ok=True)
+            player_data = []
+            jobs = []
+            for item in ehf.iter_api_items(json_data):
+                record = ehf.player_record(item)
+                player_data.append(record)
+                img_url = ehf.photo_url(item, api_url) if images else None
+                if img_url:
+                    jobs.append((record, fetch_ehf_image(client, img_url, images_dir, ehf.player_id(item),
+                                                         record['選手名'], store)))
+            await _fill_images(jobs)
+            return player_data
+
+    with client.metrics.timer('parse.html'):
+        return ehf.parse_table_rows(body)
+
+
+async def scrape_ihf(url, client, store=None, transcoder=None, images=True):
+    """
+    ihf.scrape_player_data の asyncio 版（transcoder・images の扱いも同じ。False ならスレッドで変換する）。
+
+    players・details は同期版のみ。
+    """
+    import ihf
+    from html_parsing import make_soup
+    if not images:
+        transcoder = None
+    else:
+        store = store or await _default_store()
+        if transcoder is None:
+            from image_postprocess import get_default_transcoder
+            transcoder = get_default_transcoder()
+        elif transcoder is False:
+            transcoder = None
+
+    try:
+        resp = await client.get(url, cacheable=True)
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"エラー: URL '{url}' にアクセスできませんでした。詳細: {e}")
+        return []
+    client.remember_body(url, resp.content)
+    with client.metrics.timer('parse.html'):
+        soup = make_soup(resp.content)
+
+    images_dir = os.path.join('images', 'ihf')
+    if images:
+        os.makedirs(images_dir, exist_ok=True)
+    player_data = []
+    jobs = []
+    for record, image, _ in ihf.parse_players(soup, url):
+        player_data.append(record)
+        if image and images:
+            img_url, player_id, name = image
+            jobs.append((record, fetch_ihf_image(client, img_url, images_dir, name, player_id, store, transcoder)))
+    await _fill_images(jobs)
+    return player_data
+
+
+# registry.SCRAPERS のモジュール名 -> asyncio 版のスクレイパー
+SCRAPERS = {
+    'ehf': scrape_ehf,
+    'ihf': scrape_ihf,
+}
+
+
+async def scrape(url, client, transcoder=None, images=True):
+    """ホストに合わせて EHF / IHF の asyncio 版スクレイパーを呼ぶ（振り分けは registry.SCRAPERS と同じ）。"""
+    from registry import find_scraper
+    scraper = SCRAPERS[find_scraper(url).module]
+    return await scraper(url, client, transcoder=transcoder, images=images)
+
+
+async def scrape_many(urls, client, teams=DEFAULT_TEAMS, transcoder=None, on_result=None, scraper=None,
+                      images=True):
+    """
+    複数チームを1つのイベントループで並行に処理する。
+
+    Args:
+        teams (int): 同時に処理するチーム数（リクエストの同時数は client の接続上限で決まる）。
+        on_result (callable): on_result(url, records) をチームが終わるたびに呼ぶ（CSV の書き出しなど）。
+        scraper (coroutine function): scraper(url, client, transcoder=..., images=...)。省略時は scrape（ホストで振り分け）。
+        images (bool): False なら画像を取得しない。
+
+    Returns:
+        dict: {url: 選手レコードのリスト}
+    """
+    from batch import interleave_by_domain
+    scraper = scraper or scrape
+    gate = asyncio.Semaphore(max(1, teams))
+    results = {}
+
+    async def one(url):
+        async with gate:
+            try:
+                data = await scraper(url, client, transcoder=transcoder, images=images)
+            except Exception as e:
+                print(f"エラー: {url} の処理に失敗しました: {e}")
+                data = []
+        results[url] = data or []
+        if on_result is not None:
+            on_result(url, results[url])
+        print(f"[{len(results)}/{len(urls)}] {url}: {len(results[url])} players")
+
+    await asyncio.gather(*(one(url) for url in interleave_by_domain(urls)))
+    await asyncio.get_running_loop().run_in_executor(None, client.flush_caches)
+    return results
+
+
+def run(urls, client=None, **kwargs):
+    """
+    scrape_many の同期ラッパー。client を省略した場合はキャッシュ付きの AsyncHttpClient を作って閉じる。
+    """
+    own = client is None
+    if own:
+        # キャッシュの読み込みはループを始める前に済ませる
+        from probe_cache import ProbeCache
+        from response_cache import ResponseCache
+        probe_cache, response_cache = ProbeCache(), ResponseCache()
+
+    async def main():
+        nonlocal client
+        if own:
+            client = AsyncHttpClient(probe_cache=probe_cache, response_cache=response_cache,
+                                     scheduler=AsyncScheduler())
+        try:
+            return await scrape_many(list(urls), client, **kwargs)
+        finally:
+            if own:
+                await client.close()
+            else:
+                await asyncio.get_running_loop().run_in_executor(None, client.flush_caches)
+
+    return asyncio.run(main())
+
+
+def scrape_player_data(url, **kwargs):
+    """1チーム分の同期ラッパー（ehf / ihf の scrape_player_data と同じ戻り値）。"""
+    return run([url], **kwargs).get(url, [])
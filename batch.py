@@ -0,0 +1,160 @@
+"""複数チームの一括スクレイピング
+
+チームURLの一覧ファイル、または大会ページから見つけたチームURLを
+スレッドプールで並列に処理する。全体の同時実行数（workers）に加えて、
+同一ドメインへの同時実行数（per_domain）も制限する。
+出力はチームごとのCSV、またはチーム列を付けた1つのCSVにまとめる。
+"""
+import os
+import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urljoin, urlparse
+
+from http_client import HostLimiter
+
+DEFAULT_WORKERS = 8
+DEFAULT_PER_DOMAIN = 2
+
+# 大会ページ上のチームページへのリンクと見なすパス
+TEAM_LINK_PATTERN = re.compile(r'/teams?/')
+
+
+def read_url_file(path):
+    """1行1URLのファイルを読む。空行と # で始まる行は無視し、重複は除く。"""
+    urls = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#') and line not in urls:
+                urls.append(line)
+    return urls
+
+
+def discover_team_urls(competition_url, client):
+    """大会ページからチームページへのリンクを集めて返す（ページ内の出現順）。"""
+    from html_parsing import make_soup, LINK_STRAINER
+
+    resp = client.get(competition_url, cacheable=True)
+    resp.raise_for_status()
+    with client.metrics.timer('parse.competition'):
+        soup = make_soup(resp.content, LINK_STRAINER)
+
+    urls = []
+    for a in soup.find_all('a', href=True):
+        href = urljoin(competition_url, a['href']).split('#')[0]
+        if not TEAM_LINK_PATTERN.search(urlparse(href).path):
+            continue
+        if href.rstrip('/') == competition_url.rstrip('/') or href in urls:
+            continue
+        urls.append(href)
+    return urls
+
+
+def team_name(url):
+    """URLからチーム名を推定する（例: .../team/<id>/Hungary/ -> Hungary）。"""
+    segments = [s for s in urlparse(url).path.split('/') if s]
+    return segments[-1] if segments else urlparse(url).netloc
+
+
+def team_filename(url):
+    """チームごとのCSVファイル名。同名チームが衝突しないようIDらしき区間も含める。"""
+    segments = [s for s in urlparse(url).path.split('/') if s]
+    slug = '_'.join(segments[-2:]) if segments else urlparse(url).netloc
+    slug = re.sub(r'[^0-9A-Za-z_\-]', '_', slug).strip('_')[:80] or 'team'
+    return slug + '.csv'
+
+
+def interleave_by_domain(urls):
+    """ドメインごとに振り分けて交互に並べる（同じホストの仕事が固まらないように）。"""
+    buckets = OrderedDict()
+    for url in urls:
+        buckets.setdefault(urlparse(url).netloc.lower(), []).append(url)
+    ordered = []
+    while any(buckets.values()):
+        for bucket in buckets.values():
+            if bucket:
+                ordered.append(bucket.pop(0))
+    return ordered
+
+
+def run_batch(urls, scrape, workers=DEFAULT_WORKERS, per_domain=DEFAULT_PER_DOMAIN,
+              output_dir=None, combined=None, save=None, sink=None, journal=None):
+    """
+    複数のチームURLを並列にスクレイピングする。
+
+    Args:
+        urls (list): チームページURLのリスト。
+        scrape (callable): url を受け取り選手レコードのリストを返す関数。
+        workers (int): 全体の同時実行数。
+        per_domain (int): 同一ドメインへの同時実行数。
+        output_dir (str): 指定するとチームごとのCSVをこのディレクトリに書く。
+        combined (str): 指定すると 'Team' 列を付けて1つのCSVにまとめて書く。
+        save (callable): save(data, filename) 形式のCSV書き出し関数（ehf.save_to_csv 互換）。
+        sink (sinks.Sink): 指定するとチームが終わるたびにレコードを渡す（JSON Lines / SQLite / Parquet）。
+        journal (journal.JobJournal): 終わったチームを記録する。記録済みのチームは取得せずに記録したレコードを使う。
+
+    Returns:
+        dict: {url: 選手レコードのリスト}（失敗したチームは空リスト）
+    """
+    if save is None:
+        from ehf import save_to_csv as save
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    limiter = HostLimiter(per_domain)
+    results = {}
+
+    def write(url, data):
+        if data and output_dir:
+            save(data, os.path.join(output_dir, team_filename(url)))
+        if data and sink is not None:
+            sink.write(data, url)
+
+    def run_one(url):
+        with limiter.get(url):
+            data = scrape(url)
+        if journal is not None:
+            journal.record_team(url, data)
+        write(url, data)
+        return data
+
+    ordered = interleave_by_domain(urls)
+    if journal is not None and journal.completed:
+        # 前回までに終わったチームは出力だけ作り直す
+        for url in ordered:
+            if url in journal.completed:
+                results[url] = journal.completed[url]
+                write(url, results[url])
+        ordered = [url for url in ordered if url not in results]
+        print(f"ジャーナルから {len(results)} チームを再開済みとして扱います（残り {len(ordered)} チーム）")
+    pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='team')
+    try:
+        futures = {pool.submit(run_one, url): url for url in ordered}
+        for fut in as_completed(futures):
+            url = futures[fut]
+            try:
+                results[url] = fut.result() or []
+            except Exception as e:
+                print(f"エラー: {url} の処理に失敗しました: {e}")
+                results[url] = []
+            print(f"[{len(results)}/{len(urls)}] {url}: {len(results[url])} players")
+    except BaseException:
+        # Ctrl-C など: 未着手のチームは始めない（処理中のチームは終わり次第ジャーナルに記録される）
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+
+    if combined:
+        write_combined(urls, results, combined, save)
+
+    return results
+
+
+def write_combined(urls, results, filename, save):
+    """全チームの結果を 'Team' 列付きで1つのCSVに書く（入力順）。"""
+    rows = []
+    for url in urls:
+        for record in results.get(url, []):
+            rows.append(dict(record, Team=team_name(url)))
+    save(rows, filename)
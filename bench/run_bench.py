@@ -0,0 +1,252 @@
+"""オフラインベンチマーク
+
+bench/stub_server.py を別プロセスで起動し、スクレイパーをチーム数ごとに計測する。
+各シナリオは新しいプロセス・空の作業ディレクトリ（キャッシュ・画像なし）で実行し、
+経過時間、1ロスターあたりのリクエスト数、転送バイト数、ピーク RSS を表にする。
+
+    python bench/run_bench.py --teams 1 50 --targets ehf ihf images
+    python bench/run_bench.py --teams 500 --latency 0.02 --error-rate 0.01 --warm --json bench.jsonl
+
+対象:
+    ehf     ehf.scrape_player_data（batch.run_batch で並列。--engine async なら async_engine.scrape_ehf）
+    ihf     ihf.scrape_player_data（同上。--engine async なら async_engine.scrape_ihf）
+    images  image_utils.download_and_process_image（1チームあたり --players 枚）
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TARGETS = ('ehf', 'ihf', 'images')
+
+
+def peak_rss_mb():
+    """(自プロセス, 子プロセス) のピーク RSS（MB）。resource が無い環境では (None, None)。"""
+    try:
+        import resource
+    except ImportError:
+        return None, None
+    # Linux は KB、macOS はバイト単位
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+
+def build_client(rate, max_attempts):
+    from http_client import HttpClient
+    from probe_cache import ProbeCache
+    from rate_limit import RequestScheduler
+    from response_cache import ResponseCache
+    from retry import RetryPolicy
+    return HttpClient(probe_cache=ProbeCache(), response_cache=ResponseCache(),
+                      scheduler=RequestScheduler(rate=rate), retry=RetryPolicy(max_attempts=max_attempts))
+
+
+def run_async_scenario(target, urls, options):
+    """async_engine でチームを処理し、選手数を返す。"""
+    import asyncio
+    import async_engine
+    from probe_cache import ProbeCache
+    from response_cache import ResponseCache
+    from retry import RetryPolicy
+
+    async def main():
+        client = async_engine.AsyncHttpClient(probe_cache=ProbeCache(), response_cache=ResponseCache(),
+                                              scheduler=async_engine.AsyncScheduler(rate=options['rate']),
+                                              retry=RetryPolicy(max_attempts=options['max_attempts']))
+        scraper = async_engine.scrape_ehf if target == 'ehf' else async_engine.scrape_ihf
+        async with client:
+            return await async_engine.scrape_many(urls, client, teams=options['workers'], scraper=scraper)
+
+    results = asyncio.run(main())
+    return sum(len(records) for records in results.values())
+
+
+def run_scenario(target, teams, base_url, options):
+    """子プロセス側: 1シナリオを実行して結果の dict を返す（カレントディレクトリは作業用の一時ディレクトリ）。"""
+    import functools
+    import batch
+    from image_jobs import ImageJob, run_image_jobs
+
+    client = build_client(options['rate'], options['max_attempts'])
+    start = time.perf_counter()
+    players = 0
+    if target in ('ehf', 'ihf') and options.get('engine') == 'async':
+        if target == 'ehf':
+            urls = [f'{base_url}/en/team/{i}/' for i in range(teams)]
+        else:
+            urls = [f'{base_url}/ihf/teams/{i}' for i in range(teams)]
+        players = run_async_scenario(target, urls, options)
+    elif target in ('ehf', 'ihf'):
+        if target == 'ehf':
+            import ehf
+            urls = [f'{base_url}/en/team/{i}/' for i in range(teams)]
+            scrape = functools.partial(ehf.scrape_player_data, client=client,
+                                       image_workers=options['image_workers'])
+        else:
+            import ihf
+            urls = [f'{base_url}/ihf/teams/{i}' for i in range(teams)]
+            scrape = functools.partial(ihf.scrape_player_data, client=client,
+                                       image_workers=options['image_workers'])
+        results = batch.run_batch(urls, scrape, workers=options['workers'],
+                                  per_domain=options['workers'], output_dir='rosters')
+        players = sum(len(records) for records in results.values())
+    else:
+        from image_utils import download_and_process_image
+        jobs = []
+        for i in range(teams):
+            for j in range(options['players']):
+                url = f'{base_url}/img/w180/bench-{i}-{j}.jpg'
+                record = {'選手名': f'Player {i}-{j}', 'Image': ''}
+                jobs.append(ImageJob(record, url, functools.partial(
+                    download_and_process_image, url, os.path.join('images', 'bench'),
+                    record['選手名'], f'{i}-{j}', client=client)))
+        run_image_jobs(jobs, max_workers=options['image_workers'])
+        players = sum(1 for job in jobs if job.record['Image'])
+    elapsed = time.perf_counter() - start
+    client.close()
+    if target == 'ihf':
+        # 変換プロセスを終了させて RUSAGE_CHILDREN に含める
+        from image_postprocess import get_default_transcoder
+        get_default_transcoder().shutdown()
+    from image_store import get_default_store
+    get_default_store().flush()
+    own, children = peak_rss_mb()
+    return {'elapsed': round(elapsed, 3), 'players': players, 'rss_mb': own, 'children_rss_mb': children}
+
+
+def stub_stats(base_url, reset=False):
+    path = '/__reset' if reset else '/__stats'
+    with urllib.request.urlopen(base_url + path, timeout=10) as resp:
+        body = resp.read()
+    return None if reset else json.loads(body)
+
+
+def run_child(target, teams, base_url, workdir, args):
+    """シナリオを新しいプロセスで実行し、スタブ側のカウンタと合わせた結果を返す。"""
+    options = {
+        'workers': args.workers,
+        'image_workers': args.image_workers,
+        'players': args.players,
+        'rate': args.rate,
+        'max_attempts': args.max_attempts,
+        'engine': args.engine,
+    }
+    stub_stats(base_url, reset=True)
+    cmd = [sys.executable, os.path.abspath(__file__), '--child', target, str(teams), base_url, json.dumps(options)]
+    proc = subprocess.run(cmd, cwd=workdir, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f'{target} x{teams} failed:\n{proc.stderr[-2000:]}')
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    stats = stub_stats(base_url)
+    result.update({
+        'target': target,
+        'teams': teams,
+        'requests': stats['requests'],
+        'bytes': stats['bytes'],
+        'errors': stats['errors'],
+        'kinds': stats['kinds'],
+        'requests_per_roster': round(stats['requests'] / teams, 1) if teams else 0,
+    })
+    return result
+
+
+def start_stub(args):
+    cmd = [sys.executable, os.path.join(HERE, 'stub_server.py'), '--players', str(args.players),
+           '--latency', str(args.latency), '--error-rate', str(args.error_rate), '--seed', str(args.seed)]
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, text=True)
+    base_url = proc.stdout.readline().strip()
+    if not base_url.startswith('http'):
+        proc.kill()
+        raise RuntimeError('stub server did not start')
+    return proc, base_url
+
+
+def print_table(results):
+    header = ('target', 'teams', 'run', 'time(s)', 'req', 'req/roster', 'MB', 'errors', 'RSS MB', 'child RSS')
+    rows = []
+    for r in results:
+        rows.append((r['target'], r['teams'], r['run'], f"{r['elapsed']:.2f}", r['requests'],
+                     r['requests_per_roster'], f"{r['bytes'] / 1e6:.1f}", r['errors'],
+                     r['rss_mb'] if r['rss_mb'] is not None else '-',
+                     r['children_rss_mb'] if r['children_rss_mb'] is not None else '-'))
+    widths = [max(len(str(v)) for v in col) for col in zip(header, *rows)]
+    for row in (header, *rows):
+        print('  '.join(str(v).rjust(w) for v, w in zip(row, widths)))
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        # 計測対象のプロセス: スクレイパーの出力は捨てて、結果の JSON だけを最後の行に出す
+        target, teams, base_url, options = sys.argv[2], int(sys.argv[3]), sys.argv[4], json.loads(sys.argv[5])
+        sys.path.insert(0, ROOT)
+        real_stdout = sys.stdout
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = devnull
+            try:
+                result = run_scenario(target, teams, base_url, options)
+            finally:
+                sys.stdout = real_stdout
+        print(json.dumps(result))
+        return 0
+
+    parser = argparse.ArgumentParser(description='Offline benchmark for the EHF/IHF scrapers')
+    parser.add_argument('--teams', type=int, nargs='+', default=[1, 50], help='Team counts to run (e.g. 1 50 500)')
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=list(TARGETS), help='What to measure')
+    parser.add_argument('--players', type=int, default=16, help='Players per team')
+    parser.add_argument('--latency', type=float, default=0.0, help='Stub server delay per response (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of stub responses that are 503')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for error injection')
+    parser.add_argument('--workers', type=int, default=8, help='Teams scraped in parallel')
+    parser.add_argument('--image-workers', type=int, default=8, help='Image threads per team')
+    parser.add_argument('--rate', type=float, default=0, help='Per-host request rate limit (0 = unlimited)')
+    parser.add_argument('--max-attempts', type=int, default=3, help='Attempts per request')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync',
+                        help='Scraper engine for the ehf/ihf targets (async needs aiohttp)')
+    parser.add_argument('--warm', action='store_true', help='Run every scenario a second time with the caches from the first run')
+    parser.add_argument('--json', metavar='FILE', help='Append results as JSON lines to FILE')
+    parser.add_argument('--keep', action='store_true', help='Keep the per-scenario working directories')
+    args = parser.parse_args()
+
+    stub, base_url = start_stub(args)
+    results = []
+    try:
+        for target in args.targets:
+            for teams in args.teams:
+                workdir = tempfile.mkdtemp(prefix=f'bench-{target}-{teams}-')
+                runs = ('cold', 'warm') if args.warm else ('cold',)
+                for run in runs:
+                    result = run_child(target, teams, base_url, workdir, args)
+                    result['run'] = run
+                    results.append(result)
+                    print(f"{target} x{teams} ({run}): {result['elapsed']:.2f}s, {result['requests']} requests",
+                          flush=True)
+                if args.keep:
+                    print(f'  kept {workdir}')
+                else:
+                    import shutil
+                    shutil.rmtree(workdir, ignore_errors=True)
+    finally:
+        stub.terminate()
+        stub.wait()
+
+    print()
+    print_table(results)
+    if args.json:
+        with open(args.json, 'a', encoding='utf-8') as f:
+            for r in results:
+                f.write(json.dumps(dict(r, latency=args.latency, error_rate=args.error_rate,
+                                        players_per_team=args.players, engine=args.engine)) + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,295 @@
+"""ベンチマーク用のローカル EHF/IHF スタブサーバー
+
+実サイトにアクセスせずにスクレイパーを計測するための HTTP サーバー。
+
+- /en/team/<n>/                              EHF のチームページ（debug.html の club details コンテナを差し替えたもの）
+- /umbraco/api/clubdetailsapi/GetPlayers     選手一覧 JSON（clubId=team-<n>）
+- /img/<token>/<name>.jpg                    サイズ別の画像（token は w180 〜 w2048 / original。max-width を超えると 404）
+- /en/player/<id>/                           EHF の選手ページ（schema.org の Person を JSON-LD で埋め込む）
+- /ihf/teams/<n>                             IHF のチームページ（選手リンクと画像）
+- /players/<id>                              IHF の選手ページ（<dl> の詳細項目）
+- /__stats                                   リクエスト数・送信バイト数（種類別）の JSON
+- /__reset                                   カウンタを 0 に戻す
+
+--latency で全応答に遅延を、--error-rate で一定割合の 503 を混ぜられる。
+
+    python bench/stub_server.py --port 8765 --latency 0.02 --error-rate 0.01
+"""
+import argparse
+import io
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_PATH = os.path.join(ROOT, 'debug.html')
+
+DEFAULT_PLAYERS = 16
+DEFAULT_MAX_WIDTH = 1024
+PHOTO_TOKENS = ('w180', 'w360', 'w512', 'w1024')
+POSITIONS = ('Goalkeeper', 'Left Wing', 'Left Back', 'Centre Back', 'Pivot', 'Right Back', 'Right Wing')
+
+_CONTAINER_RE = re.compile(rb'<div id="vue-container-clubDetails".*?>', re.S)
+_FALLBACK_PAGE = (b'<html><head><title>Team</title></head><body>'
+                  + b'<p>' + b'padding ' * 20000 + b'</p>%CONTAINER%'
+                  + b'<div v-cloak></div></body></html>')
+
+
+def load_template():
+    """debug.html を読み、club details コンテナの開始タグを差し替え用のプレースホルダーにする。"""
+    try:
+        with open(TEMPLATE_PATH, 'rb') as f:
+            page = f.read()
+    except OSError:
+        return _FALLBACK_PAGE
+    page, count = _CONTAINER_RE.subn(b'%CONTAINER%', page, count=1)
+    return page if count else _FALLBACK_PAGE
+
+
+class StubState:
+    """
+    Args:
+        players (int): 1チームあたりの選手数。
+        max_width (int): 提供する画像の最大幅（これを超えるサイズトークンは 404）。
+        latency (float): 全応答に入れる遅延（秒）。
+        error_rate (float): 503 を返す割合（0〜1）。
+        seed (int): エラー注入の乱数シード。
+    """
+
+    def __init__(self, players=DEFAULT_PLAYERS, max_width=DEFAULT_MAX_WIDTH, latency=0.0, error_rate=0.0, seed=0):
+        self.players = players
+        self.max_width = max_width
+        self.latency = latency
+        self.error_rate = error_rate
+        self.template = load_template()
+        self._random = random.Random(seed)
+        self._images = {}
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {'requests': 0, 'bytes': 0, 'errors': 0, 'kinds': {}}
+
+    def count(self, kind, nbytes, error=False):
+        with self._lock:
+            self.stats['requests'] += 1
+            self.stats['bytes'] += nbytes
+            self.stats['errors'] += int(error)
+            self.stats['kinds'][kind] = self.stats['kinds'].get(kind, 0) + 1
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.error_rate
+
+    def image(self, width):
+        """width x width の JPEG（幅ごとに1度だけ生成）。"""
+        with self._lock:
+            data = self._images.get(width)
+        if data is None:
+            from PIL import Image
+            buf = io.BytesIO()
+            Image.new('RGB', (width, width), (30, 90, 160)).save(buf, 'JPEG', quality=85)
+            data = buf.getvalue()
+            with self._lock:
+                self._images[width] = data
+        return data
+
+    def team_page(self, team):
+        container = (f'<div id="vue-container-clubDetails" data-js-requires="vueRouter,clubDetails"\n'
+                     f'           data-club-details-url="/umbraco/api/clubdetailsapi/GetPlayers"\n'
+                     f'           data-competition-id="bench"\n'
+                     f'           data-club-id="team-{team}"\n'
+                     f'           data-round-id="round-1">').encode()
+        return self.template.replace(b'%CONTAINER%', container)
+
+    def players_json(self, team):
+        items = []
+        for j in range(self.players):
+            pid = f'{team}-{j}'
+            items.append({
+                'id': pid,
+                'shirtNumber': j + 1,
+                'playingPosition': POSITIONS[j % len(POSITIONS)],
+                'person': {'id': pid, 'firstName': 'Player', 'lastName': f'T{team}N{j}', 'age': 20 + j % 15,
+                           'nationality': {'name': 'Benchland'}},
+                'newPhoto': {token: f'/img/{token}/ehf-{pid}.jpg' for token in PHOTO_TOKENS},
+                'url': f'/en/player/{pid}/',
+            })
+        keepers, field = items[:2], items[2:]
+        return json.dumps({'players': field, 'goalKeepers': keepers, 'playersLeft': []}).encode()
+
+    def ehf_player_page(self, pid):
+        person = {'@context': 'https://schema.org', '@type': 'Person', 'name': f'Player {pid}',
+                  'nationality': {'@type': 'Country', 'name': 'Benchland'},
+                  'memberOf': {'@type': 'SportsTeam', 'name': 'Bench HC'},
+                  'height': f'{180 + len(pid) % 20} cm', 'birthDate': '1998-04-12'}
+        return ('<html><head><script type="application/ld+json">' + json.dumps(person)
+                + '</script></head><body><h1>Player</h1></body></html>').encode()
+
+    def ihf_player_page(self, pid):
+        return (f'<html><body><h1>Player {pid}</h1><dl>'
+                f'<dt>Country</dt><dd>Benchland</dd><dt>Club</dt><dd>Bench HC</dd>'
+                f'<dt>Height</dt><dd>{180 + len(pid) % 20} cm</dd><dt>Date of birth</dt><dd>12.04.1998</dd>'
+                f'</dl></body></html>').encode()
+
+    def ihf_page(self, team):
+        cards = []
+        for j in range(self.players):
+            pid = f'{team}{j:03d}'
+            cards.append(f'<div class="player-card"><img src="/img/w180/ihf-{pid}.jpg" alt="">'
+                         f'<a href="/players/{pid}">Player T{team}N{j} Club: Bench HC Country - '
+                         f'{POSITIONS[j % len(POSITIONS)]}</a></div>')
+        return ('<html><body><h1>Team</h1>' + ''.join(cards) + '</body></html>').encode()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    state = None  # serve() で設定する
+
+    def log_message(self, *args):
+        pass
+
+    def do_HEAD(self):
+        self.handle_request(head=True)
+
+    def do_GET(self):
+        self.handle_request(head=False)
+
+    def send(self, status, body=b'', content_type='text/plain', kind='other', head=False):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        # 途中で切断されても数えるように、書き込む前に記録する
+        self.state.count(kind, 0 if head else len(body), error=status == 503)
+        if not head:
+            self.wfile.write(body)
+
+    def handle_request(self, head):
+        state = self.state
+        parsed = urlparse(self.path)
+        path = parsed.path
+
+        if path == '/__stats':
+            with state._lock:
+                body = json.dumps(state.stats).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+        if path == '/__reset':
+            state.reset()
+            self.send_response(204)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if state.latency:
+            time.sleep(state.latency)
+        if state.should_fail():
+            self.send(503, b'unavailable', kind='error', head=head)
+            return
+
+        m = re.match(r'^/en/team/([^/]+)/?$', path)
+        if m:
+            self.send(200, state.team_page(m.group(1)), 'text/html; charset=utf-8', 'page', head)
+            return
+        if path == '/umbraco/api/clubdetailsapi/GetPlayers':
+            club = parse_qs(parsed.query).get('clubId', [''])[0]
+            team = club[len('team-'):] if club.startswith('team-') else club
+            self.send(200, state.players_json(team), 'application/json', 'api', head)
+            return
+        m = re.match(r'^/img/(original|w(\d+))/[^/]+\.jpg$', path)
+        if m:
+            width = state.max_width * 2 if m.group(1) == 'original' else int(m.group(2))
+            if width > state.max_width:
+                self.send(404, kind='image', head=head)
+                return
+            body = state.image(width)
+            if not head and self.headers.get('Range'):
+                # 先頭だけの要求は 206 で返す
+                rm = re.match(r'bytes=0-(\d+)', self.headers['Range'])
+                if rm:
+                    part = body[:int(rm.group(1)) + 1]
+                    self.send_response(206)
+                    self.send_header('Content-Type', 'image/jpeg')
+                    self.send_header('Content-Range', f'bytes 0-{len(part) - 1}/{len(body)}')
+                    self.send_header('Content-Length', str(len(part)))
+                    self.end_headers()
+                    state.count('image', len(part))
+                    self.wfile.write(part)
+                    return
+            self.send(200, body, 'image/jpeg', 'image', head)
+            return
+        m = re.match(r'^/ihf/teams/([^/]+)/?$', path)
+        if m:
+            self.send(200, state.ihf_page(m.group(1)), 'text/html; charset=utf-8', 'page', head)
+            return
+        m = re.match(r'^/en/player/([^/]+)/?$', path)
+        if m:
+            self.send(200, state.ehf_player_page(m.group(1)), 'text/html; charset=utf-8', 'detail', head)
+            return
+        m = re.match(r'^/players/([^/]+)/?$', path)
+        if m:
+            self.send(200, state.ihf_player_page(m.group(1)), 'text/html; charset=utf-8', 'detail', head)
+            return
+        self.send(404, kind='other', head=head)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # 既定の 5 では同時接続の多いクライアント（async_engine）の SYN が溢れて 1 秒の再送待ちになる
+    request_queue_size = 256
+
+    def handle_error(self, request, client_address):
+        # ストリームを途中で閉じるクライアント（ページの先頭だけ読む、画像ヘッダーだけ読むなど）は正常な動作
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def serve(port=0, **options):
+    """スタブサーバーをバックグラウンドスレッドで起動し、サーバーを返す（server.server_address で番号が分かる）。"""
+    handler = type('Handler', (StubHandler,), {'state': StubState(**options)})
+    server = StubServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, name='stub-server', daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local EHF/IHF stub server for benchmarks')
+    parser.add_argument('--port', type=int, default=0, help='Port to listen on (0 = pick a free port)')
+    parser.add_argument('--players', type=int, default=DEFAULT_PLAYERS, help='Players per team')
+    parser.add_argument('--max-width', type=int, default=DEFAULT_MAX_WIDTH, help='Largest image width served')
+    parser.add_argument('--latency', type=float, default=0.0, help='Delay added to every response (seconds)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for error injection')
+    args = parser.parse_args()
+
+    server = serve(args.port, players=args.players, max_width=args.max_width,
+                   latency=args.latency, error_rate=args.error_rate, seed=args.seed)
+    # 起動側（run_bench.py）が読むので、最初の行はベースURLだけにする
+    print(f'http://127.0.0.1:{server.server_address[1]}', flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,293 @@
+"""大会単位のクローラー（永続化する URL フロンティアと選手の重複排除）
+
+大会ページ（EHF / IHF）からチームページを見つけ、フロンティアに登録してから
+scrap.scrape_url（各スクレイパーの scrape_player_data）で順に取得する。
+フロンティアは実行をまたいで残るので、
+
+- 複数の大会に同じチームが出ていても（URL を正規化して）1回だけ取得する
+- 前回 --max-age 時間以内に取得したチームは取り直さない（失敗したチームは取り直す）
+- 選手ページへのリンク（EHF は API の選手ID）をチームをまたいで覚えておき、
+  他のチームで画像を取得済みの選手は画像を取り直さない
+
+フロンティアは JSON Lines の追記ログ（journal.py と同じ形式）で、終了時に現在の状態だけに詰め直す。
+
+    {"event": "team", "ts": ..., "url": "...", "source": "<大会ページ>"}
+    {"event": "done", "ts": ..., "url": "...", "players": 16}
+    {"event": "failed", "ts": ..., "url": "...", "error": "..."}
+    {"event": "player", "ts": ..., "key": "ihf:123", "team": "...", "image": "images/ihf/..."}
+
+    python crawler.py "https://www.eurohandball.com/..." "https://www.ihf.info/..." --format sqlite -o players.db
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from urllib.parse import urlparse, urlunparse
+
+from journal import open_log, read_log
+from roster_sync import image_present
+
+DEFAULT_PATH = os.path.join('.cache', 'crawl', 'frontier.jsonl')
+DEFAULT_MAX_AGE = 24.0  # 時間
+
+
+def normalize_url(url):
+    """重複判定用に URL を正規化する（スキーム・ホストの小文字化、既定ポートとフラグメントの除去、末尾の / を付ける）。"""
+    parsed = urlparse(url.strip())
+    scheme = parsed.scheme.lower() or 'https'
+    netloc = parsed.netloc.lower()
+    if (scheme, netloc.rsplit(':', 1)[-1]) in (('http', '80'), ('https', '443')):
+        netloc = netloc.rsplit(':', 1)[0]
+    path = parsed.path or '/'
+    if not path.endswith('/'):
+        path += '/'
+    return urlunparse((scheme, netloc, path, parsed.params, parsed.query, ''))
+
+
+class Frontier:
+    """
+    チームURLのフロンティアと、チームをまたいだ選手の索引（スレッドから同時に使ってよい）。
+
+    Args:
+        path (str): 状態を追記する JSON Lines ファイル。
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        self.path = path
+        self.teams = {}    # 正規化したURL -> {'url', 'source', 'done', 'players', 'failed'}
+        self.players = {}  # 選手キー -> {'team', 'image'}
+        self._records = {}  # 選手キー -> 今回の実行でそのチームから登録したレコード（画像は後から入る）
+        self._team_players = {}  # 正規化したチームURL -> 今回登録した選手キー
+        self._lock = threading.Lock()
+        for entry in read_log(path):
+            self._apply(entry)
+        self._file = open_log(path)
+
+    def _apply(self, entry):
+        event = entry.get('event')
+        if event == 'team':
+            self.teams.setdefault(normalize_url(entry['url']), {
+                'url': entry['url'], 'source': entry.get('source', ''), 'done': None, 'players': 0, 'failed': None})
+        elif event in ('done', 'failed'):
+            team = self.teams.get(normalize_url(entry['url']))
+            if team is None:
+                return
+            if event == 'done':
+                team.update(done=entry['ts'], players=entry.get('players', 0), failed=None)
+            else:
+                team['failed'] = entry.get('error') or 'failed'
+        elif event == 'player':
+            self.players[entry['key']] = {'team': entry.get('team', ''), 'image': entry.get('image', '')}
+
+    def _append_locked(self, entry):
+        entry = dict(entry, ts=entry.get('ts') or round(time.time(), 3))
+        self._apply(entry)
+        self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+        # プロセスが落ちても書いた行は残るように、1件ごとに OS へ渡す
+        self._file.flush()
+
+    def add_team(self, url, source=''):
+        """チームURLを登録する。新しいURLなら True。"""
+        with self._lock:
+            if normalize_url(url) in self.teams:
+                return False
+            self._append_locked({'event': 'team', 'url': url, 'source': source})
+            return True
+
+    def due(self, urls, max_age=DEFAULT_MAX_AGE):
+        """urls のうち取得が必要なもの（未取得・失敗・max_age 時間より前に取得したもの）を返す。"""
+        threshold = time.time() - max_age * 3600
+        with self._lock:
+            due = []
+            for url in urls:
+                team = self.teams.get(normalize_url(url))
+                if team is None or team['done'] is None or team['failed'] or team['done'] < threshold:
+                    due.append(url)
+            return due
+
+    def mark_done(self, url, records):
+        """チームの取得が終わったことと、その選手の画像を記録する。"""
+        with self._lock:
+            for key in self._team_players.pop(normalize_url(url), ()):
+                image = self._records[key].get('Image') or ''
+                if image and self.players[key]['image'] != image:
+                    self._append_locked({'event': 'player', 'key': key, 'team': url, 'image': image})
+            self._append_locked({'event': 'done', 'url': url, 'players': len(records)})
+
+    def mark_failed(self, url, error=''):
+        with self._lock:
+            self._append_locked({'event': 'failed', 'url': url, 'error': error})
+
+    def claim_player(self, key, team_url, record):
+        """
+        選手を登録する（スクレイパーが画像ジョブを作る前に呼ぶ）。
+
+        他のチームで（今回または以前の実行で）画像を取得済みの選手なら、その画像のパスを
+        record['Image'] に入れて True を返す（呼び出し側は画像を取得しない）。
+        初めて見た選手、同じチームの取り直し（写真が変わっているかもしれない）、
+        他のチームでの画像の取得がまだ終わっていない・画像が消えている選手は False。
+        """
+        team = normalize_url(team_url)
+        with self._lock:
+            known = self.players.get(key)
+            if known is None or normalize_url(known['team']) == team:
+                # このチームで取得する画像を mark_done で記録する
+                self.players[key] = {'team': team_url, 'image': known['image'] if known else ''}
+                self._records[key] = record
+                self._team_players.setdefault(team, set()).add(key)
+                return False
+            first = self._records.get(key)
+            image = (first.get('Image') if first is not None else '') or known['image']
+            if image and image_present({'Image': image}):
+                record['Image'] = image
+                return True
+            return False
+
+    def stats(self):
+        with self._lock:
+            done = sum(1 for team in self.teams.values() if team['done'] is not None and not team['failed'])
+            return {'teams': len(self.teams), 'done': done, 'players': len(self.players)}
+
+    def close(self):
+        """状態だけを書いたファイルに詰め直して閉じる（追記ログが伸び続けないように）。"""
+        with self._lock:
+            if self._file is None:
+                return
+            self._file.close()
+            self._file = None
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w', encoding='utf-8') as f:
+                for team in self.teams.values():
+                    f.write(json.dumps({'event': 'team', 'ts': 0, 'url': team['url'], 'source': team['source']},
+                                       ensure_ascii=False) + '\n')
+                    if team['done'] is not None:
+                        f.write(json.dumps({'event': 'done', 'ts': team['done'], 'url': team['url'],
+                                            'players': team['players']}, ensure_ascii=False) + '\n')
+                    if team['failed']:
+                        f.write(json.dumps({'event': 'failed', 'ts': 0, 'url': team['url'], 'error': team['failed']},
+                                           ensure_ascii=False) + '\n')
+                for key, player in self.players.items():
+                    if player['image']:
+                        f.write(json.dumps({'event': 'player', 'ts': 0, 'key': key, **player},
+                                           ensure_ascii=False) + '\n')
+            os.replace(tmp, self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def discover(competitions, client, frontier):
+    """大会ページからチームURLを集めてフロンティアに登録し、大会をまたいで重複を除いた一覧を返す。"""
+    from batch import discover_team_urls
+    found = {}
+    for competition in competitions:
+        try:
+            urls = discover_team_urls(competition, client)
+        except Exception as e:
+            print(f"エラー: 大会ページ {competition} を読めませんでした: {e}")
+            continue
+        new = sum(frontier.add_team(url, competition) for url in urls)
+        print(f"{competition}: {len(urls)} チーム（新規 {new}）")
+        for url in urls:
+            found.setdefault(normalize_url(url), url)
+    return list(found.values())
+
+
+def crawl(competitions, client, frontier, max_age=DEFAULT_MAX_AGE, scrape_opts=None, **batch_opts):
+    """
+    大会ページのチームを見つけ、取得が必要なチームだけを batch.run_batch で取得する。
+
+    Args:
+        max_age (float): これより前（時間）に取得したチームは取り直す。0 なら全チームを取り直す。
+        scrape_opts (dict): scrap.scrape_url に渡すオプション（image_workers など）。
+        batch_opts: batch.run_batch に渡すオプション（workers / output_dir / sink など）。
+
+    Returns:
+        dict: {url: 選手レコードのリスト}（今回取得したチームのみ）
+    """
+    from batch import run_batch
+    from scrap import scrape_url
+
+    urls = frontier.due(discover(competitions, client, frontier), max_age)
+    if not urls:
+        print('取得が必要なチームはありません（--max-age 以内に取得済み）。')
+        return {}
+    print(f"{len(urls)} チームを取得します")
+
+    def scrape(url):
+        try:
+            data, _ = scrape_url(url, client, players=frontier, **(scrape_opts or {}))
+        except Exception as e:
+            frontier.mark_failed(url, str(e))
+            raise
+        if data:
+            frontier.mark_done(url, data)
+        else:
+            frontier.mark_failed(url, 'no players')
+        return data or []
+
+    return run_batch(urls, scrape, **batch_opts)
+
+
+def main():
+    from scrap import (add_client_arguments, build_client, build_enricher, build_image_opts, open_output_sink,
+                       report_metrics)
+    parser = argparse.ArgumentParser(description='Crawl EHF/IHF competition pages and scrape every team once')
+    parser.add_argument('competitions', nargs='+', metavar='URL', help='Competition page URL(s)')
+    parser.add_argument('--frontier', default=None, metavar='FILE',
+                        help='Frontier state file (default: <cache-dir>/crawl/frontier.jsonl)')
+    parser.add_argument('--max-age', type=float, default=DEFAULT_MAX_AGE,
+                        help='Rescrape teams last scraped more than this many hours ago (0 = rescrape all)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Output file for --format jsonl/sqlite/parquet (default: rosters/rosters.<ext>)')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'sqlite', 'parquet'], default='csv',
+                        help='csv: one CSV per team in --output-dir; others: one file for all teams')
+    parser.add_argument('--sink-batch', type=int, default=500, help='Records buffered before each jsonl/sqlite/parquet write')
+    parser.add_argument('--output-dir', default='rosters', help='Directory for the per-team CSVs')
+    parser.add_argument('--combined', metavar='FILE', help='Also write the teams scraped in this run into one CSV')
+    parser.add_argument('--workers', type=int, default=8, help='Teams scraped in parallel')
+    parser.add_argument('--per-domain', type=int, default=2, help='Max teams scraped in parallel per domain')
+    add_client_arguments(parser)
+    parser.add_argument('--no-summary', action='store_true', help='Do not print the request/timing summary at the end')
+    parser.add_argument('--metrics-prom', metavar='FILE', help='Write request/timing metrics in Prometheus text format to FILE')
+    args = parser.parse_args()
+
+    if args.parser:
+        import html_parsing
+        html_parsing.set_parser(args.parser)
+
+    client = build_client(args)
+    frontier = Frontier(args.frontier or os.path.join(args.cache_dir, 'crawl', 'frontier.jsonl'))
+    batch_opts = {'workers': args.workers, 'per_domain': args.per_domain, 'combined': args.combined}
+    scrape_opts = build_image_opts(args)
+    enricher = build_enricher(args, client)
+    if enricher is not None:
+        scrape_opts['details'] = enricher
+    sink = None
+    try:
+        if args.format == 'csv':
+            batch_opts['output_dir'] = args.output_dir
+        else:
+            sink = open_output_sink(args, args.output or os.path.join(args.output_dir, 'rosters.csv'))
+            batch_opts['sink'] = sink
+        crawl(args.competitions, client, frontier, max_age=args.max_age, scrape_opts=scrape_opts,
+              **batch_opts)
+    finally:
+        if sink is not None:
+            sink.close()
+        if enricher is not None:
+            enricher.close()
+        frontier.close()
+        stats = frontier.stats()
+        print(f"フロンティア: {stats['teams']} チーム（取得済み {stats['done']}）、選手 {stats['players']} 人"
+              f" ({frontier.path})")
+        client.close()
+        report_metrics(args, client.metrics)
+
+
+if __name__ == '__main__':
+    main()
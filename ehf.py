@@ -1,6 +1,6 @@
+# bs4 は API が使えないときのテーブル走査（html_parsing.make_soup）で初めて読み込む
 try:
     import requests
-    from bs4 import BeautifulSoup
 except ImportError as e:
     # 分かりやすいメッセージを出して早期終了
     print(f"Missing dependency: {e}.\nPlease install required packages: pip install -r requirements.txt")
@@ -12,191 +12,388 @@ import argparse
 import os
 import sys
 import re
-import mimetypes
+import functools
+import itertools
+import time
+import html
+
+from http_client import HttpClient, get_default_client
+from image_jobs import ImageJob, iter_records, DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST
+from probe_cache import ProbeCache
+from rate_limit import RequestScheduler, THROTTLE_STATUSES
+from response_cache import ResponseCache
+from html_parsing import make_soup, TABLE_ROW_STRAINER
+from image_store import get_default_store
+from roster_sync import RosterState, change_log_path, digest_bytes, item_digest, image_present
+
+CHUNK_SIZE = 16 * 1024
+
+# 出力する列（ジェネレータからストリームで書き出すときのスキーマ）。IHF のレコードも同じ列を使う
+FIELDNAMES = ('背番号', '選手名', 'Position', 'Age', 'Image', 'ID')
+# ジェネレータを CSV に書くとき、これだけの行数か秒数ごとにディスクへ書き出す（残りはファイルを閉じるとき）
+CSV_FLUSH_ROWS = 50
+CSV_FLUSH_SECONDS = 1.0
+
+# data-club-details-url を持つ開始タグ（属性が複数行にまたがっていてもよい）
+_CLUB_TAG_RE = re.compile(rb'<[A-Za-z][^<>]*?\sdata-club-details-url\s*=[^<>]*>')
+_ATTR_RE = re.compile(rb'([A-Za-z_:][-\w:.]*)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+# タグ途中でチャンクが切れた場合に備えて、前回の末尾からこのバイト数だけ戻って探す
+_TAG_OVERLAP = 4096
+
+def extract_club_details(chunks):
+    """
+    HTML をチャンク単位で読み、club details コンテナの開始タグが見つかった時点で止める。
+
+    Args:
+        chunks (iterable): bytes のチャンク列（response.iter_content など）。
+
+    Returns:
+        tuple: (属性の dict または None, それまでに読んだ bytes)
+               見つからなかった場合は全チャンクを読み切る。
+    """
+    buf = bytearray()
+    for chunk in chunks:
+        start = max(0, len(buf) - _TAG_OVERLAP)
+        buf.extend(chunk)
+        attrs = scan_club_details(buf, start)
+        if attrs is not None:
+            return attrs, bytes(buf)
+    return None, bytes(buf)
+
+def scan_club_details(buf, start=0):
+    """buf の start 以降から club details コンテナの開始タグを探し、属性の dict を返す（無ければ None）。"""
+    m = _CLUB_TAG_RE.search(buf, start)
+    if not m:
+        return None
+    attrs = {}
+    for am in _ATTR_RE.finditer(m.group(0)):
+        value = am.group(2) if am.group(2) is not None else am.group(3)
+        attrs[am.group(1).decode('ascii').lower()] = html.unescape(value.decode('utf-8', 'replace'))
+    return attrs
+
+def club_details_request(url, club_attrs):
+    """コンテナの属性から clubdetails API の (URL, クエリ) を作る。必要な属性が無ければ None。"""
+    api_path = club_attrs.get('data-club-details-url')
+    club_id = club_attrs.get('data-club-id')
+    if not (api_path and club_id):
+        return None
+    # 絶対URLを作る（元のページのスキームとホストを再利用）
+    parsed = urlparse(url)
+    api_url = f"{parsed.scheme}://{parsed.netloc}{api_path}"
+    params = {'clubId': club_id}
+    for attr, param in (('data-competition-id', 'competitionId'), ('data-round-id', 'roundId')):
+        if club_attrs.get(attr):
+            params[param] = club_attrs[attr]
+    return api_url, params
+
+# API の応答で選手が分かれているセクション
+PLAYER_SECTIONS = ('players', 'goalKeepers', 'playersLeft')
+
+def player_record(item):
+    """API の選手要素から CSV の1行分のレコードを作る（画像は空のまま）。"""
+    person = item.get('person', {})
+    first = person.get('firstName') or ''
+    last = person.get('lastName') or ''
+    name = (first + ' ' + last).strip() if (first or last) else item.get('url', '')
+    return {
+        '背番号': item.get('shirtNumber') or '',
+        '選手名': name,
+        'Position': item.get('playingPosition') or '',
+        'Age': person.get('age') or '',
+        'Image': '',
+        # 出力先（sinks）で同名の選手を区別するための安定したID
+        'ID': str(player_id(item)),
+    }
+
+def player_id(item):
+    return item.get('id') or item.get('person', {}).get('id') or ''
+
+def detail_request(item, page_url):
+    """選手ページのURL（無ければ ''）と、ロスターの応答から分かる詳細項目（enrich.py 参照）。"""
+    person = item.get('person', {})
+    known = {
+        'Nationality': person.get('nationality') or item.get('nationality'),
+        'Club': item.get('club'),
+        'Height': person.get('height'),
+        'Birthdate': person.get('birthDate') or person.get('dateOfBirth'),
+    }
+    link = item.get('url') or ''
+    return (urljoin(page_url, link) if '/' in link else ''), known
+
+def probe_url(u, client):
+    """
+    画像URLが取得可能かを HEAD（失敗時は GET のストリーム）で確認する。
 
-def scrape_player_data(url):
+    通信エラーやレート制限（429/503）で判定できなかった場合は (None, None) を返す（キャッシュしないため）。
+    """
+    try:
+        head = client.head(u, allow_redirects=True, timeout=5)
+        if head.status_code == 200 and head.headers.get('Content-Length'):
+            return True, head
+        if head.status_code in THROTTLE_STATUSES:
+            return None, None
+        # some servers don't respond to HEAD properly; try GET with small read
+        getr = client.get(u, stream=True, timeout=7, phase='probe')
+        # close the stream
+        getr.close()
+        if getr.status_code == 200:
+            return True, getr
+        if getr.status_code in THROTTLE_STATUSES:
+            return None, None
+    except Exception:
+        return None, None
+    return False, None
+
+# 高解像度を優先するキー順
+SIZE_PRIORITY = ('original', 'w2048', 'w1536', 'w1280', 'w1024', 'w512', 'w360', 'w180')
+
+def select_photo_url(item):
+    """API の選手要素から、最も高解像度と思われる画像URLを選ぶ（無ければ空文字列）。"""
+    img_url = ''
+    new_photo = item.get('newPhoto') or {}
+    if isinstance(new_photo, dict):
+        for key in SIZE_PRIORITY:
+            if new_photo.get(key):
+                img_url = new_photo.get(key)
+                break
+
+    if not img_url:
+        photos = item.get('photos') or item.get('photo') or []
+        if isinstance(photos, dict):
+            for key in SIZE_PRIORITY:
+                if photos.get(key):
+                    img_url = photos.get(key)
+                    break
+        elif isinstance(photos, list) and photos:
+            first_photo = photos[0]
+            if isinstance(first_photo, dict):
+                for key in SIZE_PRIORITY:
+                    if first_photo.get(key):
+                        img_url = first_photo.get(key)
+                        break
+            else:
+                # maybe it's a url string
+                img_url = first_photo
+    return img_url
+
+def iter_api_items(json_data):
+    """clubdetails API の応答の選手（players, goalKeepers, playersLeft に分かれているのでまとめる）。"""
+    for section in PLAYER_SECTIONS:
+        yield from json_data.get(section, [])
+
+def photo_url(item, api_url):
+    """選手の写真の絶対URL（無ければ None）。"""
+    img_url = select_photo_url(item)
+    return urljoin(api_url, img_url) if img_url else None
+
+def photo_candidates(img_url):
+    """試す高解像度バリアント [(トークン, URL), ...]（優先度の高い順）。"""
+    # URL に wXXX のようなトークンが含まれるなら大きいサイズへ置換して試す（例: w180 -> w2048）
+    if re.search(r'w(\d+)', img_url):
+        return [(sz, re.sub(r'w\d+', sz, img_url))
+                for sz in ('w2048', 'w1536', 'w1280', 'w1024', 'w512', 'w360', 'w180')]
+    # トークンが無い場合は、原寸や大きめサイズを示すパラメータを追加して試す（サーバ依存）
+    return [(q, img_url + q) for q in ('?original=true', '?size=2048', '')]
+
+def fetch_player_image(img_url, images_dir, pid, name, client, store=None):
+    """
+    画像URLの高解像度バリアントを探してダウンロードし、ローカルパスを返します。
+
+    画像の実体は内容アドレス方式のストア（省略時は images/store）に置き、
+    images_dir には選手ごとのリンクを作ります。
+
+    Returns:
+        str: 保存先パス。失敗した場合は空文字列。
+    """
+    from image_utils import iter_image_fetch, run_image_fetch
+    store = store or get_default_store()
+    # 既知の結果はプローブキャッシュから引く
+    steps = iter_image_fetch(img_url, images_dir, pid, name, store, variants=(photo_candidates,),
+                             probe_cache=client.probe_cache)
+    try:
+        return run_image_fetch(steps, client, lambda u: probe_url(u, client)[0])
+    except Exception:
+        return ''
+
+def scrape_player_data(url, client=None, image_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST,
+                       state=None, images=True, players=None, details=None):
     """
     指定されたURLから選手名と背番号をスクレイピングし、リストを返します。
     
     Args:
         url (str): スクレイピング対象のウェブサイトURL。
+        client (HttpClient): 共有HTTPクライアント。省略時はプロセス共有のものを使う。
+        image_workers (int): 画像取得を並列実行するスレッド数。
+        per_host (int): 同一ホストへの画像リクエストの同時実行上限。
+        state (RosterState): 差分同期の状態。渡すと前回から変化の無い選手は前回のレコードを再利用し、
+              追加・変更された選手の画像だけを取得する（roster_sync.py 参照）。
+        images (bool): False なら画像を取得しない（'Image' は空欄）。
+        players (crawler.Frontier): 複数チームをまたいだ選手の重複排除。他のチームで画像を取得済みの選手は
+              その画像を使い、取り直さない（crawler.py 参照）。
+        details (enrich.Enricher): 渡すと選手ページから国籍・クラブ・身長・生年月日を取得して列に加える。
         
     Returns:
         list: [{'背番号': '...', '選手名': '...'}, ...] の形式の辞書リスト。
               スクレイピングに失敗した場合は空のリストを返します。
     """
-    player_data = []
+    return list(iter_player_data(url, client, image_workers, per_host, state, ordered=True, images=images,
+                                 players=players, details=details))
+
+def iter_player_data(url, client=None, image_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST,
+                     state=None, ordered=False, images=True, players=None, details=None):
+    """
+    scrape_player_data のジェネレータ版。選手レコード（列は FIELDNAMES）を画像の取得が終わったものから返す。
 
+    画像の無い選手はすぐに返すので、出力側は遅い画像のダウンロードを待たずに書き始められる。
+    ordered=True ならロスター順を保つ（先頭から揃った分だけ返す）。
+    """
+    client = client or get_default_client()
+
+    response = None
     try:
-        # ウェブサイトからHTMLを取得
-        response = requests.get(url, timeout=10)
+        # ウェブサイトからHTMLを取得（本文はチャンクごとに読み進める）
+        response = client.get(url, cacheable=True, stream=True)
         response.raise_for_status() # HTTPエラーが発生した場合に例外を発生させる
+        chunks = response.iter_content(CHUNK_SIZE)
+        # EHF サイト向け: ページ内に club details API のパラメータが埋め込まれている場合は
+        # その内部APIを呼び出してJSONで選手情報を取得する（より確実）
+        # コンテナの属性が見つかった時点で読み込みを止める
+        with client.metrics.timer('parse.page'):
+            club_attrs, head = extract_club_details(chunks)
     except requests.exceptions.RequestException as e:
+        if response is not None:
+            # 読みかけのストリームを閉じて接続をプールへ戻す
+            response.close()
         print(f"エラー: URL '{url}' にアクセスできませんでした。詳細: {e}")
-        return player_data
-
-    # BeautifulSoupでHTMLを解析
-    soup = BeautifulSoup(response.content, 'html.parser')
-
-    # EHF サイト向け: ページ内に club details API のパラメータが埋め込まれている場合は
-    # その内部APIを呼び出してJSONで選手情報を取得する（より確実）
-    club_container = soup.find(id='vue-container-clubDetails') or soup.find(attrs={'data-club-details-url': True})
-    if club_container:
-        api_path = club_container.attrs.get('data-club-details-url')
-        club_id = club_container.attrs.get('data-club-id')
-        competition_id = club_container.attrs.get('data-competition-id')
-        round_id = club_container.attrs.get('data-round-id')
-
-        if api_path and club_id:
-            # 絶対URLを作る（元のページのスキームとホストを再利用）
-            parsed = urlparse(url)
-            api_url = f"{parsed.scheme}://{parsed.netloc}{api_path}"
-            params = {'clubId': club_id}
-            if competition_id:
-                params['competitionId'] = competition_id
-            if round_id:
-                params['roundId'] = round_id
+        return
 
-            try:
-                api_resp = requests.get(api_url, params=params, timeout=10)
-                api_resp.raise_for_status()
+    api_request = club_details_request(url, club_attrs) if club_attrs else None
+    if api_request:
+        api_url, params = api_request
+        try:
+            api_resp = client.get(api_url, params=params, cacheable=True, phase='api')
+            api_resp.raise_for_status()
+            with client.metrics.timer('parse.api'):
                 json_data = api_resp.json()
-
-                # players, goalKeepers, playersLeft に分かれているのでまとめる
-                for section in ('players', 'goalKeepers', 'playersLeft'):
-                    items = json_data.get(section, [])
-                    for item in items:
-                                person = item.get('person', {})
-                                first = person.get('firstName') or ''
-                                last = person.get('lastName') or ''
-                                name = (first + ' ' + last).strip() if (first or last) else item.get('url', '')
-                                number = item.get('shirtNumber') or ''
-                                position = item.get('playingPosition') or ''
-                                age = person.get('age') or ''
-
-                                # 画像ダウンロード処理
-                                image_path = ''
-                                images_dir = os.path.join('images', 'ehf')
-                                os.makedirs(images_dir, exist_ok=True)
-
-                                # JSON内の画像フィールドを探す（優先的に高解像度を選ぶ）
-                                img_url = ''
-                                new_photo = item.get('newPhoto') or {}
-                                # 高解像度を優先するキー順
-                                size_priority = ('original', 'w2048', 'w1536', 'w1280', 'w1024', 'w512', 'w360', 'w180')
-                                if isinstance(new_photo, dict):
-                                    for key in size_priority:
-                                        if new_photo.get(key):
-                                            img_url = new_photo.get(key)
-                                            break
-
-                                if not img_url:
-                                    photos = item.get('photos') or item.get('photo') or []
-                                    if isinstance(photos, dict):
-                                        for key in size_priority:
-                                            if photos.get(key):
-                                                img_url = photos.get(key)
-                                                break
-                                    elif isinstance(photos, list) and photos:
-                                        first_photo = photos[0]
-                                        if isinstance(first_photo, dict):
-                                            for key in size_priority:
-                                                if first_photo.get(key):
-                                                    img_url = first_photo.get(key)
-                                                    break
-                                        else:
-                                            # maybe it's a url string
-                                            img_url = first_photo
-
-                                if img_url:
-                                    # 絶対URLに
-                                    try:
-                                        img_url = urljoin(api_url, img_url) if 'api_url' in locals() else img_url
-                                    except Exception:
-                                        pass
-
-                                    # 可能な高解像度バリアントを試す（例: w180 -> w2048）
-                                    def probe_url(u):
-                                        try:
-                                            head = requests.head(u, allow_redirects=True, timeout=5)
-                                            if head.status_code == 200 and head.headers.get('Content-Length'):
-                                                return True, head
-                                            # some servers don't respond to HEAD properly; try GET with small read
-                                            getr = requests.get(u, stream=True, timeout=7)
-                                            if getr.status_code == 200:
-                                                # close the stream
-                                                getr.close()
-                                                return True, getr
-                                        except Exception:
-                                            return False, None
-                                        return False, None
-
-                                    # size_priority を上位から試せるように準備
-                                    tried_url = img_url
-                                    # もし URL に wXXX のようなトークンが含まれるなら大きいサイズへ置換して試す
-                                    m = re.search(r'w(\d+)', img_url)
-                                    if m:
-                                        for sz in ('w2048', 'w1536', 'w1280', 'w1024', 'w512', 'w360', 'w180'):
-                                            candidate = re.sub(r'w\d+', sz, img_url)
-                                            ok, _ = probe_url(candidate)
-                                            if ok:
-                                                tried_url = candidate
-                                                break
-                                    else:
-                                        # トークンが無い場合は、原寸や大きめサイズを示すパラメータを追加して試す（サーバ依存）
-                                        alt_candidates = [img_url + '?original=true', img_url + '?size=2048', img_url]
-                                        for candidate in alt_candidates:
-                                            ok, _ = probe_url(candidate)
-                                            if ok:
-                                                tried_url = candidate
-                                                break
-
-                                    # ファイル名を生成してダウンロード
-                                    try:
-                                        pid = item.get('id') or person.get('id') or ''
-                                        path = urlparse(tried_url).path
-                                        _, ext = os.path.splitext(path)
-
-                                        # 拡張子がなければ Content-Type から推定
-                                        if not ext or ext == '':
-                                            try:
-                                                resp_head = requests.head(tried_url, allow_redirects=True, timeout=7)
-                                                ctype = resp_head.headers.get('Content-Type', '')
-                                            except Exception:
-                                                ctype = ''
-                                            ext = mimetypes.guess_extension(ctype.split(';')[0].strip()) or '.jpg'
-
-                                        name_slug = re.sub(r"[^0-9A-Za-z一-龥ぁ-んァ-ン\- ]", '', name).strip().replace(' ', '_')[:50]
-                                        filename = f"{pid}_{name_slug}{ext}" if pid else f"{name_slug}{ext}"
-                                        local_path = os.path.join(images_dir, filename)
-                                        if not os.path.exists(local_path):
-                                            try:
-                                                r = requests.get(tried_url, timeout=15)
-                                                r.raise_for_status()
-                                                with open(local_path, 'wb') as wf:
-                                                    wf.write(r.content)
-                                            except Exception:
-                                                local_path = ''
-                                        image_path = local_path
-                                    except Exception:
-                                        image_path = ''
-
-                                player_data.append({
-                                    '背番号': number,
-                                    '選手名': name,
-                                    'Position': position,
-                                    'Age': age,
-                                    'Image': image_path
-                                })
-
-                return player_data
-            except requests.exceptions.RequestException as e:
-                print(f"API呼び出しに失敗しました: {e}")
-            except ValueError:
-                print("APIの応答がJSONとして解析できませんでした")
+        except requests.exceptions.RequestException as e:
+            print(f"API呼び出しに失敗しました: {e}")
+        except ValueError:
+            print("APIの応答がJSONとして解析できませんでした")
+        else:
+            if not any(True for _ in iter_api_items(json_data)):
+                # 選手が居ない（--debug でページを保存する）ときだけ残りも読んで覚える
+                client.remember_body(url, _read_rest(url, head, chunks))
+            # ページの残りは不要なので読まずに閉じる
+            response.close()
+            yield from _iter_api_players(url, api_url, api_resp, json_data, client, image_workers, per_host,
+                                         state, ordered, images, players, details)
+            return
 
     # フォールバック: 汎用的なHTML走査（前の実装）
-    rows = soup.find_all('tr')
+    # ここで初めてページ全体が必要になるので、読み残しがあれば続きを読む
+    try:
+        body = _read_rest(url, head, chunks)
+    finally:
+        response.close()
+    # --debug 用（API 経由で選手が取れた場合はページを最後まで読まないので覚えない）
+    client.remember_body(url, body)
+    with client.metrics.timer('parse.html'):
+        rows = parse_table_rows(body)
+    yield from rows
+
+def _read_rest(url, head, chunks):
+    """ストリームの読み残しを読んでページ全体を返す（途中で失敗したら読めた分まで）。"""
+    try:
+        return head + b''.join(chunks)
+    except requests.exceptions.RequestException as e:
+        print(f"エラー: URL '{url}' の本文を最後まで読めませんでした。詳細: {e}")
+        return head
+
+def _details_current(details, record):
+    """前回のレコードの詳細（enrich.DETAIL_FIELDS）を取り直さずに使えるか。ID の無い選手は詳細を取得しない。"""
+    return not record.get('ID') or details.covers(f"ehf:{record['ID']}", record)
+
+def _iter_api_players(url, api_url, api_resp, json_data, client, image_workers, per_host, state, ordered,
+                      images=True, players=None, details=None):
+    """clubdetails API の応答から選手レコードを作り、画像の取得が終わったものから返す。"""
+    previous = state.load(url) if state is not None else None
+    body_digest = digest_bytes(api_resp.content)
+    if (previous and previous.get('digest') == body_digest
+            and all(image_present(p['record']) and 'ID' in p['record'] for p in previous.get('players', []))
+            and (details is None or all(_details_current(details, p['record']) for p in previous.get('players', [])))):
+        # 応答が前回と同一: 選手ごとの処理も画像取得もしない
+        state.log_changes(url, [])
+        for p in previous.get('players', []):
+            yield dict(p['record'])
+        return
+    previous_players = {p['key']: p for p in (previous or {}).get('players', [])}
+    player_data = []
+    entries = []
+    changes = []
+
+    images_dir = os.path.join('images', 'ehf')
+    if images:
+        os.makedirs(images_dir, exist_ok=True)
+    image_jobs = []
+    detail_entries = []
+
+    for item in iter_api_items(json_data):
+        record = player_record(item)
+        name = record['選手名']
+        pid = player_id(item)
+
+        if state is not None:
+            key = str(pid or name)
+            digest = item_digest(item)
+            before = previous_players.pop(key, None)
+            if before and before.get('digest') == digest and image_present(before['record']):
+                record = dict(before['record'], ID=str(pid))
+                player_data.append(record)
+                entries.append({'key': key, 'digest': digest, 'record': record})
+                if details is not None and pid:
+                    detail_entries.append((record, f'ehf:{pid}', *detail_request(item, url)))
+                continue
+
+        player_data.append(record)
+        if details is not None and pid:
+            detail_entries.append((record, f'ehf:{pid}', *detail_request(item, url)))
+        if state is not None:
+            entries.append({'key': key, 'digest': digest, 'record': record})
+            if before is None:
+                kind = 'added'
+            elif before.get('digest') == digest:
+                # 選手の情報は前回と同じで、画像ファイルが消えていたので取り直すだけ
+                kind = 'image_repaired'
+            else:
+                kind = 'changed'
+            changes.append((kind, key, record))
+
+        # 画像は後段でまとめて並列に取得する
+        img_url = photo_url(item, api_url) if images else None
+        # 他のチームで画像を取得済みの選手（移籍・代表との兼任）は取り直さない
+        if img_url and players is not None and pid and players.claim_player(f'ehf:{pid}', url, record):
+            continue
+        if img_url:
+            image_jobs.append(ImageJob(record, img_url, functools.partial(
+                fetch_player_image, img_url, images_dir, pid, name, client)))
+
+    stream = iter_records(player_data, image_jobs, max_workers=image_workers, ordered=ordered,
+                          limiter=client.host_limiter(per_host))
+    if details is not None:
+        # 選手ページは画像と並行して取得し、レコードを返す前に列を加える
+        stream = details.iter_enriched(stream, detail_entries)
+    yield from stream
+    client.flush_caches()
+    if state is not None:
+        # 今回の応答に居ない選手は退団扱い
+        changes.extend(('removed', key, p['record']) for key, p in previous_players.items())
+        state.save(url, body_digest, entries)
+        state.log_changes(url, changes)
+
+def parse_table_rows(body):
+    """API が使えないときの汎用的な走査: 1列目が背番号、2列目が選手名の <tr> を拾う。"""
+    player_data = []
+    rows = make_soup(body, TABLE_ROW_STRAINER).find_all('tr')
 
     for row in rows:
         cells = row.find_all(['td', 'th'])
@@ -214,74 +411,129 @@ def scrape_player_data(url):
 
     return player_data
 
-def save_to_csv(data, filename='player_roster.csv'):
+def write_csv_rows(csvfile, data, fieldnames=FIELDNAMES):
+    """
+    開いたファイル（io.StringIO なども可）に選手レコードをCSVで書き込みます（列の決め方は save_to_csv と同じ）。
+
+    Returns:
+        int: 書き込んだ行数（データが無ければ 0 で、何も書きません）。
+    """
+    rows = iter(data)
+    first = next(rows, None)
+    if first is None:
+        return 0
+
+    extrasaction = 'ignore'
+    if isinstance(data, list):
+        # ヘッダー：データ中のキーを集め、既知の主要カラム順を優先して並べる
+        keys = []
+        for item in data:
+            for k in item.keys():
+                if k not in keys:
+                    keys.append(k)
+
+        # 優先リストを先頭に置き、残りを追加
+        fieldnames = [k for k in FIELDNAMES if k in keys]
+        fieldnames += [k for k in keys if k not in fieldnames]
+        extrasaction = 'raise'
+
+    writer = csv.DictWriter(csvfile, fieldnames=list(fieldnames), extrasaction=extrasaction)
+
+    # ヘッダーを書き込み
+    writer.writeheader()
+
+    # データを書き込み（キーが無ければ空欄になる）
+    writer.writerow(first)
+    count = 1
+    # 途中経過を他のプロセスから読めるように、CSV_FLUSH_ROWS 行か CSV_FLUSH_SECONDS 秒ごとにディスクへ
+    # （sinks と同じくまとめて書き出す。1行ごとには flush しない）
+    flushed_count, flushed_at = 0, time.monotonic()
+    for row in rows:
+        writer.writerow(row)
+        count += 1
+        if count - flushed_count >= CSV_FLUSH_ROWS or time.monotonic() - flushed_at >= CSV_FLUSH_SECONDS:
+            csvfile.flush()
+            flushed_count, flushed_at = count, time.monotonic()
+    return count
+
+
+def save_to_csv(data, filename='player_roster.csv', fieldnames=FIELDNAMES):
     """
     スクレイピングしたデータをCSVファイルに保存します。
+
+    リストを渡した場合はデータ中のキーを集めて列を決めます（FIELDNAMES の列を先頭に）。
+    ジェネレータ（iter_player_data など）を渡した場合は fieldnames の列で、
+    レコードが届くたびに1行ずつ書き込みます（fieldnames に無いキーは書きません）。
     
     Args:
-        data (list): save_to_csv関数から返されたデータ。
+        data (list | iterable): 選手レコード。
         filename (str): 出力するCSVファイル名。
+        fieldnames (sequence): ジェネレータを渡したときの列。
+
+    Returns:
+        int: 書き込んだ行数。
     """
-    if not data:
+    rows = iter(data)
+    first = next(rows, None)
+    if first is None:
         print("保存するデータがありません。")
-        return
-        
-    # ヘッダー：データ中のキーを集め、既知の主要カラム順を優先して並べる
-    # 既知の順序
-    preferred = ['背番号', '選手名', 'Position', 'Age', 'Image']
-    keys = []
-    for item in data:
-        for k in item.keys():
-            if k not in keys:
-                keys.append(k)
-
-    # 優先リストを先頭に置き、残りを追加
-    fieldnames = [k for k in preferred if k in keys]
-    fieldnames += [k for k in keys if k not in fieldnames]
+        return 0
+    if not isinstance(data, list):
+        data = itertools.chain([first], rows)
 
+    count = 0
     try:
         with open(filename, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-            # ヘッダーを書き込み
-            writer.writeheader()
-
-            # データを書き込み（キーが無ければ空欄になる）
-            writer.writerows(data)
+            count = write_csv_rows(csvfile, data, fieldnames)
 
         print(f"データを '{filename}' にCSV形式で保存しました。")
 
     except Exception as e:
         print(f"エラー: CSVファイルへの書き込みに失敗しました。詳細: {e}")
+    return count
 
 def main():
     parser = argparse.ArgumentParser(description='選手名簿をスクレイピングしてCSVに保存します。')
     parser.add_argument('-u', '--url', help='スクレイピング対象のURL（省略するとスクリプト内のデフォルトURLを使用）')
     parser.add_argument('-o', '--output', default='player_roster.csv', help='出力CSVファイル名（デフォルト: player_roster.csv）')
     parser.add_argument('--debug', action='store_true', help='デバッグ用に取得したHTMLを debug.html として保存します（データが得られなかった場合）')
+    parser.add_argument('--timeout', type=float, default=10, help='HTTPリクエストの既定タイムアウト秒（デフォルト: 10）')
+    parser.add_argument('--pool-size', type=int, default=16, help='ホストごとの最大keep-alive接続数（デフォルト: 16）')
+    parser.add_argument('--no-probe-cache', action='store_true', help='画像バリアント探索のキャッシュ（.cache/probe_cache.json）を使わない')
+    parser.add_argument('--no-http-cache', action='store_true', help='ページ・APIの条件付きリクエスト用キャッシュ（.cache/http）を使わない')
+    parser.add_argument('--rate', type=float, default=8, help='ホストごとの毎秒のリクエスト数の上限（0 で無制限、デフォルト: 8）')
+    parser.add_argument('--incremental', action='store_true', help='前回の取得結果との差分だけを処理し、変更ログ（<出力名>.changes.jsonl）を書く')
     args = parser.parse_args()
 
     # デフォルトURL（スクリプト内に残しておくが、通常は --url で指定する）
     default_url = "https://example.com/team-roster"
     target_url = args.url or default_url
 
-    # スクレイピングの実行
-    roster = scrape_player_data(target_url)
+    probe_cache = None if args.no_probe_cache else ProbeCache()
+    response_cache = None if args.no_http_cache else ResponseCache()
+    client = HttpClient(timeout=args.timeout, pool_maxsize=args.pool_size,
+                        probe_cache=probe_cache, response_cache=response_cache,
+                        scheduler=RequestScheduler(rate=args.rate))
+
+    state = RosterState(change_log=change_log_path(args.output)) if args.incremental else None
 
-    if not roster:
+    # スクレイピングの実行（画像が揃った選手から順に CSV へ書き込む）
+    count = save_to_csv(iter_player_data(target_url, client=client, state=state), args.output)
+
+    if not count:
         print("No player data found.")
         if args.debug:
             # 取得HTMLを保存してローカルで調査できるようにする
-            try:
-                resp = requests.get(target_url, timeout=10)
+            # スクレイピング時に読んだ本文を使う（同じURLを取り直さない）
+            body = client.recent_body(target_url)
+            if body is None:
+                print("Could not save debug HTML: the full page was not read "
+                      "(the request failed or the players came from the API).")
+            else:
                 with open('debug.html', 'wb') as f:
-                    f.write(resp.content)
+                    f.write(body)
                 print("Saved fetched HTML to debug.html for inspection.")
-            except Exception as e:
-                print(f"Could not fetch/save debug HTML: {e}")
-
-    # CSV出力（データが空でも save_to_csv が短絡する）
-    save_to_csv(roster, args.output)
+    client.close()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,308 @@
+"""選手ごとの詳細情報（国籍・クラブ・身長・生年月日）の付加
+
+チームページ・ロスター API に無い項目を選手ページ（IHF の /players/... や EHF の選手ページ）から取得し、
+出力する前に選手レコードの列（DETAIL_FIELDS）として追加する。
+
+- 取得結果は選手キー（'ihf:<id>' / 'ehf:<id>'）ごとに TTL 付きで永続キャッシュし（.cache/details.json）、
+  チームや実行をまたいで使い回す。同じ選手の取得が進行中なら、その結果を待つ
+- チームの選手ページはまとめて専用のスレッドプールに投入し、画像の取得と並行して取得する
+  （ホストごとの同時数は per_host まで。スケジューラーには phase='detail' で、ページ・API より後に送る）
+- ロスターの API 応答に入っている項目（EHF の person など）は、リクエストせずにそのまま使う
+
+    enricher = Enricher(client)
+    data = ehf.scrape_player_data(url, client, details=enricher)
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import requests
+
+from http_client import HostLimiter
+
+DEFAULT_PATH = os.path.join('.cache', 'details.json')
+DEFAULT_TTL = 7 * 24 * 3600
+# 取得できなかった（404 など）選手を取り直すまでの秒数
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST = 4
+
+# レコードに追加する列
+DETAIL_FIELDS = ('Nationality', 'Club', 'Height', 'Birthdate')
+
+# 選手ページのラベル（小文字、末尾の ':' を除いたもの）-> 列
+LABELS = {
+    'nationality': 'Nationality',
+    'country': 'Nationality',
+    'nation': 'Nationality',
+    'club': 'Club',
+    'current club': 'Club',
+    'team': 'Club',
+    'height': 'Height',
+    'date of birth': 'Birthdate',
+    'birth date': 'Birthdate',
+    'birthdate': 'Birthdate',
+    'born': 'Birthdate',
+    'dob': 'Birthdate',
+}
+# "Label: value" 形式の短いテキスト
+_LABEL_TEXT_RE = re.compile(r'^\s*([A-Za-z][A-Za-z ]{1,20}?)\s*:\s*(.+?)\s*$')
+
+
+def _text(value):
+    """JSON の値を表示用の文字列にする（{'name': ...} のようなオブジェクトは名前を使う）。"""
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('value') or value.get('code') or ''
+    if isinstance(value, list):
+        value = ', '.join(filter(None, (_text(v) for v in value)))
+    return '' if value is None else str(value).strip()
+
+
+def _json_ld_people(soup):
+    for script in soup.find_all('script', attrs={'type': 'application/ld+json'}):
+        try:
+            data = json.loads(script.string or '')
+        except ValueError:
+            continue
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict) and item.get('@type') == 'Person':
+                yield item
+
+
+def parse_details(body):
+    """
+    選手ページから DETAIL_FIELDS の項目を取り出す（見つかった項目だけの dict）。
+
+    schema.org の Person（JSON-LD）、<dt>/<dd>・<th>/<td> の組、"Label: value" 形式のテキストの順に探す。
+    """
+    from html_parsing import make_soup
+    soup = make_soup(body)
+    fields = {}
+
+    def put(field, value):
+        value = _text(value)
+        if field and value and field not in fields:
+            fields[field] = value
+
+    for person in _json_ld_people(soup):
+        put('Nationality', person.get('nationality'))
+        put('Club', person.get('memberOf') or person.get('affiliation'))
+        put('Height', person.get('height'))
+        put('Birthdate', person.get('birthDate'))
+
+    for label_tag, value_tag in (('dt', 'dd'), ('th', 'td')):
+        for label in soup.find_all(label_tag):
+            value = label.find_next_sibling(value_tag)
+            if value is not None:
+                key = label.get_text(' ', strip=True).rstrip(':').strip().lower()
+                put(LABELS.get(key), value.get_text(' ', strip=True))
+
+    for tag in soup.find_all(['li', 'p', 'span', 'div']):
+        text = tag.get_text(' ', strip=True)
+        if len(text) > 80:
+            continue
+        m = _LABEL_TEXT_RE.match(text)
+        if m:
+            put(LABELS.get(m.group(1).lower()), m.group(2))
+    return fields
+
+
+class DetailCache:
+    """
+    選手キーごとの詳細情報の永続キャッシュ（probe_cache.ProbeCache と同じく JSON に保存）。
+
+    Args:
+        path (str): キャッシュファイルのパス（JSON）。
+        ttl (float): 取得できた項目を保持する秒数。
+        negative_ttl (float): 取得できなかった選手の記録を保持する秒数。
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._players = {}  # 選手キー -> {'fields': {...}, 'ts': float}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self._players = json.load(f).get('players', {})
+        except (OSError, ValueError):
+            return
+        self._evict(time.time())
+
+    def _expired(self, entry, now):
+        ttl = self.ttl if entry.get('fields') else self.negative_ttl
+        return now - entry.get('ts', 0) > ttl
+
+    def _evict(self, now):
+        for key in [k for k, v in self._players.items() if self._expired(v, now)]:
+            del self._players[key]
+
+    def lookup(self, key):
+        """キャッシュ済みの項目（dict）。未知または期限切れなら None。"""
+        with self._lock:
+            entry = self._players.get(key)
+            if entry is None or self._expired(entry, time.time()):
+                return None
+            return dict(entry['fields'])
+
+    def store(self, key, fields):
+        with self._lock:
+            self._players[key] = {'fields': dict(fields), 'ts': time.time()}
+            self._dirty = True
+
+    def save(self):
+        """変更があればアトミックに書き出す。期限切れのエントリはここで捨てる。"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict(time.time())
+            data = {'players': dict(self._players)}
+            self._dirty = False
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.details-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+class Enricher:
+    """
+    選手ページの取得と、レコードへの項目の追加（複数のチーム・スレッドから共有してよい）。
+
+    Args:
+        client (HttpClient): 選手ページの取得に使うクライアント。
+        cache (DetailCache): 省略時は .cache/details.json。
+        max_workers (int): 選手ページを並列に取得するスレッド数（プロセス全体）。
+        per_host (int): 同一ホストへの同時リクエスト数。
+    """
+
+    def __init__(self, client, cache=None, max_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST):
+        self.client = client
+        self.cache = cache if cache is not None else DetailCache()
+        self.max_workers = max_workers
+        self._limiter = HostLimiter(per_host)
+        self._lock = threading.Lock()
+        self._inflight = {}  # 選手キー -> Future
+        self._pool = None
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix='detail')
+            return self._pool
+
+    def covers(self, key, record):
+        """
+        前回の実行で出力した record をそのまま使い回せるか（詳細の列があり、その選手のキャッシュが期限内か）。
+
+        キャッシュが期限切れなら取り直すために False。取得できなかった選手（404 など）は
+        negative_ttl のあいだだけ True で、一時的な失敗（キャッシュしない）は次の実行で取り直す。
+        """
+        return all(field in record for field in DETAIL_FIELDS) and self.cache.lookup(key) is not None
+
+    def submit(self, key, url, known=None):
+        """
+        選手の詳細（dict）の Future を返す。
+
+        known（ロスターの応答から分かっている項目）で全項目が揃っているか、選手ページが無ければ取得しない。
+        その場合も known をキャッシュに記録する（covers() で前回のレコードを使い回せるように）。
+        キャッシュにあればそれを、同じ選手の取得が進行中ならその Future を返す。
+        """
+        known = {k: _text(v) for k, v in (known or {}).items() if _text(v)}
+        if all(field in known for field in DETAIL_FIELDS) or not url:
+            self.cache.store(key, known)
+            return _done(known)
+        cached = self.cache.lookup(key)
+        if cached is not None:
+            return _done(dict(cached, **known))
+        pool = self._executor()
+        with self._lock:
+            fut = self._inflight.get(key)
+            if fut is None:
+                fut = pool.submit(self._fetch, key, url)
+                self._inflight[key] = fut
+                fut.add_done_callback(lambda _, key=key: self._forget(key))
+        if not known:
+            return fut
+        # ロスターの項目を優先して重ねる
+        merged = Future()
+        fut.add_done_callback(lambda f: merged.set_result(dict(_result(f), **known)))
+        return merged
+
+    def _forget(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _fetch(self, key, url):
+        with self._limiter.get(url):
+            try:
+                resp = self.client.get(url, phase='detail', timeout=15)
+            except requests.RequestException as e:
+                print(f"選手ページの取得エラー: {url} ({e})")
+                return {}
+        if resp.status_code in (404, 410):
+            self.cache.store(key, {})
+            return {}
+        if resp.status_code != 200:
+            # 一時的な失敗はキャッシュしない（次の実行で取り直す）
+            return {}
+        with self.client.metrics.timer('parse.detail'):
+            fields = parse_details(resp.content)
+        self.cache.store(key, fields)
+        return fields
+
+    def iter_enriched(self, records, entries):
+        """
+        records（レコードのイテレータ）をそのまま返すジェネレータ。各レコードは詳細の取得を待ってから返す。
+
+        entries は [(レコード, 選手キー, 選手ページURL, ロスターから分かっている項目), ...]。
+        全選手の取得を最初にまとめて投入するので、画像の取得と並行して進む。
+        詳細の無いレコードにも DETAIL_FIELDS の列を空欄で付ける（出力の列を揃えるため）。
+        """
+        futures = {id(record): self.submit(key, url, known) for record, key, url, known in entries}
+        try:
+            for record in records:
+                fut = futures.get(id(record))
+                fields = _result(fut) if fut is not None else {}
+                for field in DETAIL_FIELDS:
+                    record[field] = fields.get(field, record.get(field, ''))
+                yield record
+        finally:
+            self.cache.save()
+
+    def close(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+        self.cache.save()
+
+
+def _done(value):
+    fut = Future()
+    fut.set_result(value)
+    return fut
+
+
+def _result(fut):
+    try:
+        return fut.result() or {}
+    except Exception as e:
+        print(f"選手ページの処理エラー: {e}")
+        return {}
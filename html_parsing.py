@@ -0,0 +1,61 @@
+"""HTML パーサーの選択と、必要な要素だけを組み立てる限定パース
+
+lxml がインストールされていればそれを使い、無ければ標準の html.parser にフォールバックする。
+SoupStrainer を渡すと一致した要素（とその子孫）だけがツリーに組み立てられる。
+
+bs4（と lxml）は最初に make_soup() を呼んだときに読み込む。EHF の API 経路のように
+HTML をパースしない実行では読み込まない。
+"""
+import importlib.util
+
+# lxml の有無だけを調べる（import はパースするときまで遅らせる）
+DEFAULT_PARSER = 'lxml' if importlib.util.find_spec('lxml') else 'html.parser'
+
+_parser = DEFAULT_PARSER
+
+
+class Strainer:
+    """SoupStrainer の引数。make_soup() に渡したときに初めて SoupStrainer を作る。"""
+
+    def __init__(self, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        self._strainer = None
+
+    def build(self):
+        if self._strainer is None:
+            from bs4 import SoupStrainer
+            self._strainer = SoupStrainer(*self.args, **self.kwargs)
+        return self._strainer
+
+
+# EHF: API が使えないときのテーブル走査用
+TABLE_ROW_STRAINER = Strainer('tr')
+# 大会ページのリンク収集用
+LINK_STRAINER = Strainer('a', href=True)
+
+
+def set_parser(name):
+    """使用するパーサーを切り替える（'lxml' / 'html.parser' など）。None で既定に戻す。"""
+    global _parser
+    _parser = name or DEFAULT_PARSER
+
+
+def get_parser():
+    return _parser
+
+
+def make_soup(markup, parse_only=None, parser=None):
+    """
+    選択中のパーサーで BeautifulSoup を作る。
+
+    parse_only に Strainer（または SoupStrainer）を渡すと限定パースになる。
+    """
+    try:
+        from bs4 import BeautifulSoup
+    except ImportError as e:
+        print(f"Missing dependency: {e}.\nPlease install required packages: pip install -r requirements.txt")
+        raise
+    if isinstance(parse_only, Strainer):
+        parse_only = parse_only.build()
+    return BeautifulSoup(markup, parser or _parser, parse_only=parse_only)
@@ -0,0 +1,259 @@
+"""共有HTTPクライアント
+
+ホストごとに keep-alive の requests.Session を保持し、全スクレイパー
+（ehf.py / ihf.py / image_utils.py）から同じ接続プールを再利用する。
+scheduler（rate_limit.RequestScheduler）を渡すと、送信前にホストごとのレート制限と
+優先度（phase）に従って順番を待ち、429/503 の Retry-After を守る。
+一時的な失敗は retry（retry.RetryPolicy）に従って再試行し、
+breaker（retry.CircuitBreaker）で失敗が続くホストへの送信を止める。
+送信した全リクエスト（再試行を含む）は metrics（metrics.Metrics）に記録する。
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from metrics import get_default_metrics
+from rate_limit import parse_retry_after
+from retry import RetryPolicy, CircuitBreaker, classify_exception, classify_status, TRANSIENT, THROTTLED
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_POOL_MAXSIZE = 16
+# debug.html 用に覚えておくページ本文の数
+RECENT_BODIES = 8
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (compatible; scraping/1.0)',
+    'Accept-Language': 'en-US,en;q=0.8',
+}
+
+
+class HostLimiter:
+    """ホストごとの同時実行数を制限するセマフォの集合。"""
+
+    def __init__(self, per_host):
+        self.per_host = max(1, per_host)
+        self._sems = {}
+        self._lock = threading.Lock()
+
+    def get(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            sem = self._sems.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self._sems[host] = sem
+        return sem
+
+
+class HttpClient:
+    """ホスト単位の Session を束ねる薄いクライアント。
+
+    Args:
+        timeout (float): 呼び出し側が timeout を指定しなかった場合の既定値。
+        pool_connections (int): HTTPAdapter にキャッシュする接続プール数。
+        pool_maxsize (int): 1プールあたりの最大接続数（並列数に合わせる）。
+        headers (dict): 全リクエストに付与する既定ヘッダー。
+        probe_cache (ProbeCache): 画像バリアント探索の結果を共有するキャッシュ（任意）。
+        response_cache (ResponseCache): cacheable=True の GET に使う条件付きリクエスト用キャッシュ（任意）。
+        scheduler (RequestScheduler): ホストごとのレート制限・優先度付きスケジューラ（任意）。
+        retry (RetryPolicy): 一時的な失敗の再試行方針。省略時は既定の RetryPolicy。
+        breaker (CircuitBreaker): ホストごとのサーキットブレーカー。省略時は既定の CircuitBreaker。
+        metrics (Metrics): リクエストの記録先。省略時はプロセス共有の Metrics。
+        sleep (callable): 再試行までの待ちに使う関数（テスト用。省略時は time.sleep）。
+    """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_connections=DEFAULT_POOL_CONNECTIONS,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, headers=None, probe_cache=None, response_cache=None,
+                 scheduler=None, retry=None, breaker=None, metrics=None, sleep=None):
+        self.timeout = timeout
+        self.sleep = sleep or time.sleep
+        self.scheduler = scheduler
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.metrics = metrics or get_default_metrics()
+        self.probe_cache = probe_cache
+        self.response_cache = response_cache
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.headers = dict(DEFAULT_HEADERS)
+        if headers:
+            self.headers.update(headers)
+        self._sessions = {}
+        self._limiters = {}
+        self._lock = threading.Lock()
+        self._bodies = OrderedDict()
+
+    def session_for(self, url):
+        """URL のホストに対応する Session を返す（無ければ作成）。"""
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_connections,
+                                      pool_maxsize=self.pool_maxsize)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.headers.update(self.headers)
+                self._sessions[host] = session
+        return session
+
+    def host_limiter(self, per_host):
+        """
+        画像ジョブの同一ホストへの同時数を制限する HostLimiter（per_host ごとにクライアントで1つを共有する）。
+
+        チームごとに作ると、一括取得・クロールで並行するチームの数だけ同時数が増えてしまうため。
+        """
+        with self._lock:
+            limiter = self._limiters.get(per_host)
+            if limiter is None:
+                limiter = self._limiters[per_host] = HostLimiter(per_host)
+        return limiter
+
+    def request(self, method, url, phase='page', cache_lookup=False, **kwargs):
+        """
+        リクエストを送る。
+
+        phase は 'page' / 'api' / 'probe' / 'content_type' / 'download' のいずれかで、
+        スケジューラの優先度と計測の分類に使う。
+        cache_lookup はレスポンスキャッシュ経由の GET であることを示す（304 をキャッシュヒットとして記録する）。
+        接続エラー・タイムアウト・5xx・429 は再試行し（冪等でないメソッドは 429 だけ）、最後の応答（または例外）を返す。
+        404 などはそのまま返すので、呼び出し側は「存在しない」と「一時的に取れない」を区別できる。
+        """
+        kwargs.setdefault('timeout', self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.before(url)
+            if self.scheduler is not None:
+                self.scheduler.acquire(url, phase)
+            started = time.perf_counter()
+            try:
+                resp = self.session_for(url).request(method, url, **kwargs)
+            except requests.RequestException as e:
+                self.metrics.record_request(method, url, phase, None, time.perf_counter() - started)
+                kind = classify_exception(e)
+                if kind in TRANSIENT:
+                    self.breaker.failure(url)
+                if not self.retry.should_retry(kind, attempt, method):
+                    raise
+                self.sleep(self.retry.delay(attempt))
+                attempt += 1
+                continue
+
+            cache = ('hit' if resp.status_code == 304 else 'miss') if cache_lookup else ''
+            stream = kwargs.get('stream', False)
+            entry = self.metrics.record_request(method, url, phase, resp.status_code,
+                                                time.perf_counter() - started, cache=cache,
+                                                nbytes=0 if stream else len(resp.content or b''), pending=stream)
+            if stream:
+                _count_body(resp, entry, self.metrics)
+            if self.scheduler is not None:
+                self.scheduler.observe(url, resp)
+            kind = classify_status(resp.status_code)
+            if kind not in TRANSIENT:
+                self.breaker.success(url)
+                return resp
+            # 429 はサーバーが生きているのでサーキットの失敗には数えない
+            if kind != THROTTLED:
+                self.breaker.failure(url)
+            if not self.retry.should_retry(kind, attempt, method):
+                return resp
+            retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+            if stream:
+                self.metrics.finish_request(entry, 0)
+            resp.close()
+            self.sleep(self.retry.delay(attempt, retry_after))
+            attempt += 1
+
+    def get(self, url, cacheable=False, **kwargs):
+        """GET。cacheable=True ならレスポンスキャッシュ経由で条件付きリクエストにする。"""
+        if cacheable and self.response_cache is not None:
+            return self.response_cache.get(self, url, cache_lookup=True, **kwargs)
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        # requests.head と同じく既定ではリダイレクトを追わない
+        kwargs.setdefault('allow_redirects', False)
+        kwargs.setdefault('phase', 'probe')
+        return self.request('HEAD', url, **kwargs)
+
+    def remember_body(self, url, body):
+        """取得したページ本文を覚えておく（--debug で debug.html を書くときに再取得しないため）。"""
+        with self._lock:
+            self._bodies[url] = body
+            self._bodies.move_to_end(url)
+            while len(self._bodies) > RECENT_BODIES:
+                self._bodies.popitem(last=False)
+
+    def recent_body(self, url):
+        """remember_body で覚えた本文（無ければ None）。"""
+        with self._lock:
+            return self._bodies.get(url)
+
+    def flush_caches(self):
+        """ディスクに永続化するキャッシュを書き出す。"""
+        if self.probe_cache is not None:
+            self.probe_cache.save()
+        if self.response_cache is not None:
+            try:
+                self.response_cache.save()
+            except OSError as e:
+                print(f"レスポンスキャッシュに保存できませんでした: {e}")
+
+    def close(self):
+        self.flush_caches()
+        with self._lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _count_body(resp, entry, metrics):
+    """
+    ストリームの応答の iter_content を包み、読んだ本文のバイト数で計測の記録を確定させる。
+
+    resp.content・iter_lines も iter_content を通るので、どの読み方でも数えられる。
+    読み終えたとき（途中でやめた場合はジェネレータが閉じられたとき）に確定させる。
+    """
+    iter_content = resp.iter_content
+
+    def counted(chunk_size=1, decode_unicode=False):
+        received = 0
+        try:
+            for chunk in iter_content(chunk_size, decode_unicode):
+                if isinstance(chunk, bytes):
+                    received += len(chunk)
+                    entry['bytes'] = received
+                yield chunk
+        finally:
+            metrics.finish_request(entry, received)
+
+    resp.iter_content = counted
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+
+def get_default_client():
+    """client を渡されなかった呼び出し用のプロセス共有クライアントを返す。"""
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            from probe_cache import ProbeCache
+            from rate_limit import RequestScheduler
+            from response_cache import ResponseCache
+            _default_client = HttpClient(probe_cache=ProbeCache(), response_cache=ResponseCache(),
+                                         scheduler=RequestScheduler())
+        return _default_client
@@ -1,6 +1,6 @@
+# 画像まわり（image_utils と Pillow、変換用のプロセスプール）は画像を取得するときに初めて読み込む
 try:
     import requests
-    from bs4 import BeautifulSoup
 except ImportError as e:
     print(f"Missing dependency: {e}.\nPlease install required packages: pip install -r requirements.txt")
     raise
@@ -8,36 +8,58 @@ except ImportError as e:
 import os
 from urllib.parse import urljoin, urlparse
 import re
-from PIL import Image
-from image_utils import download_and_process_image
+import functools
+from html_parsing import make_soup
+from http_client import get_default_client
+from image_jobs import ImageJob, iter_records, DEFAULT_MAX_WORKERS, DEFAULT_PER_HOST
 
 
-def scrape_player_data(url):
-    """
-    IHF のチームページから選手一覧を抽出して返す。
+def query_variants(base_url):
+    """高解像度を示すクエリを付けたバリアント [(クエリ, URL), ...]。"""
+    return [(q, base_url + q) for q in ('?original=true', '?size=2048', '?quality=100', '')]
 
-    戻り値: [{'背番号': '', '選手名': '...', 'Position': '...'}, ...]
-    """
-    player_data = []
 
-    try:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-    except requests.exceptions.RequestException as e:
-        print(f"エラー: URL '{url}' にアクセスできませんでした。詳細: {e}")
-        return player_data
+def fetch_player_image(img_url, images_dir, name, player_id, client, transcoder=None):
+    """高解像度バリアントを解決して画像を保存し、ローカルパス（変換待ちなら Future）を返す。"""
+    from image_utils import download_and_process_image, resolution_candidates
+    return download_and_process_image(img_url, images_dir, name, player_id, client=client,
+                                      transcoder=transcoder, variants=(query_variants, resolution_candidates))
+
 
-    soup = BeautifulSoup(resp.content, 'html.parser')
+def is_player_link(a):
+    return a.name == 'a' and '/players/' in a.get('href', '')
 
+
+def player_card(a):
+    """
+    選手リンクを含む「カード」要素（他の選手へのリンクを含まない最も外側の祖先）。
+
+    画像はこの中だけから探す。隣の選手の画像を拾わないように、前後の兄弟要素はたどらない。
+    """
+    href = a['href']
+    card = a
+    for parent in a.parents:
+        if parent.name == '[document]':
+            break
+        if any(other['href'] != href for other in parent.find_all(is_player_link, href=True)):
+            break
+        card = parent
+    return card
+
+
+def parse_players(soup, url):
+    """
+    チームページ（全体をパースしたツリー）から選手を取り出す。
+
+    Yields:
+        (レコード, 画像, 選手) のタプル。画像は (画像URL, 選手ID, ファイル名用の名前) か None、
+        選手は (選手ID, 選手ページの絶対URL)。
+    """
     seen = set()
-    images_dir = os.path.join('images', 'ihf')
-    os.makedirs(images_dir, exist_ok=True)
 
     # IHF ページでは選手へのリンクが /players/ を含むURLになっている
-    for a in soup.find_all('a', href=True):
+    for a in soup.find_all(is_player_link, href=True):
         href = a['href']
-        if '/players/' not in href:
-            continue
 
         # プレイヤー名・ポジションなどはリンクテキストに含まれることが多い
         text = a.get_text(separator=' ', strip=True)
@@ -56,44 +78,16 @@ def scrape_player_data(url):
         position = ''
         image_path = ''
 
-        # 画像探索: 親要素内の<img>、またはリンクの直前の<img>を探す
-        img_tag = None
-        parent = a.parent
-        if parent:
-            img_tag = parent.find('img')
-        if not img_tag:
-            img_tag = a.find('img')
-        if not img_tag:
-            img_tag = a.find_previous_sibling('img')
-
-        # 高解像度バリアントをさらに試行
-        def try_additional_variants(base_url):
-            variants = [
-                base_url + '?original=true',
-                base_url + '?size=2048',
-                base_url + '?quality=100',
-                base_url
-            ]
-            for variant in variants:
-                try:
-                    head = requests.head(variant, timeout=5)
-                    if head.status_code == 200:
-                        return variant
-                except requests.RequestException:
-                    continue
-            return base_url
-
-        img_url = try_additional_variants(img_url)
-
-        # 画像保存ロジックをユーティリティ関数に置き換え
-        image_path = ''
+        # 画像探索: リンク内の<img>、無ければその選手のカード内の<img>（無ければ画像なし）
+        img_tag = a.find('img') or player_card(a).find('img')
+
+        # 画像のファイル名にはここでの name（リンクテキスト全体）を使う
+        player_id = urlparse(href).path.rstrip('/').split('/')[-1]
+        image = None
         if img_tag:
             src = img_tag.get('src') or img_tag.get('data-src') or img_tag.get('data-original')
             if src:
-                img_url = urljoin(url, src)
-                parsed = urlparse(href)
-                player_id = parsed.path.rstrip('/').split('/')[-1]
-                image_path = download_and_process_image(img_url, images_dir, name, player_id)
+                image = (urljoin(url, src), player_id, name)
 
         # もし 'Club:' があればその前を名前として使う
         if 'Club:' in text:
@@ -108,11 +102,83 @@ def scrape_player_data(url):
                 if pos and len(pos) < 40:
                     position = pos
 
-        player_data.append({
+        record = {
             '背番号': '',
             '選手名': name,
             'Position': position,
-            'Image': image_path
-        })
+            'Image': image_path,
+            'ID': player_id,
+        }
+        yield record, image, (player_id, urljoin(url, href))
+
+
+def scrape_player_data(url, client=None, image_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST,
+                       transcoder=None, images=True, players=None, details=None):
+    """
+    IHF のチームページから選手一覧を抽出して返す。
+
+    client (HttpClient) を省略した場合はプロセス共有のクライアントを使う。
+    画像は選手レコードを作り終えてから image_workers 本のスレッドで並列に取得し、
+    同一ホストへの同時リクエストは per_host 件までに抑える。
+    画像のフォーマット変換は transcoder（TranscodePool、省略時はプロセス共有のプール）で
+    ダウンロードと並行して行う。transcoder=False ならダウンロードしたスレッドで変換する。
+    images=False なら画像は取得しない（'Image' は空欄）。
+    players（crawler.Frontier）を渡すと、他のチームで画像を取得済みの選手はその画像を使う。
+    details（enrich.Enricher）を渡すと、選手ページから国籍・クラブ・身長・生年月日を取得して列に加える。
+
+    戻り値: [{'背番号': '', '選手名': '...', 'Position': '...'}, ...]
+    """
+    return list(iter_player_data(url, client, image_workers, per_host, transcoder, ordered=True, images=images,
+                                 players=players, details=details))
+
+
+def iter_player_data(url, client=None, image_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST,
+                     transcoder=None, ordered=False, images=True, players=None, details=None):
+    """scrape_player_data のジェネレータ版（画像の取得・変換が終わった選手から返す。ehf.iter_player_data 参照）。"""
+    client = client or get_default_client()
+    if not images:
+        transcoder = None
+    elif transcoder is None:
+        from image_postprocess import get_default_transcoder
+        transcoder = get_default_transcoder()
+    elif transcoder is False:
+        transcoder = None
 
-    return player_data
+    try:
+        resp = client.get(url, cacheable=True)
+        resp.raise_for_status()
+    except requests.exceptions.RequestException as e:
+        print(f"エラー: URL '{url}' にアクセスできませんでした。詳細: {e}")
+        return
+    client.remember_body(url, resp.content)
+
+    # 画像は選手のカード（祖先要素）の中から探すので、限定パースせずに全体を組み立てる
+    with client.metrics.timer('parse.html'):
+        soup = make_soup(resp.content)
+
+    images_dir = os.path.join('images', 'ihf')
+    if images:
+        os.makedirs(images_dir, exist_ok=True)
+    player_data = []
+    image_jobs = []
+    detail_entries = []
+    for record, image, (player_id, link) in parse_players(soup, url):
+        player_data.append(record)
+        if details is not None and player_id:
+            detail_entries.append((record, f'ihf:{player_id}', link, None))
+        # 画像は後段でまとめて並列に取得する
+        if image and images:
+            img_url, player_id, name = image
+            # ページ内の重複は parse_players で、チームをまたいだ重複は players で除く
+            if players is not None and players.claim_player(f'ihf:{player_id}', url, record):
+                continue
+            image_jobs.append(ImageJob(record, img_url, functools.partial(
+                fetch_player_image, img_url, images_dir, name, player_id, client, transcoder)))
+
+    stream = iter_records(player_data, image_jobs, max_workers=image_workers, ordered=ordered,
+                          limiter=client.host_limiter(per_host))
+    if details is not None:
+        # 選手ページは画像と並行して取得し、レコードを返す前に列を加える
+        stream = details.iter_enriched(stream, detail_entries)
+    yield from stream
+    client.flush_caches()
@@ -0,0 +1,99 @@
+"""画像ジョブの並列実行
+
+選手レコードを先に作っておき、画像の解決・ダウンロードはスレッドプールで
+並列に実行して結果をレコードの 'Image' に書き戻す。
+同一ホストへの同時接続数はホストごとのセマフォ（HostLimiter）で制限する。複数のチームを並行して
+処理する場合は、HttpClient.host_limiter() の共有のリミッターを limiter に渡す。
+ジョブが Future を返した場合（プロセスプールでの画像変換など）は、その完了を待ってから書き戻す。
+"""
+from collections import namedtuple
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from http_client import HostLimiter
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PER_HOST = 4
+
+# record: 書き戻し先の dict / url: ホスト判定用の画像URL
+# func: 引数なしで保存パス（または保存パスを返す Future）を返す callable
+ImageJob = namedtuple('ImageJob', ['record', 'url', 'func'])
+
+
+def _run_one(job, limiter):
+    with limiter.get(job.url):
+        try:
+            return job.func() or ''
+        except Exception as e:
+            print(f"画像取得エラー: {job.url} ({e})")
+            return ''
+
+
+def _result(fut, job):
+    try:
+        return fut.result()
+    except Exception as e:
+        print(f"画像処理エラー: {job.url} ({e})")
+        return ''
+
+
+def iter_image_jobs(jobs, max_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST, limiter=None):
+    """
+    ジョブを並列実行し、'Image' を書き込んだレコードを完了順に返すジェネレータ。
+
+    limiter（HostLimiter）を省略した場合は、この呼び出しだけで per_host 件までに制限する。
+    """
+    jobs = list(jobs)
+    if not jobs:
+        return
+    if limiter is None:
+        limiter = HostLimiter(per_host)
+    workers = max(1, min(max_workers, len(jobs)))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image') as pool:
+        pending = {pool.submit(_run_one, job, limiter): job for job in jobs}
+        try:
+            while pending:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    job = pending.pop(fut)
+                    result = _result(fut, job)
+                    if isinstance(result, Future):
+                        # 後段（画像変換）の完了を待つ
+                        pending[result] = job
+                        continue
+                    job.record['Image'] = result or ''
+                    yield job.record
+        except GeneratorExit:
+            # 呼び出し側が途中でやめた（キャンセル）: 未着手のジョブは実行しない
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+
+
+def iter_records(records, jobs, max_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST, ordered=False,
+                 limiter=None):
+    """
+    records（ロスター順の全レコード）を、画像ジョブが終わったものから返すジェネレータ。
+
+    jobs は records の一部に対する ImageJob。画像の無いレコードはすぐに返す。
+    ordered=True ならロスター順を保ち、先頭から続けて揃った分だけを返す。
+    """
+    records = list(records)
+    waiting = {id(job.record) for job in jobs}
+    if not ordered:
+        for record in records:
+            if id(record) not in waiting:
+                yield record
+        yield from iter_image_jobs(jobs, max_workers=max_workers, per_host=per_host, limiter=limiter)
+        return
+    position = 0
+    for done in iter_image_jobs(jobs, max_workers=max_workers, per_host=per_host, limiter=limiter):
+        waiting.discard(id(done))
+        while position < len(records) and id(records[position]) not in waiting:
+            yield records[position]
+            position += 1
+    yield from records[position:]
+
+
+def run_image_jobs(jobs, max_workers=DEFAULT_MAX_WORKERS, per_host=DEFAULT_PER_HOST, limiter=None):
+    """全ジョブの完了を待つ。レコードは呼び出し側のリストの順序のまま更新される。"""
+    for _ in iter_image_jobs(jobs, max_workers=max_workers, per_host=per_host, limiter=limiter):
+        pass
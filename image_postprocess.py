@@ -0,0 +1,129 @@
+"""画像の後処理（デコード・フォーマット変換・再エンコード）をプロセスプールで行う
+
+Pillow の処理は CPU を使い GIL を握るため、ダウンロードを行うスレッドから切り離して
+CPU コア数のワーカープロセスで実行する。ダウンロードと変換は並行して進む。
+
+既存の画像ディレクトリに対して単独で実行することもできる:
+
+    python image_postprocess.py images/ihf
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from image_utils import transcode_image, file_sha256, MANIFEST_NAME
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp', '.tif', '.tiff')
+
+
+class TranscodePool:
+    """transcode_image を実行するプロセスプール（最初の submit で起動する）。
+
+    Args:
+        max_workers (int): ワーカープロセス数。省略時は CPU コア数。
+    """
+
+    def __init__(self, max_workers=None):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None:
+                # ダウンロード用スレッドが動いている最中に fork しないよう spawn を使う
+                ctx = multiprocessing.get_context('spawn')
+                self._pool = ProcessPoolExecutor(max_workers=self.max_workers, mp_context=ctx)
+            return self._pool
+
+    def submit(self, local_path, source_url='', manifest=True):
+        """変換を予約し、変換後のパスを返す Future を返す。"""
+        return self._executor().submit(transcode_image, local_path, source_url, manifest)
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+
+
+_default_pool = None
+_default_lock = threading.Lock()
+
+
+def get_default_transcoder():
+    """transcoder を渡されなかった呼び出し用のプロセス共有プールを返す。"""
+    global _default_pool
+    with _default_lock:
+        if _default_pool is None:
+            _default_pool = TranscodePool()
+        return _default_pool
+
+
+def processed_checksums(directory):
+    """manifest.jsonl から {ファイル名: 最後に記録された sha256} を読む。"""
+    checksums = {}
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                checksums[entry.get('file')] = entry.get('sha256')
+    except OSError:
+        pass
+    return checksums
+
+
+def iter_image_files(directory, force=False):
+    """変換対象の画像ファイルを列挙する。
+
+    force=False の場合、manifest に記録された sha256 と一致するファイル（変換済み）は除く。
+    """
+    checksums = {} if force else processed_checksums(directory)
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.is_file() or entry.name.startswith('.'):
+            continue
+        if os.path.splitext(entry.name)[1].lower() not in IMAGE_EXTENSIONS:
+            continue
+        known = checksums.get(entry.name)
+        if known and known == file_sha256(entry.path):
+            continue
+        yield entry.path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='既存の画像ディレクトリを並列に変換します。')
+    parser.add_argument('directories', nargs='+', help='画像ディレクトリ（例: images/ihf）')
+    parser.add_argument('--workers', type=int, default=None, help='ワーカープロセス数（デフォルト: CPUコア数）')
+    parser.add_argument('--force', action='store_true', help='manifest 上で変換済みのファイルも再変換する')
+    args = parser.parse_args()
+
+    paths = []
+    for directory in args.directories:
+        paths.extend(iter_image_files(directory, force=args.force))
+    if not paths:
+        print('変換対象の画像はありません。')
+        return
+
+    converted = 0
+    with TranscodePool(args.workers) as pool:
+        futures = {pool.submit(path): path for path in paths}
+        for fut in as_completed(futures):
+            if fut.result():
+                converted += 1
+    print(f'{converted}/{len(paths)} 件の画像を変換しました。')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,171 @@
+"""内容アドレス方式の画像ストア
+
+画像の実体は sha256 をキーに images/store/blobs/<先頭2文字>/<sha256><拡張子> に1つだけ保存し、
+選手ごとのファイル（images/ehf/{pid}_{name}.jpg など）はそこへのシンボリックリンクにする。
+取得元URL -> blob、選手 -> blob の対応は index.json に記録するので、
+同じ写真が別のサイズトークンやチームで出てきても、選手名が変わっても再取得・重複保存しない。
+"""
+import atexit
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+DEFAULT_ROOT = os.path.join('images', 'store')
+# index.json を書き出す最短間隔（秒）。残りは flush() でまとめて書く
+SAVE_INTERVAL = 2.0
+
+
+class ImageStore:
+    """
+    Args:
+        root (str): blobs/ と index.json を置くディレクトリ。
+    """
+
+    def __init__(self, root=DEFAULT_ROOT):
+        self.root = root
+        self.blob_dir = os.path.join(root, 'blobs')
+        self.tmp_dir = os.path.join(root, 'tmp')
+        self._index_path = os.path.join(root, 'index.json')
+        self._lock = threading.Lock()
+        self._urls = {}     # 取得元URL -> blob の相対パス
+        self._players = {}  # 'ehf/<pid>' など -> {'blob': ..., 'url': ..., 'path': ...}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._urls = data.get('urls', {})
+        self._players = data.get('players', {})
+
+    def _save(self, force=False):
+        # 呼び出し側で self._lock を取っていること
+        self._dirty = True
+        if not force and time.time() - self._saved_at < SAVE_INTERVAL:
+            return
+        os.makedirs(self.root, exist_ok=True)
+        tmp = f"{self._index_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'urls': self._urls, 'players': self._players}, f, ensure_ascii=False)
+        os.replace(tmp, self._index_path)
+        self._dirty = False
+        self._saved_at = time.time()
+
+    def flush(self):
+        """未保存の対応表を index.json に書き出す。"""
+        with self._lock:
+            if self._dirty:
+                self._save(force=True)
+
+    def _abs(self, rel):
+        return os.path.join(self.root, rel)
+
+    def temp_path(self, ext=''):
+        """ストア内の作業用ファイル名を返す（blob と同じファイルシステムに置いて rename できるように）。"""
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex + ext)
+
+    def blob_for_url(self, url):
+        """取得元URLに対応する blob のパス（無ければ None）。"""
+        with self._lock:
+            rel = self._urls.get(url)
+        if rel and os.path.exists(self._abs(rel)):
+            return self._abs(rel)
+        return None
+
+    def player(self, key):
+        with self._lock:
+            entry = self._players.get(key)
+        return dict(entry) if entry else None
+
+    def ingest(self, path, url='', sha256=None):
+        """
+        path のファイルを blob として取り込み、blob のパスを返す。
+
+        同じ内容の blob が既にあれば path は捨てる（重複排除）。
+        """
+        if sha256 is None:
+            from image_utils import file_sha256
+            sha256 = file_sha256(path)
+        ext = os.path.splitext(path)[1].lower()
+        rel = os.path.join('blobs', sha256[:2], sha256 + ext)
+        blob = self._abs(rel)
+        os.makedirs(os.path.dirname(blob), exist_ok=True)
+        if os.path.exists(blob):
+            os.remove(path)
+        else:
+            os.replace(path, blob)
+        if url:
+            with self._lock:
+                self._urls[url] = rel
+                self._save()
+        return blob
+
+    def fetch(self, url, client, ext='', timeout=15):
+        """URL の画像を（未取得なら）ダウンロードして取り込み、blob のパスを返す。"""
+        blob = self.blob_for_url(url)
+        if blob:
+            return blob
+        from image_utils import download_to_file
+        tmp = self.temp_path(ext)
+        sha256 = download_to_file(url, tmp, client, timeout=timeout, manifest=False)
+        return self.ingest(tmp, url, sha256)
+
+    def link(self, blob, dest, player_key=None, url=''):
+        """
+        dest に blob へのリンクを作る（既存のファイルやリンクは置き換える）。
+
+        シンボリックリンクが使えない環境ではハードリンク、それも無理ならコピーにする。
+        新しくリンクした場合は画像ディレクトリの manifest.jsonl にもチェックサムを記録する。
+        player_key を渡すと選手 -> blob の対応を記録し、前回と別名なら古いリンクを消す。
+        """
+        if not (os.path.islink(dest) and os.path.realpath(dest) == os.path.realpath(blob)):
+            os.makedirs(os.path.dirname(dest) or '.', exist_ok=True)
+            tmp = f"{dest}.{uuid.uuid4().hex}.link"
+            target = os.path.relpath(blob, os.path.dirname(dest) or '.')
+            try:
+                os.symlink(target, tmp)
+            except (OSError, NotImplementedError):
+                try:
+                    os.link(blob, tmp)
+                except OSError:
+                    shutil.copyfile(blob, tmp)
+            os.replace(tmp, dest)
+            from image_utils import record_checksum
+            sha256 = os.path.splitext(os.path.basename(blob))[0]
+            record_checksum(dest, sha256, os.path.getsize(blob), url)
+
+        if player_key:
+            with self._lock:
+                previous = self._players.get(player_key)
+                self._players[player_key] = {
+                    'blob': os.path.relpath(blob, self.root),
+                    'url': url,
+                    'path': dest,
+                }
+                self._save()
+            old_path = previous and previous.get('path')
+            if old_path and os.path.abspath(old_path) != os.path.abspath(dest) and os.path.islink(old_path):
+                os.remove(old_path)
+        return dest
+
+
+_default_store = None
+_default_lock = threading.Lock()
+
+
+def get_default_store():
+    """store を渡されなかった呼び出し用のプロセス共有ストアを返す。"""
+    global _default_store
+    with _default_lock:
+        if _default_store is None:
+            _default_store = ImageStore()
+            atexit.register(_default_store.flush)
+        return _default_store
@@ -1,86 +1,376 @@
 import os
 import re
+import hashlib
+import json
+import mimetypes
+import threading
+import time
+import uuid
+from concurrent.futures import Future
 from urllib.parse import urljoin, urlparse
-from PIL import Image
 import requests
 
-def download_and_process_image(base_url, images_dir, name, player_id):
+from http_client import get_default_client
+from probe_cache import iter_probes
+from rate_limit import THROTTLE_STATUSES
+from image_store import get_default_store
+
+RESOLUTIONS = ['w2048', 'w1536', 'w1280', 'w1024', 'w512', 'w360', 'w180']
+# これ未満の幅または高さの画像は保存しない
+MIN_DIMENSION = 800
+# 解像度判定のために先頭から読む最大バイト数（JPEG/PNG のヘッダーには十分）
+HEADER_BYTES = 64 * 1024
+# ストリーミングダウンロードのチャンクサイズ
+DOWNLOAD_CHUNK = 64 * 1024
+# 保存した画像のチェックサムを追記するサイドカーファイル（画像ディレクトリごと）
+MANIFEST_NAME = 'manifest.jsonl'
+
+_manifest_lock = threading.Lock()
+
+
+def head_ok(url, client):
+    """HEAD が 200 なら True、それ以外は False、通信エラーとレート制限（429/503）は None（判定不能）。"""
+    try:
+        status = client.head(url, timeout=5).status_code
+    except requests.RequestException:
+        return None
+    if status in THROTTLE_STATUSES:
+        return None
+    return status == 200
+
+
+def _temp_path(local_path):
+    """local_path と同じディレクトリに一時ファイルを作り (file, path) を返す（権限は umask に従う）。"""
+    directory = os.path.dirname(local_path) or '.'
+    tmp = os.path.join(directory, f".{os.path.basename(local_path)}.{uuid.uuid4().hex}.part")
+    return open(tmp, 'xb'), tmp
+
+
+def _remove_quietly(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def record_checksum(local_path, sha256, size, url=''):
+    """画像ディレクトリの manifest.jsonl にチェックサムを1行追記する。"""
+    entry = {'file': os.path.basename(local_path), 'sha256': sha256, 'bytes': size,
+             'url': url, 'ts': int(time.time())}
+    manifest = os.path.join(os.path.dirname(local_path) or '.', MANIFEST_NAME)
+    with _manifest_lock:
+        with open(manifest, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+
+
+def download_to_file(url, local_path, client, timeout=15, manifest=True):
     """
-    高解像度画像をダウンロードし、解像度チェックとフォーマット変換を行う。
+    画像をチャンク単位で一時ファイルに書き込み、完了してから local_path へ rename する。
+
+    途中で失敗した場合は一時ファイルを削除して例外をそのまま送出するので、
+    local_path に書きかけのファイルが残ることはない。
 
     Args:
-        base_url (str): 画像のベースURL。
-        images_dir (str): 保存先ディレクトリ。
-        name (str): 選手名。
-        player_id (str): 選手ID。
+        manifest (bool): True なら sha256 とサイズを manifest.jsonl に記録する。
 
     Returns:
-        str: 保存された画像のローカルパス。失敗した場合は空文字列。
+        str: 書き込んだ内容の sha256（16進）。
     """
-    # 高解像度バリアントを試行
-    def try_higher_resolutions(base_url):
-        resolutions = ['w2048', 'w1536', 'w1280', 'w1024', 'w512', 'w360', 'w180']
-        for res in resolutions:
-            candidate = re.sub(r'w\d+', res, base_url)
-            try:
-                head = requests.head(candidate, timeout=5)
-                if head.status_code == 200:
-                    return candidate
-            except requests.RequestException:
-                continue
-        return base_url
-
-    img_url = try_higher_resolutions(base_url)
-
-    # ファイル名生成と拡張子推定
-    parsed = urlparse(img_url)
-    _, ext = os.path.splitext(parsed.path)
-    if not ext:
-        try:
-            head = requests.head(img_url, timeout=5)
-            content_type = head.headers.get('Content-Type', '')
-            import mimetypes
-            ext = mimetypes.guess_extension(content_type.split(';')[0].strip()) or '.jpg'
-        except requests.RequestException:
-            ext = '.jpg'
-
-    # sanitize name for filename
-    name_slug = re.sub(r'[^0-9A-Za-z一-龥ぁ-んァ-ン\- ]', '', name).strip().replace(' ', '_')[:50]
-    filename = f"{player_id}_{name_slug}{ext}"
-    local_path = os.path.join(images_dir, filename)
-
-    # ダウンロード（重複チェック）
-    if not os.path.exists(local_path):
-        try:
-            r = requests.get(img_url, timeout=15)
-            r.raise_for_status()
-            with open(local_path, 'wb') as wf:
-                wf.write(r.content)
-        except Exception:
-            return ''
+    digest = hashlib.sha256()
+    size = 0
+    wf, tmp = _temp_path(local_path)
+    try:
+        with wf:
+            with client.get(url, stream=True, timeout=timeout, phase='download') as r:
+                r.raise_for_status()
+                for chunk in r.iter_content(DOWNLOAD_CHUNK):
+                    wf.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                expected = r.headers.get('Content-Length')
+                if expected and not r.headers.get('Content-Encoding') and int(expected) != size:
+                    raise IOError(f"incomplete download: {size}/{expected} bytes")
+        os.replace(tmp, local_path)
+    except BaseException:
+        _remove_quietly(tmp)
+        raise
+    if manifest:
+        record_checksum(local_path, digest.hexdigest(), size, url)
+    return digest.hexdigest()
+
 
-    # 解像度チェックとフォーマット変換
+def _save_atomic(img, path, fmt, **params):
+    """Pillow の画像を一時ファイルに保存してから path へ rename する。"""
+    wf, tmp = _temp_path(path)
+    try:
+        with wf:
+            img.save(wf, fmt, **params)
+        os.replace(tmp, path)
+    except BaseException:
+        _remove_quietly(tmp)
+        raise
+
+
+def probe_image_size(url, client, max_bytes=HEADER_BYTES):
+    """
+    画像の先頭だけを取得して (width, height) を返す。判定できなければ None。
+
+    Range ヘッダーで先頭 max_bytes バイトだけを要求する。サーバーが Range を無視して
+    全体を返す場合も、ストリームで読みながらヘッダーを解析できた時点で接続を閉じる。
+    """
+    try:
+        resp = client.get(url, stream=True, timeout=15, phase='probe',
+                          headers={'Range': f'bytes=0-{max_bytes - 1}'})
+    except requests.RequestException:
+        return None
+    try:
+        if resp.status_code not in (200, 206):
+            return None
+        from PIL import ImageFile
+        parser = ImageFile.Parser()
+        read = 0
+        for chunk in resp.iter_content(8192):
+            parser.feed(chunk)
+            if parser.image:
+                return parser.image.size
+            read += len(chunk)
+            if read >= max_bytes:
+                break
+    except Exception:
+        return None
+    finally:
+        resp.close()
+    return None
+
+def transcode_image(local_path, source_url='', manifest=True):
+    """
+    保存済み画像の解像度チェックとフォーマット変換を行う（ネットワークを使わない CPU 処理）。
+
+    別プロセスから呼べるようにモジュール直下の関数にしている。
+    manifest=False の場合は manifest.jsonl に記録しない（画像ストアの作業ファイルなど）。
+
+    Returns:
+        str: 変換後のローカルパス。低解像度で削除した場合や失敗した場合は空文字列。
+    """
+    # Pillow は画像を変換するときに初めて読み込む（変換用のプロセスでも同じ）
+    from PIL import Image
     try:
         with Image.open(local_path) as img:
             width, height = img.size
-            if width < 800 or height < 800:
+            if width < MIN_DIMENSION or height < MIN_DIMENSION:
                 print(f"低解像度画像をスキップ: {local_path} ({width}x{height})")
                 os.remove(local_path)
                 return ''
             # 必要に応じてフォーマットを変換
             if img.format not in ['JPEG', 'PNG']:
                 new_path = local_path.rsplit('.', 1)[0] + '.png'
-                img.save(new_path, 'PNG')
-                os.remove(local_path)
-                return new_path
+                _save_atomic(img, new_path, 'PNG')
             elif img.format == 'JPEG':
                 # JPEGの場合、画質を95に設定して再保存
                 new_path = local_path.rsplit('.', 1)[0] + '.jpg'
-                img.convert('RGB').save(new_path, 'JPEG', quality=95)
-                os.remove(local_path)
-                return new_path
+                _save_atomic(img.convert('RGB'), new_path, 'JPEG', quality=95)
+            else:
+                new_path = local_path
+        # 拡張子が変わった場合のみ元ファイルを消す（同名なら上書き済み）
+        if os.path.abspath(new_path) != os.path.abspath(local_path):
+            os.remove(local_path)
+        if manifest:
+            record_checksum(new_path, file_sha256(new_path), os.path.getsize(new_path), source_url)
+        return new_path
     except Exception as e:
         print(f"画像処理エラー: {e}")
         return ''
 
-    return local_path
\ No newline at end of file
+def _then(future, fn):
+    """future の結果に fn を適用した値を返す新しい Future を作る。"""
+    chained = Future()
+
+    def done(f):
+        try:
+            chained.set_result(fn(f.result()))
+        except Exception as e:
+            chained.set_exception(e)
+
+    future.add_done_callback(done)
+    return chained
+
+def resolution_candidates(base_url):
+    """URL の wXXX トークンを大きいサイズに置き換えたバリアント [(トークン, URL), ...]。"""
+    return [(res, re.sub(r'w\d+', res, base_url)) for res in RESOLUTIONS]
+
+
+# iter_image_fetch が yield する I/O の種類（実行するのは同期版・asyncio 版それぞれのドライバー）
+PROBE = 'probe'                # (PROBE, url) -> True / False / None（判定不能）
+CONTENT_TYPE = 'content_type'  # (CONTENT_TYPE, url) -> Content-Type（取れなければ ''）
+IMAGE_SIZE = 'size'            # (IMAGE_SIZE, url) -> (幅, 高さ) か None
+DOWNLOAD = 'download'          # (DOWNLOAD, url, path) -> 書き込んだ内容の sha256。失敗なら None
+TRANSCODE = 'transcode'        # (TRANSCODE, path, url) -> 変換後のパス。低解像度・失敗なら ''
+
+
+def image_slug(name):
+    """ファイル名に使う選手名（記号を除き、空白は _ に）。"""
+    return re.sub(r'[^0-9A-Za-z一-龥ぁ-んァ-ン\- ]', '', name).strip().replace(' ', '_')[:50]
+
+
+def iter_image_fetch(base_url, images_dir, player_id, name, store, variants=(), probe_cache=None,
+                     check_size=False, transcode=False):
+    """
+    選手画像を保存する手順（EHF / IHF、同期版・asyncio 版で共通）。
+
+    probe_cache.iter_probes と同じく、ネットワーク・CPU 処理が必要になると (種類, 引数...) を yield し、
+    send() で結果を受け取る。保存先のパス（失敗なら ''）は StopIteration.value で返す。
+    画像ストア・プローブキャッシュのファイル操作は手順の中で行う。
+
+    Args:
+        variants (sequence): 順に解決する高解像度バリアントの候補 [candidates(url) -> [(トークン, URL), ...], ...]。
+        check_size (bool): 本体を取得する前にヘッダーで解像度を確認し、MIN_DIMENSION 未満なら取得しない。
+        transcode (bool): 取得後に解像度チェックとフォーマット変換（transcode_image）を行う。
+    """
+    img_url = base_url
+    for candidates in variants:
+        steps = iter_probes(img_url, candidates(img_url), probe_cache)
+        try:
+            url = next(steps)
+            while True:
+                url = steps.send((yield PROBE, url))
+        except StopIteration as done:
+            img_url = done.value or img_url
+
+    slug = image_slug(name)
+    player_key = f"{os.path.basename(os.path.normpath(images_dir))}/{player_id}" if player_id else None
+
+    def player_path(ext):
+        return os.path.join(images_dir, f"{player_id}_{slug}{ext}" if player_id else f"{slug}{ext}")
+
+    # 取得済みのURLならストア内の実体にリンクするだけ（選手名が変わっても再取得しない）
+    blob = store.blob_for_url(img_url)
+    if blob:
+        return store.link(blob, player_path(os.path.splitext(blob)[1]), player_key, img_url)
+
+    # 拡張子が無ければ Content-Type から推定
+    ext = os.path.splitext(urlparse(img_url).path)[1]
+    if not ext:
+        content_type = yield CONTENT_TYPE, img_url
+        ext = mimetypes.guess_extension((content_type or '').split(';')[0].strip()) or '.jpg'
+
+    local_path = player_path(ext)
+    # ストア導入前に保存されたファイルはそのまま使う
+    # （一時ファイル経由で書いているので、local_path があれば完全に保存・変換済み）
+    if os.path.exists(local_path):
+        return local_path
+
+    if check_size:
+        # 本体を取得する前にヘッダーだけで解像度を確認し、小さすぎる画像は取得しない
+        size = yield IMAGE_SIZE, img_url
+        if size and (size[0] < MIN_DIMENSION or size[1] < MIN_DIMENSION):
+            print(f"低解像度画像をスキップ: {img_url} ({size[0]}x{size[1]})")
+            return ''
+
+    work_path = store.temp_path(ext)
+    # チェックサムはストアに取り込むときに記録する
+    sha256 = yield DOWNLOAD, img_url, work_path
+    if sha256 is None:
+        return ''
+    if not transcode:
+        return store.link(store.ingest(work_path, img_url, sha256), local_path, player_key, img_url)
+
+    converted = yield TRANSCODE, work_path, img_url
+    if not converted:
+        return ''
+    # 変換後のファイルをストアに取り込み、選手ごとのパスからリンクする
+    blob = store.ingest(converted, img_url)
+    return store.link(blob, player_path(os.path.splitext(converted)[1]), player_key, img_url)
+
+
+def content_type(url, client):
+    """HEAD の Content-Type（取れなければ ''）。"""
+    try:
+        return client.head(url, allow_redirects=True, timeout=7, phase='content_type').headers.get('Content-Type', '')
+    except requests.RequestException:
+        return ''
+
+
+def _resume(steps, value):
+    """変換の結果を手順に渡して最後まで進める（変換の後はファイル操作だけ）。"""
+    try:
+        op = steps.send(value)
+    except StopIteration as done:
+        return done.value or ''
+    steps.close()
+    raise RuntimeError(f"unexpected step after transcode: {op[0]}")
+
+
+def run_image_fetch(steps, client, probe, transcoder=None):
+    """
+    iter_image_fetch の手順を HttpClient で実行し、保存先のパス（失敗なら ''）を返す。
+
+    probe(url) は PROBE の判定（True / False / None）。transcoder（TranscodePool）を渡すと
+    変換はプロセスプールで行い、保存先のパスの Future を返す。
+    """
+    try:
+        op = next(steps)
+        while True:
+            kind = op[0]
+            if kind == PROBE:
+                result = probe(op[1])
+            elif kind == CONTENT_TYPE:
+                result = content_type(op[1], client)
+            elif kind == IMAGE_SIZE:
+                result = probe_image_size(op[1], client)
+            elif kind == DOWNLOAD:
+                try:
+                    result = download_to_file(op[1], op[2], client, manifest=False)
+                except Exception:
+                    result = None
+            elif kind == TRANSCODE:
+                if transcoder is not None:
+                    # プール側の時間は測れないので、投入から完了まで（待ち時間込み）を記録する
+                    started = time.perf_counter()
+                    future = transcoder.submit(op[1], op[2], False)
+                    future.add_done_callback(
+                        lambda f: client.metrics.add_time('encode.pool', time.perf_counter() - started))
+                    return _then(future, lambda converted: _resume(steps, converted))
+                with client.metrics.timer('encode'):
+                    result = transcode_image(op[1], op[2], manifest=False)
+            else:
+                raise ValueError(f"unknown step: {kind}")
+            op = steps.send(result)
+    except StopIteration as done:
+        return done.value or ''
+
+
+def download_and_process_image(base_url, images_dir, name, player_id, client=None, transcoder=None,
+                               store=None, variants=None):
+    """
+    高解像度画像をダウンロードし、解像度チェックとフォーマット変換を行う。
+
+    Args:
+        base_url (str): 画像のベースURL。
+        images_dir (str): 保存先ディレクトリ。
+        name (str): 選手名。
+        player_id (str): 選手ID。
+        client (HttpClient): 共有HTTPクライアント。省略時はプロセス共有のものを使う。
+        transcoder (TranscodePool): 指定するとフォーマット変換をプロセスプールで行い、
+            変換結果（ローカルパス）の Future を返す。
+        store (ImageStore): 画像の実体を置く内容アドレス方式のストア。省略時は images/store。
+            保存先のファイルはストア内の実体へのリンクになる。
+        variants (sequence): 試す高解像度バリアント（iter_image_fetch 参照）。省略時は resolution_candidates。
+
+    Returns:
+        str: 保存された画像のローカルパス。失敗した場合は空文字列。
+    """
+    client = client or get_default_client()
+    store = store or get_default_store()
+    # 高解像度バリアントの結果はプローブキャッシュで実行をまたいで再利用する
+    steps = iter_image_fetch(base_url, images_dir, player_id, name, store,
+                             variants=variants or (resolution_candidates,), probe_cache=client.probe_cache,
+                             check_size=True, transcode=True)
+    return run_image_fetch(steps, client, lambda u: head_ok(u, client), transcoder)
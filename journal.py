@@ -0,0 +1,149 @@
+"""一括取得のジョブジャーナル（途中から再開するための追記専用ログ）
+
+--batch / --competition の実行中、見つけたチームURLの一覧と、処理が終わったチーム（選手レコード付き）を
+JSON Lines で1件ずつ追記する。途中で止まった（Ctrl-C・ネットワーク断・プロセス終了）ジョブを
+--resume で再実行すると、ジャーナルに記録済みのチームは取得せずに記録したレコードを使い、
+残りのチームだけを取得する。
+
+チームの途中で止まった場合はそのチームを最初から取り直すが、取得済みの画像は画像ストア
+（images/store）、ページと API の応答は HTTP 応答キャッシュ（.cache/http）から再利用される。
+
+    {"event": "urls", "ts": ..., "urls": [...]}
+    {"event": "team", "ts": ..., "url": "...", "records": [...]}
+    {"event": "done", "ts": ...}
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_DIR = os.path.join('.cache', 'jobs')
+# 末尾の不完全な行を探すときに一度に読むバイト数
+_TAIL_CHUNK = 64 * 1024
+
+
+def read_log(path):
+    """JSON Lines の追記ログを先頭から読む（ファイルが無ければ何も返さない）。壊れた行は飛ばす。"""
+    try:
+        f = open(path, 'r', encoding='utf-8')
+    except OSError:
+        return
+    with f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                # 書き込み途中で止まった最終行
+                continue
+
+
+def repair_tail(path):
+    """
+    書き込み途中で止まった最終行（改行で終わっていない部分）を切り捨てる。
+
+    そのまま追記すると次の行がその断片の後ろにつながり、次に読むときに両方とも読めなくなるため。
+    """
+    try:
+        f = open(path, 'r+b')
+    except OSError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            start = max(0, pos - _TAIL_CHUNK)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            i = chunk.rfind(b'\n')
+            if i >= 0:
+                pos = start + i + 1
+                break
+            pos = start
+        if pos != end:
+            f.truncate(pos)
+
+
+def open_log(path, resume=True):
+    """追記用にログを開く。resume=False なら空にし、True なら末尾の不完全な行を直してから追記する。"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if resume:
+        repair_tail(path)
+    return open(path, 'a' if resume else 'w', encoding='utf-8')
+
+
+def default_journal_path(target, directory=DEFAULT_DIR):
+    """ジョブの対象（URL一覧ファイルのパスや大会ページURL）ごとのジャーナルのパス。"""
+    if os.path.exists(target):
+        target = os.path.abspath(target)
+    return os.path.join(directory, hashlib.sha256(target.encode('utf-8')).hexdigest()[:16] + '.jsonl')
+
+
+class JobJournal:
+    """
+    Args:
+        path (str): ジャーナルファイル。
+        resume (bool): True なら既存のジャーナルを読み込んで続きから、False なら空にして始める。
+            前回のジョブが最後まで終わっていた場合は再開せずに空から始める。
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.urls = None       # 記録済みのチームURL一覧（無ければ None）
+        self.completed = {}    # チームURL -> 選手レコードのリスト
+        self.finished = False
+        self._lock = threading.Lock()
+        if resume:
+            self._load()
+            if self.finished:
+                print(f"前回のジョブは完了しているので最初から実行します: {path}")
+                self.urls, self.completed, self.finished = None, {}, False
+                resume = False
+        self._file = open_log(path, resume)
+
+    def _load(self):
+        for entry in read_log(self.path):
+            event = entry.get('event')
+            if event == 'urls':
+                self.urls = entry['urls']
+            elif event == 'team':
+                self.completed[entry['url']] = entry['records']
+            elif event == 'done':
+                self.finished = True
+
+    def _append(self, entry):
+        entry = dict(entry, ts=round(time.time(), 3))
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + '\n')
+            # プロセスが落ちても書いた行は残るように、1件ごとに OS へ渡す
+            self._file.flush()
+
+    def record_urls(self, urls):
+        self.urls = list(urls)
+        self._append({'event': 'urls', 'urls': self.urls})
+
+    def record_team(self, url, records):
+        """チームの処理が終わったことを記録する（選手が取れなかったチームは記録せず、再開時に取り直す）。"""
+        if not records:
+            return
+        with self._lock:
+            self.completed[url] = records
+        self._append({'event': 'team', 'url': url, 'records': records})
+
+    def finish(self):
+        self.finished = True
+        self._append({'event': 'done'})
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
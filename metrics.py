@@ -0,0 +1,228 @@
+"""リクエスト単位の計測とタイミングレポート
+
+HttpClient は送信したリクエストを1件ずつ Metrics.record_request() に渡す
+（phase・ホスト・ステータス・バイト数・所要時間・キャッシュ結果）。
+パースや画像の再エンコードは Metrics.timer() で区間の時間を測る。
+集計は (phase, host, status, cache) ごとに保持し、
+scrap.py の最後に表として表示するほか、JSON Lines（1リクエスト1行）や
+Prometheus のテキスト形式でも書き出せる。
+"""
+import json
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+# phase の表示順
+PHASES = ('page', 'api', 'detail', 'probe', 'content_type', 'download')
+
+
+def _status_label(status):
+    return 'error' if status is None else str(status)
+
+
+class Metrics:
+    """
+    Args:
+        jsonl_path (str): 指定すると1リクエストごとに1行の JSON をこのファイルに追記する。
+    """
+
+    def __init__(self, jsonl_path=None):
+        self._lock = threading.Lock()
+        self._requests = {}  # (phase, host, status, cache) -> [件数, バイト数, 合計秒, 最大秒]
+        self._timers = {}    # 名前 -> [件数, 合計秒, 最大秒]
+        self._pending = []   # ストリームで本文を読み終わっていない記録
+        self._jsonl = open(jsonl_path, 'a', encoding='utf-8') if jsonl_path else None
+
+    def record_request(self, method, url, phase, status, latency, cache='', nbytes=0, pending=False):
+        """
+        1リクエストを記録して、記録（dict）を返す。nbytes は受信した本文のバイト数。
+
+        pending=True はまだ本文を読んでいないストリームの応答で、読み終えたときに
+        finish_request() でバイト数を確定させる（report 時に読み終わっていなければ、そこまでの分で確定させる）。
+        """
+        entry = {
+            'ts': round(time.time(), 3),
+            'method': method,
+            'url': url,
+            'host': urlparse(url).netloc.lower(),
+            'phase': phase,
+            'status': status,
+            'latency': round(latency, 4),
+            'bytes': nbytes,
+            'cache': cache,
+        }
+        if pending:
+            with self._lock:
+                self._pending.append(entry)
+        else:
+            self._finish(entry)
+        return entry
+
+    def finish_request(self, entry, nbytes):
+        """pending=True で記録したリクエストを、読んだ本文のバイト数で確定させる（2回目以降は何もしない）。"""
+        with self._lock:
+            for i, pending in enumerate(self._pending):
+                if pending is entry:
+                    del self._pending[i]
+                    break
+            else:
+                return
+        entry['bytes'] = nbytes
+        self._finish(entry)
+
+    def _add(self, entry, sign):
+        # 呼び出し側で self._lock を取っていること
+        key = (entry['phase'], entry['host'], _status_label(entry['status']), entry['cache'])
+        agg = self._requests.setdefault(key, [0, 0, 0.0, 0.0])
+        agg[0] += sign
+        agg[1] += sign * entry['bytes']
+        agg[2] += sign * entry['latency']
+        agg[3] = max(agg[3], entry['latency'])
+
+    def _finish(self, entry):
+        with self._lock:
+            entry['_done'] = True
+            self._add(entry, 1)
+            if self._jsonl is not None:
+                line = {k: v for k, v in entry.items() if not k.startswith('_')}
+                self._jsonl.write(json.dumps(line) + '\n')
+
+    def flush_pending(self):
+        """本文を読み終わっていないストリームの応答を、ここまでに読んだバイト数で確定させる。"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        for entry in pending:
+            self._finish(entry)
+
+    def add_time(self, name, seconds):
+        with self._lock:
+            agg = self._timers.setdefault(name, [0, 0.0, 0.0])
+            agg[0] += 1
+            agg[1] += seconds
+            agg[2] = max(agg[2], seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """with metrics.timer('parse'): ... の区間の時間を name に加算する。"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def request_rows(self):
+        """phase・ホストごとの集計 [(phase, host, 件数, 400以上・通信エラーの数, キャッシュヒット数, バイト数, 合計秒, 最大秒), ...]"""
+        self.flush_pending()
+        rows = {}
+        with self._lock:
+            for (phase, host, status, cache), (count, nbytes, total, peak) in self._requests.items():
+                row = rows.setdefault((phase, host), [0, 0, 0, 0, 0.0, 0.0])
+                row[0] += count
+                if status == 'error' or int(status) >= 400:
+                    row[1] += count
+                if cache == 'hit':
+                    row[2] += count
+                row[3] += nbytes
+                row[4] += total
+                row[5] = max(row[5], peak)
+        order = {phase: i for i, phase in enumerate(PHASES)}
+        return [(phase, host, *values) for (phase, host), values
+                in sorted(rows.items(), key=lambda kv: (order.get(kv[0][0], len(order)), kv[0]))]
+
+    def timer_rows(self):
+        with self._lock:
+            return [(name, *values) for name, values in sorted(self._timers.items())]
+
+    def format_table(self):
+        """リクエストと処理時間の集計表（文字列）。"""
+        lines = []
+        rows = self.request_rows()
+        if rows:
+            # probe の 404 は「そのサイズは無い」なので失敗ではない（エラー列ではなくステータスで数える）
+            header = ('phase', 'host', 'requests', 'status>=400', 'cache hits', 'KB', 'total s', 'avg ms', 'max ms')
+            table = [header]
+            totals = [0, 0, 0, 0, 0.0]
+            for phase, host, count, errors, hits, nbytes, total, peak in rows:
+                table.append((phase, host, count, errors, hits, f"{nbytes / 1024:.0f}", f"{total:.2f}",
+                              f"{total / count * 1000:.0f}" if count else '-', f"{peak * 1000:.0f}"))
+                for i, v in enumerate((count, errors, hits, nbytes, total)):
+                    totals[i] += v
+            table.append(('total', '', totals[0], totals[1], totals[2], f"{totals[3] / 1024:.0f}",
+                          f"{totals[4]:.2f}", '', ''))
+            lines.extend(_align(table))
+        timers = self.timer_rows()
+        if timers:
+            if lines:
+                lines.append('')
+            table = [('stage', 'count', 'total s', 'avg ms', 'max ms')]
+            for name, count, total, peak in timers:
+                table.append((name, count, f"{total:.2f}", f"{total / count * 1000:.0f}" if count else '-',
+                              f"{peak * 1000:.0f}"))
+            lines.extend(_align(table))
+        return '\n'.join(lines)
+
+    def prometheus_text(self):
+        """Prometheus のテキスト形式（node_exporter の textfile collector などで読める）。"""
+        self.flush_pending()
+        out = [
+            '# HELP scraper_http_requests_total HTTP requests sent by the scraper.',
+            '# TYPE scraper_http_requests_total counter',
+        ]
+        with self._lock:
+            requests = sorted(self._requests.items())
+            timers = sorted(self._timers.items())
+        labelled = []
+        for (phase, host, status, cache), agg in requests:
+            labels = f'phase="{phase}",host="{host}",status="{status}",cache="{cache or "none"}"'
+            labelled.append((labels, agg))
+            out.append(f'scraper_http_requests_total{{{labels}}} {agg[0]}')
+        out += ['# HELP scraper_http_response_bytes_total Response body bytes received.',
+                '# TYPE scraper_http_response_bytes_total counter']
+        out += [f'scraper_http_response_bytes_total{{{labels}}} {agg[1]}' for labels, agg in labelled]
+        out += ['# HELP scraper_http_request_seconds Time until response headers were received.',
+                '# TYPE scraper_http_request_seconds summary']
+        for labels, agg in labelled:
+            out.append(f'scraper_http_request_seconds_sum{{{labels}}} {agg[2]:.6f}')
+            out.append(f'scraper_http_request_seconds_count{{{labels}}} {agg[0]}')
+        out += ['# HELP scraper_stage_seconds Time spent in parse/encode stages.',
+                '# TYPE scraper_stage_seconds summary']
+        for name, (count, total, _) in timers:
+            out.append(f'scraper_stage_seconds_sum{{stage="{name}"}} {total:.6f}')
+            out.append(f'scraper_stage_seconds_count{{stage="{name}"}} {count}')
+        return '\n'.join(out) + '\n'
+
+    def write_prometheus(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+
+    def close(self):
+        self.flush_pending()
+        with self._lock:
+            if self._jsonl is not None:
+                self._jsonl.close()
+                self._jsonl = None
+
+
+def _align(table):
+    widths = [max(len(str(row[i])) for row in table) for i in range(len(table[0]))]
+    return ['  '.join(str(v).ljust(w) if i < 2 else str(v).rjust(w) for i, (v, w) in enumerate(zip(row, widths)))
+            for row in table]
+
+
+_default_metrics = None
+_default_lock = threading.Lock()
+
+
+def get_default_metrics():
+    """metrics を渡されなかった呼び出し用のプロセス共有の集計を返す。"""
+    global _default_metrics
+    with _default_lock:
+        if _default_metrics is None:
+            _default_metrics = Metrics()
+        return _default_metrics
+
+
+def timer(name, metrics=None):
+    """metrics（省略時はプロセス共有）の timer()。"""
+    return (metrics or get_default_metrics()).timer(name)
@@ -0,0 +1,204 @@
+"""解像度バリアント探索の永続キャッシュ
+
+画像URLごとに「どのサイズのバリアントが存在したか」を記録し、実行をまたいで再利用する。
+各候補URLの成否（存在する / 存在しない）も TTL 付きで保持し、既知の「存在しない」候補は確認を省く。
+候補は常に高解像度から順に試す（過去に小さいサイズで当たったホストでも、より大きいサイズを先に確認する）。
+
+さらにホストごとにトークン（w2048 など）の成否を数え、そのホストで一度も存在したことが無く
+存在しなかったことのあるトークンは、次の選手からは確認しない（順序は変えずに飛ばすだけ）。
+RECHECK_AFTER 回飛ばしたら一度だけ確認し直すので、サーバー側で大きいサイズが増えても追従する。
+"""
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_PATH = os.path.join('.cache', 'probe_cache.json')
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_NEGATIVE_TTL = 24 * 3600
+# 存在しないと分かったトークンを、確認し直すまでに飛ばす回数
+RECHECK_AFTER = 16
+
+
+class ProbeCache:
+    """
+    Args:
+        path (str): キャッシュファイルのパス（JSON）。
+        ttl (float): 存在したバリアントの記録を保持する秒数。
+        negative_ttl (float): 存在しなかった候補の記録を保持する秒数。
+    """
+
+    def __init__(self, path=DEFAULT_PATH, ttl=DEFAULT_TTL, negative_ttl=DEFAULT_NEGATIVE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._urls = {}      # 候補URL -> {'ok': bool, 'ts': float}
+        self._resolved = {}  # 元URL -> {'url': 採用したバリアント, 'ts': float}
+        # 'ホスト token' -> {'ok': 存在したことがあるか, 'misses': int, 'skips': int, 'ts': float}
+        self._tokens = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._urls = data.get('urls', {})
+        self._resolved = data.get('resolved', {})
+        self._tokens = data.get('tokens', {})
+        self._evict(time.time())
+
+    def _expired(self, entry, now):
+        ttl = self.ttl if entry.get('ok', True) else self.negative_ttl
+        return now - entry.get('ts', 0) > ttl
+
+    def _evict(self, now):
+        for table in (self._urls, self._resolved, self._tokens):
+            for key in [k for k, v in table.items() if self._expired(v, now)]:
+                del table[key]
+
+    def lookup(self, url):
+        """候補URLの既知の結果を返す。True / False / None（未知または期限切れ）。"""
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is None or self._expired(entry, time.time()):
+                return None
+            return entry['ok']
+
+    def store(self, url, ok):
+        with self._lock:
+            self._urls[url] = {'ok': bool(ok), 'ts': time.time()}
+            self._dirty = True
+
+    def resolved(self, base_url):
+        """以前 base_url に対して採用したバリアントURLを返す（無ければ None）。"""
+        with self._lock:
+            entry = self._resolved.get(base_url)
+            if entry is None or self._expired(entry, time.time()):
+                return None
+            return entry['url']
+
+    def remember(self, base_url, variant_url):
+        with self._lock:
+            self._resolved[base_url] = {'url': variant_url, 'ts': time.time()}
+            self._dirty = True
+
+    @staticmethod
+    def _token_key(url, token):
+        return f"{urlparse(url).netloc.lower()} {token}"
+
+    def skip_token(self, url, token):
+        """
+        候補URLのホストでこのトークンが一度も存在せず、存在しなかったことがあれば True（確認を省く）。
+
+        RECHECK_AFTER 回続けて飛ばしたら False を返して確認し直させる。
+        """
+        key = self._token_key(url, token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None or entry['ok'] or self._expired(entry, time.time()):
+                return False
+            if entry['skips'] >= RECHECK_AFTER:
+                entry['skips'] = 0
+                return False
+            entry['skips'] += 1
+            return True
+
+    def learn_token(self, url, token, ok):
+        """確認した候補URLの結果をホストとトークンの組で数える。"""
+        key = self._token_key(url, token)
+        with self._lock:
+            entry = self._tokens.get(key)
+            if entry is None or self._expired(entry, time.time()):
+                entry = self._tokens[key] = {'ok': False, 'misses': 0, 'skips': 0}
+            if ok:
+                entry['ok'] = True
+            else:
+                entry['misses'] += 1
+            entry['ts'] = time.time()
+            self._dirty = True
+
+    def save(self):
+        """変更があればアトミックに書き出す。期限切れのエントリはここで捨てる。"""
+        with self._lock:
+            if not self._dirty:
+                return
+            self._evict(time.time())
+            data = {'urls': dict(self._urls), 'resolved': dict(self._resolved),
+                    'tokens': {k: dict(v) for k, v in self._tokens.items()}}
+            self._dirty = False
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.probe_cache.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"プローブキャッシュを保存できませんでした: {e}")
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+
+
+def resolve_variant(base_url, candidates, probe, cache=None):
+    """
+    候補を順に確認し、最初に存在したバリアントURLを返す（全滅なら None）。
+
+    Args:
+        base_url (str): 元の画像URL（キャッシュのキー）。
+        candidates (list): [(トークン, 候補URL), ...] 優先度の高い順。
+        probe (callable): 候補URLを受け取り True / False / None（判定不能）を返す関数。
+        cache (ProbeCache): 省略時はキャッシュせずに毎回確認する。
+    """
+    steps = iter_probes(base_url, candidates, cache)
+    try:
+        url = next(steps)
+        while True:
+            url = steps.send(probe(url))
+    except StopIteration as done:
+        return done.value
+
+
+def iter_probes(base_url, candidates, cache=None):
+    """
+    resolve_variant の本体。実際に確認が必要な候補URLを yield し、send() で結果
+    （True / False / None）を受け取る。解決したURL（全滅なら None）は StopIteration.value で返す。
+
+    確認の仕方（同期の HEAD、asyncio のコルーチンなど）を呼び出し側で選べるようにしている。
+    キャッシュは既知の「存在しない」候補と、同じホストで存在したことの無いトークンを飛ばすためだけに使い、
+    候補の順序（高解像度優先）は変えない。
+    """
+    if cache is None:
+        for _, url in candidates:
+            if (yield url):
+                return url
+        return None
+
+    hit = cache.resolved(base_url)
+    if hit:
+        return hit
+
+    for token, url in candidates:
+        ok = cache.lookup(url)
+        if ok is False:
+            continue
+        if ok is None:
+            if cache.skip_token(url, token):
+                continue
+            ok = yield url
+            # 通信エラーなど判定不能な結果はキャッシュしない
+            if ok is None:
+                continue
+            cache.store(url, ok)
+            cache.learn_token(url, token, ok)
+        if ok:
+            cache.remember(base_url, url)
+            return url
+    return None
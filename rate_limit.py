@@ -0,0 +1,147 @@
+"""ホストごとのトークンバケットと優先度付きのリクエストスケジューラ
+
+HttpClient は送信前に RequestScheduler.acquire() で順番を待つ。
+ホストごとに rate（毎秒のリクエスト数）と burst（まとめて送れる数）のトークンバケットを持ち、
+待ち行列では優先度の高いもの（ページ・API）が画像のダウンロードやバリアント探索より先に送られる。
+429/503 の Retry-After を受け取ると、そのホストへの送信をその時刻まで止める。
+待ち行列の長さはホストごとに max_queue までで、溢れた呼び出しは空きが出るまでブロックする。
+"""
+import email.utils
+import heapq
+import itertools
+import threading
+import time
+from urllib.parse import urlparse
+
+DEFAULT_RATE = 8.0
+DEFAULT_BURST = 8
+DEFAULT_MAX_QUEUE = 64
+# Retry-After が無い 429/503 のときに止める秒数
+DEFAULT_RETRY_AFTER = 1.0
+# Retry-After を信用する上限（極端な値で処理全体が止まらないように）
+MAX_RETRY_AFTER = 120.0
+
+# 数値が小さいほど先に送る
+PRIORITIES = {
+    'page': 0,
+    'api': 0,
+    'detail': 1,
+    'download': 1,
+    'content_type': 1,
+    'probe': 2,
+}
+THROTTLE_STATUSES = (429, 503)
+
+
+def parse_retry_after(value, now=None):
+    """Retry-After ヘッダー（秒数または HTTP-date）を待ち秒数に変換する。解釈できなければ None。"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when is None:
+        return None
+    return max(0.0, when.timestamp() - (now if now is not None else time.time()))
+
+
+class _Host:
+    def __init__(self, burst, now):
+        self.cond = threading.Condition()
+        self.tokens = float(burst)
+        self.updated = now
+        self.blocked_until = 0.0
+        self.waiting = []  # (優先度, 到着順) のヒープ
+
+
+class RequestScheduler:
+    """
+    Args:
+        rate (float): ホストごとの毎秒のリクエスト数。0 や None なら制限しない（Retry-After だけ守る）。
+        burst (int): バケットの容量（連続して待たずに送れる数）。
+        max_queue (int): ホストごとの待ち行列の上限。
+        clock (callable): 単調増加の時計（テスト用。省略時は time.monotonic）。
+    """
+
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST, max_queue=DEFAULT_MAX_QUEUE,
+                 clock=time.monotonic):
+        self.rate = rate or None
+        self.burst = max(1, burst)
+        self.max_queue = max(1, max_queue)
+        self.clock = clock
+        self._hosts = {}
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+
+    def _host(self, url):
+        host = urlparse(url).netloc.lower()
+        with self._lock:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _Host(self.burst, self.clock())
+        return state
+
+    def _refill(self, state, now):
+        if self.rate:
+            state.tokens = min(self.burst, state.tokens + (now - state.updated) * self.rate)
+        state.updated = now
+
+    def acquire(self, url, phase='page'):
+        """url のホストへ1リクエスト送ってよくなるまで待つ。"""
+        state = self._host(url)
+        ticket = (PRIORITIES.get(phase, PRIORITIES['page']), next(self._seq))
+        with state.cond:
+            while len(state.waiting) >= self.max_queue:
+                state.cond.wait()
+            heapq.heappush(state.waiting, ticket)
+            try:
+                while True:
+                    now = self.clock()
+                    self._refill(state, now)
+                    if state.waiting[0] != ticket:
+                        # 先に送るべきリクエストがある
+                        state.cond.wait()
+                        continue
+                    delay = self._delay(state, now)
+                    if delay <= 0:
+                        if self.rate:
+                            state.tokens -= 1
+                        return
+                    state.cond.wait(delay)
+            finally:
+                state.waiting.remove(ticket)
+                heapq.heapify(state.waiting)
+                state.cond.notify_all()
+
+    def _delay(self, state, now):
+        delay = state.blocked_until - now
+        if delay <= 0 and self.rate and state.tokens < 1:
+            delay = (1 - state.tokens) / self.rate
+        return max(0.0, delay)
+
+    def delay(self, url):
+        """url のホストへ次の1リクエストを送れるまでの秒数（今すぐ送れるなら 0。待ち行列は数えない）。"""
+        state = self._host(url)
+        with state.cond:
+            now = self.clock()
+            self._refill(state, now)
+            return self._delay(state, now)
+
+    def defer(self, url, seconds):
+        """url のホストへの送信を seconds 秒止める（Retry-After 用）。"""
+        seconds = min(MAX_RETRY_AFTER, max(0.0, seconds))
+        state = self._host(url)
+        with state.cond:
+            state.blocked_until = max(state.blocked_until, self.clock() + seconds)
+            state.cond.notify_all()
+
+    def observe(self, url, response):
+        """応答を見て、429/503 ならそのホストを Retry-After（無ければ既定値）だけ止める。"""
+        if response.status_code not in THROTTLE_STATUSES:
+            return
+        delay = parse_retry_after(response.headers.get('Retry-After'))
+        self.defer(url, DEFAULT_RETRY_AFTER if delay is None else delay)
@@ -0,0 +1,33 @@
+"""ホストごとのスクレイパーの登録表
+
+URL のホストから使うスクレイパーモジュール（ehf / ihf）を決める。同期版（scrap.py）と
+asyncio 版（async_engine.py）の両方が同じ表で振り分ける。モジュールは URL に合うものだけを読み込む。
+"""
+import importlib
+from collections import namedtuple
+from urllib.parse import urlparse
+
+# module: スクレイパーのモジュール名
+# options: その scrape_player_data / iter_player_data が url・client のほかに受け付ける引数
+Scraper = namedtuple('Scraper', ['module', 'options'])
+SCRAPERS = {
+    'ihf.info': Scraper('ihf', ('image_workers', 'per_host', 'transcoder', 'images', 'players', 'details')),
+    'eurohandball.com': Scraper('ehf', ('image_workers', 'per_host', 'state', 'images', 'players', 'details')),
+}
+# その他のホストのページは EHF のスクレイパー（HTML の表の走査）で試す
+DEFAULT_SCRAPER = SCRAPERS['eurohandball.com']
+
+
+def find_scraper(url):
+    """URL のホスト（登録したホストかそのサブドメイン）に対応する Scraper。"""
+    netloc = urlparse(url).netloc.lower().split(':')[0]
+    for host, scraper in SCRAPERS.items():
+        if netloc == host or netloc.endswith('.' + host):
+            return scraper
+    return DEFAULT_SCRAPER
+
+
+def load_scraper(url):
+    """URL に対応するスクレイパーモジュールを読み込み、(モジュール, 受け付ける引数) を返す。"""
+    scraper = find_scraper(url)
+    return importlib.import_module(scraper.module), scraper.options
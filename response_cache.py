@@ -0,0 +1,204 @@
+"""条件付きリクエスト用のレスポンスキャッシュ
+
+チームページや clubdetails API の応答本文を ETag / Last-Modified と一緒にディスクへ保存し、
+次回以降は If-None-Match / If-Modified-Since を付けて問い合わせる。
+304 が返ればキャッシュ済みの本文で 200 の応答を組み立てて返すので、呼び出し側は
+通常の requests.Response と同じように .content / .json() を使える。
+合計サイズが上限を超えたら最後に使われた時刻が古いものから削除する（LRU）。
+キャッシュヒットでの最終使用時刻の更新はメモリ上だけで行い、インデックスは store() と save()
+（HttpClient.flush_caches / close から呼ばれる）でまとめて書き出す。
+stream=True の応答は呼び出し側が読んだチャンクを手元に溜め、最後まで読まれたときだけ保存する
+（保存のために残りを読むと、ehf.extract_club_details のように途中で読むのをやめられなくなるため）。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from urllib.parse import urlencode
+
+DEFAULT_DIR = os.path.join('.cache', 'http')
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+def cache_key(url, params=None):
+    """URL とクエリパラメータ（順不同）からキャッシュキーを作る。"""
+    if params:
+        url = url + '?' + urlencode(sorted(params.items()))
+    return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """
+    Args:
+        directory (str): 本文ファイルとインデックスの保存先。
+        max_bytes (int): 本文の合計サイズの上限。
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._index_path = os.path.join(directory, 'index.json')
+        self._lock = threading.Lock()
+        # インデックスの書き出しを直列化する（古い内容で新しい内容を上書きしないように）
+        self._save_lock = threading.Lock()
+        self._dirty = False
+        self._index = self._load()
+
+    def _load(self):
+        try:
+            with open(self._index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _body_path(self, key):
+        return os.path.join(self.directory, key + '.body')
+
+    def _write_index(self, data):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.index.', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                f.write(data)
+            os.replace(tmp, self._index_path)
+        except OSError:
+            try:
+                os.remove(tmp)
+            except OSError:
+                pass
+            raise
+
+    def save(self):
+        """インデックスに変更があればアトミックに書き出す。"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                data = json.dumps(self._index)
+                self._dirty = False
+            try:
+                self._write_index(data)
+            except OSError:
+                with self._lock:
+                    self._dirty = True
+                raise
+
+    def _evict(self):
+        total = sum(e.get('size', 0) for e in self._index.values())
+        if total <= self.max_bytes:
+            return
+        for key, entry in sorted(self._index.items(), key=lambda kv: kv[1].get('atime', 0)):
+            if total <= self.max_bytes:
+                break
+            total -= entry.get('size', 0)
+            del self._index[key]
+            try:
+                os.remove(self._body_path(key))
+            except OSError:
+                pass
+
+    def lookup(self, key):
+        """保存済みのエントリを返す。本文ファイルが消えていれば None。"""
+        with self._lock:
+            entry = self._index.get(key)
+        if entry and os.path.exists(self._body_path(key)):
+            return entry
+        return None
+
+    def read_body(self, key):
+        with open(self._body_path(key), 'rb') as f:
+            body = f.read()
+        with self._lock:
+            if key in self._index:
+                self._index[key]['atime'] = time.time()
+                self._dirty = True
+        return body
+
+    def store(self, key, url, response, body=None):
+        """応答を保存する。body を省略すると response.content（ストリームなら残りを全部読む）。"""
+        etag = response.headers.get('ETag')
+        last_modified = response.headers.get('Last-Modified')
+        if not (etag or last_modified):
+            # 検証子が無い応答は再検証できないので保存しない
+            return
+        if body is None:
+            body = response.content
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.body.', suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(body)
+        os.replace(tmp, self._body_path(key))
+        with self._lock:
+            self._index[key] = {
+                'url': url,
+                'etag': etag,
+                'last_modified': last_modified,
+                'content_type': response.headers.get('Content-Type', ''),
+                'size': len(body),
+                'atime': time.time(),
+            }
+            self._evict()
+            self._dirty = True
+        self.save()
+
+    def get(self, client, url, params=None, **kwargs):
+        """
+        client 経由で条件付き GET を行い、requests.Response を返す。
+
+        キャッシュから返した応答には from_cache = True を付ける。
+        """
+        key = cache_key(url, params)
+        entry = self.lookup(key)
+        headers = dict(kwargs.pop('headers', None) or {})
+        if entry:
+            if entry.get('etag'):
+                headers['If-None-Match'] = entry['etag']
+            if entry.get('last_modified'):
+                headers['If-Modified-Since'] = entry['last_modified']
+
+        resp = client.request('GET', url, params=params, headers=headers, **kwargs)
+        resp.from_cache = False
+        if resp.status_code == 304 and entry:
+            # 304 の空本文を読み切って接続をプールへ戻す
+            resp.content
+            try:
+                body = self.read_body(key)
+            except OSError:
+                # 本文が読めなければ検証子を外して取り直す
+                return client.request('GET', url, params=params, **kwargs)
+            resp.status_code = 200
+            resp._content = body
+            resp._content_consumed = True
+            if entry.get('content_type'):
+                resp.headers['Content-Type'] = entry['content_type']
+            resp.from_cache = True
+        elif resp.status_code == 200:
+            if kwargs.get('stream'):
+                self._store_when_read(key, url, resp)
+            else:
+                self._store_quietly(key, url, resp)
+        return resp
+
+    def _store_quietly(self, key, url, response, body=None):
+        try:
+            self.store(key, url, response, body)
+        except OSError as e:
+            print(f"レスポンスキャッシュに保存できませんでした: {e}")
+
+    def _store_when_read(self, key, url, response):
+        """ストリームの応答は読まれたチャンクを溜め、最後まで読まれたら保存する（途中でやめたら保存しない）。"""
+        iter_content = response.iter_content
+
+        def tee(chunk_size=1, decode_unicode=False):
+            if decode_unicode:
+                yield from iter_content(chunk_size, decode_unicode)
+                return
+            body = bytearray()
+            for chunk in iter_content(chunk_size, decode_unicode):
+                body.extend(chunk)
+                yield chunk
+            self._store_quietly(key, url, response, bytes(body))
+
+        response.iter_content = tee
@@ -0,0 +1,158 @@
+"""リトライ方針とホストごとのサーキットブレーカー
+
+HttpClient の全リクエストに使う。失敗を種類ごとに分類し、
+一時的なもの（接続エラー・タイムアウト・5xx・429）だけを指数バックオフ（フルジッター）で再試行する。
+404 などの「存在しない」はすぐに呼び出し側へ返す。POST など冪等でないリクエストは、サーバーが
+処理せずに断ったと分かる 429 だけを再試行する（二重に送らないように）。
+同じホストで一時的な失敗が続いた場合はサーキットを開き、しばらくそのホストへの送信を止める。
+"""
+import random
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_BASE_DELAY = 0.5
+DEFAULT_MAX_DELAY = 10.0
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_AFTER = 30.0
+
+# 失敗の分類
+CONNECTION = 'connection'
+TIMEOUT = 'timeout'
+SERVER = 'server'        # 5xx
+THROTTLED = 'throttled'  # 429
+NOT_FOUND = 'not_found'  # 404 / 410
+CLIENT = 'client'        # その他の 4xx
+OK = 'ok'
+
+TRANSIENT = frozenset((CONNECTION, TIMEOUT, SERVER, THROTTLED))
+# 何度送っても結果が同じメソッド（これ以外は 429 のときだけ再試行する）
+IDEMPOTENT_METHODS = frozenset(('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE'))
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """サーキットが開いているホストへの送信を取りやめたときの例外。"""
+
+
+def classify_status(status):
+    if status == 429:
+        return THROTTLED
+    if status >= 500:
+        return SERVER
+    if status in (404, 410):
+        return NOT_FOUND
+    if status >= 400:
+        return CLIENT
+    return OK
+
+
+def classify_exception(exc):
+    """requests の例外を分類する。再試行しても意味の無いもの（URL不正など）は None。"""
+    if isinstance(exc, requests.exceptions.Timeout):
+        return TIMEOUT
+    if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+        return CONNECTION
+    return None
+
+
+class RetryPolicy:
+    """
+    Args:
+        max_attempts (int): 最初の1回を含む最大試行回数（1 で再試行しない）。
+        base_delay (float): バックオフの基準秒数（n 回目の失敗後は最大 base_delay * 2**n）。
+        max_delay (float): 1回の待ち時間の上限。
+        retry_on (iterable): 再試行する分類。
+        rng (random.Random): ジッターの乱数（テスト用。省略時は random モジュール）。
+    """
+
+    def __init__(self, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, retry_on=TRANSIENT, rng=None):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = frozenset(retry_on)
+        self.rng = rng or random
+
+    def should_retry(self, kind, attempt, method='GET'):
+        """method のリクエストの attempt 回目（0 始まり）が kind で失敗したとき、もう一度試すか。"""
+        if method.upper() not in IDEMPOTENT_METHODS and kind != THROTTLED:
+            return False
+        return kind in self.retry_on and attempt + 1 < self.max_attempts
+
+    def delay(self, attempt, retry_after=None):
+        """次の試行までの待ち秒数（フルジッター）。Retry-After があればそれより短くしない。"""
+        backoff = self.rng.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        if retry_after is not None:
+            backoff = max(backoff, min(retry_after, self.max_delay))
+        return backoff
+
+
+class _Circuit:
+    def __init__(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+
+class CircuitBreaker:
+    """
+    ホストごとのサーキットブレーカー。
+
+    一時的な失敗が failure_threshold 回続くと開き、reset_after 秒はそのホストへの送信を
+    CircuitOpenError で即座に失敗させる。その後は1リクエストだけ試し（half-open）、
+    成功すれば閉じ、失敗すればまた reset_after 秒開く。
+
+    Args:
+        failure_threshold (int): サーキットを開くまでの連続失敗数。
+        reset_after (float): 開いてから試行を再開するまでの秒数。
+        clock (callable): 単調増加の時計（テスト用。省略時は time.monotonic）。
+    """
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_after=DEFAULT_RESET_AFTER,
+                 clock=time.monotonic):
+        self.failure_threshold = max(1, failure_threshold)
+        self.reset_after = reset_after
+        self.clock = clock
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, url):
+        host = urlparse(url).netloc.lower()
+        circuit = self._circuits.get(host)
+        if circuit is None:
+            circuit = self._circuits[host] = _Circuit()
+        return circuit
+
+    def before(self, url):
+        """送信してよいか確認する。開いていれば CircuitOpenError。"""
+        with self._lock:
+            circuit = self._circuit(url)
+            if circuit.opened_at is None:
+                return
+            now = self.clock()
+            if now - circuit.opened_at >= self.reset_after:
+                # 試行は1件だけ。結果が返ってこなくても reset_after 後にまた1件通す
+                circuit.opened_at = now
+                circuit.trial = True
+                return
+        raise CircuitOpenError(f"circuit open for {urlparse(url).netloc}")
+
+    def success(self, url):
+        with self._lock:
+            circuit = self._circuit(url)
+            circuit.failures = 0
+            circuit.opened_at = None
+            circuit.trial = False
+
+    def failure(self, url):
+        with self._lock:
+            circuit = self._circuit(url)
+            circuit.failures += 1
+            if circuit.trial or circuit.failures >= self.failure_threshold:
+                if circuit.opened_at is None:
+                    print(f"警告: {urlparse(url).netloc} で失敗が続いたため {self.reset_after:.0f} 秒間送信を止めます")
+                circuit.opened_at = self.clock()
+                circuit.trial = False
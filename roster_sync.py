@@ -0,0 +1,93 @@
+"""差分同期用のロスター状態
+
+チームごとに前回取得した clubdetails API 応答のハッシュと、選手ごとの要素ハッシュ・出力レコードを
+ローカルの状態ファイルに保存しておく。次回は新しい応答と比較して、
+追加・変更された選手だけを処理し（画像取得を含む）、変化の無い選手は前回のレコードを再利用する。
+差分は変更ログ（JSON Lines）に追記する。
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_DIR = os.path.join('.cache', 'rosters')
+
+
+def digest_bytes(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def item_digest(item):
+    """API の選手要素（dict）のハッシュ。キー順に依存しない。"""
+    return digest_bytes(json.dumps(item, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+
+
+def change_log_path(csv_path):
+    """CSV と同じ場所に置く変更ログのパス（player_roster.csv -> player_roster.changes.jsonl）。"""
+    return os.path.splitext(csv_path)[0] + '.changes.jsonl'
+
+
+def image_present(record):
+    """レコードの画像が（無いか、）ディスク上に残っているか。"""
+    path = record.get('Image')
+    return not path or os.path.exists(path)
+
+
+class RosterState:
+    """
+    Args:
+        directory (str): チームごとの状態ファイルを置くディレクトリ。
+        change_log (str): 差分を追記する JSON Lines ファイル（省略時は記録しない）。
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, change_log=None):
+        self.directory = directory
+        self.change_log = change_log
+        self._lock = threading.Lock()
+
+    def _path(self, team_url):
+        return os.path.join(self.directory, digest_bytes(team_url.encode('utf-8'))[:32] + '.json')
+
+    def load(self, team_url):
+        """前回の状態 {'digest': ..., 'players': [{'key', 'digest', 'record'}, ...]} を返す（無ければ None）。"""
+        try:
+            with open(self._path(team_url), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save(self, team_url, digest, players):
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(team_url)
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'url': team_url, 'digest': digest, 'updated': int(time.time()),
+                       'players': players}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def log_changes(self, team_url, changes):
+        """
+        差分を変更ログに追記し、件数を表示する。
+
+        Args:
+            changes (list): [(種別 'added'/'changed'/'removed'/'image_repaired', 選手キー, レコード), ...]
+                'image_repaired' はロスターの変更ではなく、消えていた画像を取り直した選手。
+        """
+        counts = {}
+        for kind, _, _ in changes:
+            counts[kind] = counts.get(kind, 0) + 1
+        summary = ', '.join(f"{k}={v}" for k, v in sorted(counts.items())) or '変更なし'
+        print(f"差分: {team_url} ({summary})")
+        if not self.change_log or not changes:
+            return
+        now = int(time.time())
+        with self._lock:
+            directory = os.path.dirname(self.change_log)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.change_log, 'a', encoding='utf-8') as f:
+                for kind, key, record in changes:
+                    f.write(json.dumps({'ts': now, 'team': team_url, 'change': kind,
+                                        'player': key, 'record': record}, ensure_ascii=False) + '\n')
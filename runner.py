@@ -0,0 +1,247 @@
+"""プロセス内でスクレイピングを実行するランナー（GUI 用）
+
+スクレイピングはバックグラウンドのスレッドで実行し、進捗はイベントとしてキューに流す。
+呼び出し側（Tk のメインスレッドなど）はキューを定期的に読んで表示を更新するだけでよい。
+HTTP クライアント（接続プール・キャッシュ）とモジュールの import は実行をまたいで使い回すので、
+2回目以降は接続済みの状態から始まる。
+
+    runner = ScrapeRunner()
+    run = runner.submit(url, 'player_roster.csv')
+    event = run.events.get()   # Event(kind, data)
+    run.cancel()
+
+イベントの種類:
+    'log'      data = 表示する1行（スクレイパーの print も含む）
+    'player'   data = 選手レコード（画像の取得が終わった選手から順に届く）
+    'image'    data = 保存した画像のパス
+    'done'     data = {'players': 件数, 'images': 件数, 'output': CSV のパス, 'cancelled': bool, 'seconds': 秒}
+    'error'    data = エラーメッセージ（この後に 'done' も届く）
+"""
+import contextlib
+import queue
+import sys
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import Future
+
+Event = namedtuple('Event', ['kind', 'data'])
+
+# Cancel を確認する間隔（次のレコードを待っている間）
+CANCEL_POLL = 0.1
+
+
+# 実行中の print をイベントにするスレッド（実行スレッドと、そこから使う画像取得のスレッド）
+_RUN_THREAD_PREFIXES = ('scrape', 'image')
+
+
+class _QueueWriter:
+    """
+    実行スレッドからの print() を1行ずつ 'log' イベントにする（sys.stdout の代わりに置く）。
+
+    それ以外のスレッド（GUI のメインスレッドなど）の出力は元の stdout にそのまま書く。
+    """
+
+    def __init__(self, events, stdout):
+        self.events = events
+        self.stdout = stdout
+        self._bufs = {}
+
+    def write(self, text):
+        thread = threading.current_thread()
+        if not thread.name.startswith(_RUN_THREAD_PREFIXES):
+            return self.stdout.write(text)
+        buf = self._bufs.get(thread.ident, '') + text
+        while '\n' in buf:
+            line, buf = buf.split('\n', 1)
+            self.events.put(Event('log', line))
+        self._bufs[thread.ident] = buf
+        return len(text)
+
+    def flush(self):
+        for ident, buf in list(self._bufs.items()):
+            if buf:
+                self.events.put(Event('log', buf))
+            self._bufs.pop(ident, None)
+        self.stdout.flush()
+
+
+class ScrapeRun:
+    """1回分の実行。events からイベントを読み、cancel() で途中で止める。"""
+
+    def __init__(self, url, output):
+        self.url = url
+        self.output = output
+        self.events = queue.Queue()
+        self.future = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        """
+        残りの画像取得をやめる（取得済みの選手は CSV に残る）。
+
+        次の選手を待っている途中でもすぐに止まる。処理中のリクエストはバックグラウンドで終わるのを待ち、
+        その後でスクレイパーのジェネレータを閉じて画像・選手ページのプールを止める。
+        """
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def done(self):
+        return self.future is not None and self.future.done()
+
+
+class _Failed:
+    def __init__(self, error):
+        self.error = error
+
+
+def iter_cancellable(stream, run, poll=CANCEL_POLL):
+    """
+    stream（スクレイパーのジェネレータ）を別スレッドで読み進め、レコードを順に返す。
+
+    遅い画像・選手ページの取得で次のレコードが届かなくても、待つ間に run.cancelled を確認して止める。
+    止めた後、読み進めていたスレッドは処理中のレコードが終わった時点で stream を閉じる。
+    """
+    items = queue.Queue()
+    end = object()
+
+    def pump():
+        try:
+            for record in stream:
+                items.put(record)
+                if run.cancelled:
+                    break
+        except Exception as e:
+            items.put(_Failed(e))
+        finally:
+            stream.close()
+            items.put(end)
+
+    threading.Thread(target=pump, name='scrape-stream', daemon=True).start()
+    while True:
+        try:
+            item = items.get(timeout=poll)
+        except queue.Empty:
+            if run.cancelled:
+                return
+            continue
+        if item is end:
+            return
+        if isinstance(item, _Failed):
+            raise item.error
+        yield item
+        if run.cancelled:
+            return
+
+
+class ScrapeRunner:
+    """
+    Args:
+        client (HttpClient): 実行をまたいで使うクライアント。省略時はプロセス共有のもの。
+        image_workers (int): 1回の実行で画像を並列取得するスレッド数。
+    """
+
+    def __init__(self, client=None, image_workers=None):
+        from http_client import get_default_client
+        self.client = client or get_default_client()
+        self.image_workers = image_workers
+        # 実行は1本ずつ（sys.stdout の付け替えがプロセス全体に効くため）。
+        # ウィンドウを閉じたときにインタープリタの終了を待たせないようにデーモンスレッドで実行する
+        self._jobs = queue.Queue()
+        self._worker = threading.Thread(target=self._work, name='scrape', daemon=True)
+        self._worker.start()
+
+    def _work(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                return
+            future, fn, args = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def _submit(self, fn, *args):
+        future = Future()
+        self._jobs.put((future, fn, args))
+        return future
+
+    def warm(self):
+        """スクレイパーと画像処理のモジュールを先に import しておく（最初の実行を待たせない）。"""
+        def load():
+            import ehf, ihf, image_utils, scrap  # noqa: F401
+        return self._submit(load)
+
+    def submit(self, url, output='player_roster.csv', debug=False):
+        """url のスクレイピングを予約して ScrapeRun を返す。"""
+        run = ScrapeRun(url, output)
+        run.future = self._submit(self._run, run, debug)
+        return run
+
+    def _run(self, run, debug):
+        events = run.events
+        started = time.perf_counter()
+        players = images = 0
+        writer = _QueueWriter(events, sys.stdout)
+        try:
+            with contextlib.redirect_stdout(writer):
+                from ehf import save_to_csv
+                from scrap import iter_url
+
+                def records():
+                    nonlocal players, images
+                    opts = {'image_workers': self.image_workers} if self.image_workers else {}
+                    stream = iter_url(run.url, self.client, ordered=True, **opts)
+                    for record in iter_cancellable(stream, run):
+                        players += 1
+                        events.put(Event('player', record))
+                        if record.get('Image'):
+                            images += 1
+                            events.put(Event('image', record['Image']))
+                        yield record
+                    if run.cancelled:
+                        print('Cancelled; keeping the players fetched so far.')
+
+                print(f'Starting scrape for URL: {run.url}')
+                count = save_to_csv(records(), run.output)
+                if not count and debug:
+                    self._save_debug(run.url)
+        except Exception as e:
+            events.put(Event('error', str(e)))
+        finally:
+            writer.flush()
+            self.client.flush_caches()
+            events.put(Event('done', {'players': players, 'images': images, 'output': run.output,
+                                      'cancelled': run.cancelled,
+                                      'seconds': round(time.perf_counter() - started, 2)}))
+
+    def _save_debug(self, url):
+        # スクレイピング時に読んだ本文を保存する（取り直さない）
+        body = self.client.recent_body(url)
+        if body is None:
+            print('Could not save debug HTML: the full page was not read '
+                  '(the request failed or the players came from the API).')
+            return
+        with open('debug.html', 'wb') as f:
+            f.write(body)
+        print('Saved fetched HTML to debug.html for inspection.')
+
+    def shutdown(self, wait=True):
+        """予約済みの実行を取り消してワーカーを止める（wait=True なら実行中のものが終わるまで待つ）。"""
+        while True:
+            try:
+                job = self._jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                job[0].cancel()
+        self._jobs.put(None)
+        if wait:
+            self._worker.join()
+        self.client.flush_caches()
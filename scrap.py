@@ -1,84 +1,427 @@
 """Dispatcher script
 
 Detect the site (EHF or IHF) and call the appropriate scraper module.
+With --batch/--competition, scrape many teams in one process.
 """
 import argparse
-from urllib.parse import urlparse
 
-def main():
-    parser = argparse.ArgumentParser(description='Scrape team player lists (EHF/IHF)')
-    parser.add_argument('-u', '--url', required=True, help='Team page URL')
-    parser.add_argument('-o', '--output', default='player_roster.csv', help='Output CSV filename')
-    parser.add_argument('--debug', action='store_true', help='Save fetched HTML as debug.html when no data')
-    args = parser.parse_args()
+# the host -> scraper table lives in registry so library code can use it too
+from registry import load_scraper
 
-    url = args.url
-    parsed = urlparse(url)
-    netloc = parsed.netloc.lower()
-
-    # Import locally to avoid circular imports when running modules directly
-    data = []
-    if 'eurohandball.com' in netloc:
-        import ihf
-        # user probably wants EHF, but our ihf.py is for ihf.info; try to import ehf module
-        try:
-            import ehf
-            data = ehf.scrape_player_data(url)
-            save = ehf.save_to_csv
-        except Exception:
-            print('EHF parser not available or failed')
-            data = []
-            save = None
-
-    elif 'ihf.info' in netloc:
-        import ihf
-        data = ihf.scrape_player_data(url)
-        # reuse ehf.save_to_csv if available for consistent CSV output
-        try:
-            import ehf
-            save = ehf.save_to_csv
-        except Exception:
-            save = None
 
+def build_client(args):
+    """Create the pooled HTTP client (with its on-disk caches) from CLI options."""
+    import os
+    from http_client import HttpClient
+    from probe_cache import ProbeCache
+    from rate_limit import RequestScheduler
+    from response_cache import ResponseCache
+    from retry import RetryPolicy
+    from metrics import Metrics
+    probe_cache = None
+    if not args.no_probe_cache:
+        probe_cache = ProbeCache(os.path.join(args.cache_dir, 'probe_cache.json'))
+    response_cache = None
+    if not args.no_http_cache:
+        response_cache = ResponseCache(os.path.join(args.cache_dir, 'http'), max_bytes=args.http_cache_mb * 1024 * 1024)
+    # page/API requests are scheduled ahead of image downloads and variant probes
+    scheduler = RequestScheduler(rate=args.rate, burst=args.burst, max_queue=args.max_queue)
+    # one pooled client shared by the page, API, probe and image requests
+    return HttpClient(timeout=args.timeout, pool_maxsize=args.pool_size,
+                      probe_cache=probe_cache, response_cache=response_cache, scheduler=scheduler,
+                      retry=RetryPolicy(max_attempts=args.max_attempts),
+                      metrics=Metrics(jsonl_path=args.metrics_jsonl))
+
+
+def build_async_client(args, metrics):
+    """AsyncHttpClient with the same caches, limits and metrics sink as build_client."""
+    import os
+    import async_engine
+    from probe_cache import ProbeCache
+    from response_cache import ResponseCache
+    from retry import RetryPolicy
+    probe_cache = None
+    if not args.no_probe_cache:
+        probe_cache = ProbeCache(os.path.join(args.cache_dir, 'probe_cache.json'))
+    response_cache = None
+    if not args.no_http_cache:
+        response_cache = ResponseCache(os.path.join(args.cache_dir, 'http'), max_bytes=args.http_cache_mb * 1024 * 1024)
+    return async_engine.AsyncHttpClient(timeout=args.timeout, limit_per_host=args.pool_size,
+                                        probe_cache=probe_cache, response_cache=response_cache,
+                                        scheduler=async_engine.AsyncScheduler(rate=args.rate, burst=args.burst),
+                                        retry=RetryPolicy(max_attempts=args.max_attempts), metrics=metrics)
+
+
+def scrape_url(url, client, **opts):
+    """Scrape one team page with the scraper matching its host.
+
+    opts (image_workers, per_host, transcoder, state, images, players) are passed on
+    to the scrapers that accept them: transcoder is only used by the IHF
+    scraper (EHF photos are stored as-is), state (roster_sync.RosterState)
+    only by the EHF scraper, since IHF pages have no per-player API payload
+    to diff.
+
+    Returns (data, save) where save is a save_to_csv-compatible function
+    (or None). Returns (None, None) when no parser is available.
+    """
+    try:
+        module, options = load_scraper(url)
+    except ImportError as e:
+        print(f'No suitable parser for this domain ({e}).')
+        return None, None
+    opts = {k: v for k, v in opts.items() if k in options}
+    try:
+        data = module.scrape_player_data(url, client=client, **opts)
+    except Exception as e:
+        print(f'{module.__name__} scraper failed: {e}')
+        return [], None
+    # every scraper's records use the ehf CSV columns
+    from ehf import save_to_csv
+    return data, save_to_csv
+
+
+def iter_url(url, client, ordered=False, **opts):
+    """Like scrape_url, but yield records as their images finish (see ehf.iter_player_data)."""
+    module, options = load_scraper(url)
+    opts = {k: v for k, v in opts.items() if k in options}
+    return module.iter_player_data(url, client=client, ordered=ordered, **opts)
+
+
+def build_state(args, change_log):
+    """Roster state for --incremental, with the change log written next to the CSV output."""
+    import os
+    from roster_sync import RosterState
+    return RosterState(args.state_dir or os.path.join(args.cache_dir, 'rosters'), change_log=change_log)
+
+
+def open_output_sink(args, path):
+    """Sink for --format jsonl/sqlite/parquet."""
+    import sinks
+    return sinks.open_sink(args.format, sinks.output_path(path, args.format), batch_size=args.sink_batch)
+
+
+def batch_output_path(args, output_dir):
+    """Single output file for batch mode with a non-CSV --format."""
+    import os
+    return args.combined or os.path.join(output_dir, 'rosters.csv')
+
+
+def open_journal(args):
+    """Job journal for batch mode; --resume continues the previous run of the same job."""
+    import os
+    from journal import JobJournal, default_journal_path
+    path = args.journal or default_journal_path(args.batch or args.competition, os.path.join(args.cache_dir, 'jobs'))
+    journal = JobJournal(path, resume=args.resume)
+    if args.resume and journal.completed:
+        print(f'Resuming from {path}: {len(journal.completed)} teams already done')
+    return journal
+
+
+def batch_urls(args, client, journal):
+    """Team URLs of the batch file or competition page (reused from the journal when resuming)."""
+    import batch
+    if journal.urls is not None:
+        return journal.urls
+    if args.batch:
+        urls = batch.read_url_file(args.batch)
+    else:
+        urls = batch.discover_team_urls(args.competition, client)
+        print(f'Found {len(urls)} team pages on {args.competition}')
+    journal.record_urls(urls)
+    return urls
+
+
+def finish_journal(journal, urls, results):
+    """Mark the job done once every team has records (failed teams are retried by --resume)."""
+    if all(results.get(url) for url in urls):
+        journal.finish()
+    else:
+        print(f'Some teams returned no players; rerun with --resume to retry them ({journal.path})')
+    journal.close()
+
+
+def run_batch_mode(args, client, image_opts):
+    import os
+    import batch
+
+    journal = open_journal(args)
+    urls = batch_urls(args, client, journal)
+    if not urls:
+        print('No team URLs to scrape.')
+        return
+
+    def scrape(url):
+        data, _ = scrape_url(url, client, **image_opts)
+        return data or []
+
+    output_dir = args.output_dir
+    if not output_dir and not args.combined:
+        output_dir = 'rosters'
+    if args.incremental:
+        from roster_sync import change_log_path
+        change_log = change_log_path(args.combined) if args.combined else os.path.join(output_dir, 'changes.jsonl')
+        image_opts = dict(image_opts, state=build_state(args, change_log))
+    if args.format == 'csv':
+        results = batch.run_batch(urls, scrape, workers=args.workers, per_domain=args.per_domain,
+                                  output_dir=output_dir, combined=args.combined, journal=journal)
+    else:
+        # other formats: every team goes into one file, written as teams finish
+        with open_output_sink(args, batch_output_path(args, output_dir)) as sink:
+            results = batch.run_batch(urls, scrape, workers=args.workers, per_domain=args.per_domain,
+                                      sink=sink, journal=journal)
+    finish_journal(journal, urls, results)
+
+
+def run_async(args, client, transcoder=None, images=True):
+    """Scrape with the asyncio engine; client (sync) is only used to discover team URLs."""
+    import asyncio
+    import os
+    import async_engine
+    import batch
+    from ehf import save_to_csv
+
+    batch_mode = bool(args.batch or args.competition)
+    journal = None
+    if batch_mode:
+        journal = open_journal(args)
+        urls = batch_urls(args, client, journal)
+    else:
+        urls = [args.url]
+    if not urls:
+        print('No team URLs to scrape.')
+        return
+
+    output_dir = args.output_dir
+    if batch_mode and not output_dir and not args.combined:
+        output_dir = 'rosters'
+    sink = None
+    if args.format != 'csv':
+        sink = open_output_sink(args, batch_output_path(args, output_dir) if batch_mode else args.output)
+        output_dir = None
+    elif output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+
+    def write_team(url, data):
+        if data and output_dir:
+            save_to_csv(data, os.path.join(output_dir, batch.team_filename(url)))
+        if data and sink is not None:
+            sink.write(data, url)
+
+    def on_result(url, data):
+        if journal is not None:
+            journal.record_team(url, data)
+        write_team(url, data)
+
+    done = dict(journal.completed) if journal is not None else {}
+    for url, data in done.items():
+        write_team(url, data)
+    pending = [url for url in urls if url not in done]
+
+    async def main():
+        aclient = build_async_client(args, client.metrics)
+        async with aclient:
+            results = await async_engine.scrape_many(pending, aclient, teams=args.workers, transcoder=transcoder,
+                                                     images=images, on_result=on_result)
+        return results, aclient
+
+    try:
+        results, aclient = asyncio.run(main())
+    finally:
+        if sink is not None:
+            sink.close()
+    results.update(done)
+    if batch_mode:
+        if args.combined and sink is None:
+            batch.write_combined(urls, results, args.combined, save_to_csv)
+        finish_journal(journal, urls, results)
+        return
+
+    data = results.get(args.url)
+    if data:
+        if sink is None:
+            save_to_csv(data, args.output)
+        return
+    print('No player data found.')
+    if args.debug:
+        body = aclient.recent_body(args.url)
+        if body is None:
+            print('Could not save debug HTML: the page could not be fetched')
+        else:
+            with open('debug.html', 'wb') as f:
+                f.write(body)
+            print('Saved fetched HTML to debug.html')
+
+
+def report_metrics(args, metrics):
+    """Print the request/timing summary and write the optional metrics files."""
+    if not args.no_summary:
+        table = metrics.format_table()
+        if table:
+            print()
+            print(table)
+    if args.metrics_prom:
+        metrics.write_prometheus(args.metrics_prom)
+        print(f'Metrics written to {args.metrics_prom}')
+    metrics.close()
+
+
+def build_image_opts(args):
+    """Keyword options for the scrapers' image workers and transcoder."""
+    image_opts = {'image_workers': args.image_workers, 'per_host': args.per_host}
+    if args.no_images:
+        # records keep an empty Image column; no image module or transcode pool is loaded
+        image_opts['images'] = False
+    elif args.transcode_workers == 0:
+        image_opts['transcoder'] = False
+    elif args.transcode_workers:
+        from image_postprocess import TranscodePool
+        image_opts['transcoder'] = TranscodePool(args.transcode_workers)
+    return image_opts
+
+
+def build_enricher(args, client):
+    """Player detail enricher for --details (None when the option is off)."""
+    if not args.details:
+        return None
+    import os
+    from enrich import Enricher, DetailCache
+    cache = DetailCache(os.path.join(args.cache_dir, 'details.json'), ttl=args.details_ttl * 3600)
+    return Enricher(client, cache, max_workers=args.image_workers, per_host=args.per_host)
+
+
+def run(args, client):
+    """Scrape what the CLI options ask for with the given client."""
+    image_opts = build_image_opts(args)
+
+    if args.engine == 'async':
+        run_async(args, client, image_opts.get('transcoder'), images=not args.no_images)
+        return
+
+    enricher = build_enricher(args, client)
+    if enricher is not None:
+        image_opts['details'] = enricher
+    try:
+        run_sync(args, client, image_opts)
+    finally:
+        if enricher is not None:
+            enricher.close()
+
+
+def run_sync(args, client, image_opts):
+    """The sync engine: batch mode or a single team, streamed into the output."""
+    if args.batch or args.competition:
+        run_batch_mode(args, client, image_opts)
+        return
+
+    url = args.url
+    if args.incremental:
+        from roster_sync import change_log_path
+        image_opts['state'] = build_state(args, change_log_path(args.output))
+    # rows are written while the remaining images are still being fetched;
+    # the CSV keeps roster order, the other sinks take players as they finish
+    if args.format == 'csv':
+        from ehf import save_to_csv, FIELDNAMES
+        fieldnames = FIELDNAMES
+        if 'details' in image_opts:
+            from enrich import DETAIL_FIELDS
+            fieldnames = FIELDNAMES + DETAIL_FIELDS
+        count = save_to_csv(iter_url(url, client, ordered=True, **image_opts), args.output, fieldnames)
     else:
-        # Generic fallback: try to use ehf scraper if present
-        try:
-            import ehf
-            data = ehf.scrape_player_data(url)
-            save = ehf.save_to_csv
-        except Exception:
-            print('No suitable parser for this domain.')
-            return
-
-    if not data:
+        count = 0
+        with open_output_sink(args, args.output) as sink:
+            for record in iter_url(url, client, **image_opts):
+                sink.write([record], url, complete=False)
+                count += 1
+            if count:
+                sink.write([], url)
+
+    if not count:
         print('No player data found.')
         if args.debug:
-            # save fetched HTML for inspection
-            try:
-                import requests
-                resp = requests.get(url, timeout=10)
+            # save the HTML the scraper already read (no second request)
+            body = client.recent_body(url)
+            if body is None:
+                print('Could not save debug HTML: the full page was not read '
+                      '(the request failed or the players came from the API)')
+            else:
                 with open('debug.html', 'wb') as f:
-                    f.write(resp.content)
+                    f.write(body)
                 print('Saved fetched HTML to debug.html')
-            except Exception as e:
-                print(f'Could not fetch/save debug HTML: {e}')
-        return
 
-    if save:
-        save(data, args.output)
-    else:
-        # Minimal CSV write if no save function available
-        import csv
-        keys = []
-        for item in data:
-            for k in item.keys():
-                if k not in keys:
-                    keys.append(k)
-        with open(args.output, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.DictWriter(f, fieldnames=keys)
-            writer.writeheader()
-            writer.writerows(data)
-        print(f"Saved to {args.output}")
+
+def add_client_arguments(parser):
+    """Options for the HTTP client, caches and image workers (shared with service.py)."""
+    parser.add_argument('--timeout', type=float, default=10, help='Default HTTP timeout in seconds')
+    parser.add_argument('--pool-size', type=int, default=16, help='Max keep-alive connections per host')
+    parser.add_argument('--rate', type=float, default=8, help='Max requests per second per host (0 = unlimited)')
+    parser.add_argument('--burst', type=int, default=8, help='Requests per host that may be sent back-to-back before --rate applies')
+    parser.add_argument('--max-queue', type=int, default=64, help='Max requests waiting per host; callers block beyond this')
+    parser.add_argument('--max-attempts', type=int, default=3,
+                        help='Attempts per request for connection errors, timeouts, 5xx and 429 (1 = no retry)')
+    parser.add_argument('--image-workers', type=int, default=8, help='Threads used to fetch player images')
+    parser.add_argument('--per-host', type=int, default=4, help='Max concurrent image requests per host')
+    parser.add_argument('--transcode-workers', type=int, default=None,
+                        help='Processes used to re-encode images (default: CPU count, 0 = inline)')
+    parser.add_argument('--cache-dir', default='.cache', help='Directory for persistent caches')
+    parser.add_argument('--no-probe-cache', action='store_true', help='Do not reuse image variant probe results between runs')
+    parser.add_argument('--no-http-cache', action='store_true', help='Do not revalidate team pages/API responses against the on-disk cache')
+    parser.add_argument('--http-cache-mb', type=int, default=64, help='Size cap of the on-disk HTTP response cache (MB)')
+    parser.add_argument('--parser', choices=['lxml', 'html.parser'], help='HTML parser backend (default: lxml if installed)')
+    parser.add_argument('--no-images', action='store_true',
+                        help='Do not fetch player images (the Image column is left empty)')
+    parser.add_argument('--details', action='store_true',
+                        help='Fetch player pages for Nationality/Club/Height/Birthdate (cached in <cache-dir>/details.json)')
+    parser.add_argument('--details-ttl', type=float, default=168, help='Hours before cached player details are fetched again')
+    parser.add_argument('--metrics-jsonl', metavar='FILE', help='Append one JSON line per HTTP request to FILE')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scrape team player lists (EHF/IHF)')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('-u', '--url', help='Team page URL')
+    target.add_argument('--batch', metavar='FILE', help='File with one team page URL per line')
+    target.add_argument('--competition', metavar='URL', help='Competition page URL; scrape every team linked from it')
+    parser.add_argument('-o', '--output', default='player_roster.csv',
+                        help='Output filename (a .csv name gets the --format extension, e.g. player_roster.db)')
+    parser.add_argument('--format', choices=['csv', 'jsonl', 'sqlite', 'parquet'], default='csv',
+                        help='Output format; jsonl/sqlite/parquet write all teams into one file (parquet needs pyarrow)')
+    parser.add_argument('--sink-batch', type=int, default=500, help='Records buffered before each jsonl/sqlite/parquet write')
+    parser.add_argument('--debug', action='store_true', help='Save fetched HTML as debug.html when no data')
+    add_client_arguments(parser)
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only process players added/changed since the last run and append a change log next to the CSV')
+    parser.add_argument('--state-dir', help='Directory for per-team roster state (default: <cache-dir>/rosters)')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync',
+                        help='sync: thread pools over requests (default); async: one asyncio event loop over aiohttp')
+    parser.add_argument('--workers', type=int, default=8, help='Batch mode: teams scraped in parallel')
+    parser.add_argument('--per-domain', type=int, default=2, help='Batch mode: max teams scraped in parallel per domain')
+    parser.add_argument('--output-dir', help='Batch mode: write one CSV per team into this directory (default: rosters)')
+    parser.add_argument('--combined', metavar='FILE', help='Batch mode: write all teams into one CSV with a Team column')
+    parser.add_argument('--resume', action='store_true',
+                        help='Batch mode: continue the previous run of the same --batch/--competition job, skipping finished teams')
+    parser.add_argument('--journal', metavar='FILE', help='Batch mode: job journal file (default: <cache-dir>/jobs/<job>.jsonl)')
+    parser.add_argument('--no-summary', action='store_true', help='Do not print the request/timing summary at the end')
+    parser.add_argument('--metrics-prom', metavar='FILE', help='Write request/timing metrics in Prometheus text format to FILE')
+    args = parser.parse_args()
+    if args.incremental and args.no_images:
+        # the roster state would record the players as done without their images
+        parser.error('--incremental cannot be combined with --no-images')
+    if args.engine == 'async':
+        # the async engine has no roster state or player-page enrichment; fail instead of doing less
+        for flag, used in (('--incremental', args.incremental), ('--details', args.details)):
+            if used:
+                parser.error(f'{flag} is only supported by the sync engine (--engine sync)')
+
+    if args.parser:
+        import html_parsing
+        html_parsing.set_parser(args.parser)
+
+    client = build_client(args)
+    try:
+        run(args, client)
+    finally:
+        client.close()
+        report_metrics(args, client.metrics)
 
 
 if __name__ == '__main__':
@@ -1,7 +1,11 @@
 import os
+import queue
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from ehf import scrape_player_data, save_to_csv
+from runner import ScrapeRunner
+
+# イベントキューを読む間隔（ミリ秒）
+POLL_MS = 50
 
 class ScraperGUIDirect(tk.Tk):
     def __init__(self):
@@ -30,7 +34,14 @@ class ScraperGUIDirect(tk.Tk):
         self.run_btn = ttk.Button(frm, text='Run Scraper', command=self.on_run)
         self.run_btn.grid(column=0, row=4, pady=(12,6), sticky='w')
 
-        ttk.Button(frm, text='Quit', command=self.quit).grid(column=1, row=4, pady=(12,6), sticky='w')
+        self.cancel_btn = ttk.Button(frm, text='Cancel', command=self.on_cancel, state='disabled')
+        self.cancel_btn.grid(column=1, row=4, pady=(12,6), sticky='w')
+
+        ttk.Button(frm, text='Quit', command=self.on_quit).grid(column=2, row=4, pady=(12,6), sticky='w')
+
+        # Progress
+        self.progress_var = tk.StringVar(value='')
+        ttk.Label(frm, textvariable=self.progress_var).grid(column=1, row=5, columnspan=2, sticky='e')
 
         # Output console
         ttk.Label(frm, text='Output:').grid(column=0, row=5, sticky='w')
@@ -44,6 +55,12 @@ class ScraperGUIDirect(tk.Tk):
         frm.columnconfigure(0, weight=1)
         frm.rowconfigure(6, weight=1)
 
+        # スクレイピングはバックグラウンドで実行し、HTTP の接続プールは実行をまたいで使い回す
+        self.runner = ScrapeRunner()
+        self.runner.warm()
+        self.current = None
+        self.protocol('WM_DELETE_WINDOW', self.on_quit)
+
     def on_run(self):
         url = self.url_var.get().strip()
         out = self.out_var.get().strip()
@@ -54,33 +71,64 @@ class ScraperGUIDirect(tk.Tk):
             return
 
         self.run_btn.config(state='disabled')
+        self.cancel_btn.config(state='normal')
         self.txt.delete('1.0', tk.END)
-
+        self.progress_var.set('')
+        self.counts = {'players': 0, 'images': 0}
+        self.current = self.runner.submit(url, out, debug=debug)
+        self.after(POLL_MS, self._poll_events)
+
+    def on_cancel(self):
+        if self.current is not None:
+            self.current.cancel()
+            self.cancel_btn.config(state='disabled')
+            self.log('Cancelling...')
+
+    def on_quit(self):
+        if self.current is not None:
+            self.current.cancel()
+        self.runner.shutdown(wait=False)
+        self.quit()
+
+    def log(self, line):
+        self.txt.insert(tk.END, line + '\n')
+        self.txt.see(tk.END)
+
+    def _poll_events(self):
+        run = self.current
+        if run is None:
+            return
         try:
-            # スクレイピング実行
-            self.txt.insert(tk.END, f'Starting scrape for URL: {url}\n')
-            roster = scrape_player_data(url)
-
-            if not roster:
-                self.txt.insert(tk.END, 'No player data found.\n')
-                if debug:
-                    import requests
-                    try:
-                        resp = requests.get(url, timeout=10)
-                        with open('debug.html', 'wb') as f:
-                            f.write(resp.content)
-                        self.txt.insert(tk.END, 'Saved fetched HTML to debug.html for inspection.\n')
-                    except Exception as e:
-                        self.txt.insert(tk.END, f'Could not fetch/save debug HTML: {e}\n')
-            else:
-                save_to_csv(roster, out)
-                self.txt.insert(tk.END, f'Data saved to {out}\n')
-
-        except Exception as e:
-            self.txt.insert(tk.END, f'Error: {e}\n')
-
-        finally:
-            self.run_btn.config(state='normal')
+            while True:
+                event = run.events.get_nowait()
+                if event.kind == 'log':
+                    self.log(event.data)
+                elif event.kind in ('player', 'image'):
+                    self.counts[event.kind + 's'] += 1
+                    if event.kind == 'player':
+                        self.log(f"  {event.data.get('背番号', '')} {event.data.get('選手名', '')}")
+                elif event.kind == 'error':
+                    self.log(f'Error: {event.data}')
+                elif event.kind == 'done':
+                    self._finish(event.data)
+                    return
+        except queue.Empty:
+            pass
+        self.progress_var.set(f"players: {self.counts['players']}  images: {self.counts['images']}")
+        self.after(POLL_MS, self._poll_events)
+
+    def _finish(self, summary):
+        self.current = None
+        self.progress_var.set(f"players: {summary['players']}  images: {summary['images']}  "
+                              f"({summary['seconds']:.1f}s)")
+        if summary['cancelled']:
+            self.log(f"Cancelled after {summary['players']} players.")
+        elif summary['players']:
+            self.log(f"Data saved to {summary['output']}")
+        else:
+            self.log('No player data found.')
+        self.run_btn.config(state='normal')
+        self.cancel_btn.config(state='disabled')
 
 
 def main():
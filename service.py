@@ -0,0 +1,393 @@
+"""常駐スクレイピングサービス（ローカルの HTTP/JSON API とジョブキュー）
+
+scrap.py は1回ごとにプロセスを起動するので、毎回 import・接続確立・キャッシュの読み込みから始まる。
+このサービスは1つのプロセスに HTTP クライアント（ホストごとの keep-alive 接続・probe キャッシュ・
+HTTP 応答キャッシュ）と画像変換のプロセスプールを持ち続け、API で受け付けたチームURLを
+ジョブキューからワーカースレッドで順に処理する。
+
+- 同じURLのジョブが待機中・実行中なら、新しいジョブは作らずにそのジョブを返す
+- 同じURLのジョブが --reuse-seconds 秒以内に終わっていれば、取り直さずにその結果を返す
+  （"fresh": true を付けると必ず取り直す）
+- 終わったジョブは新しい順に --max-jobs 件まで結果を保持する
+
+    python3 service.py --port 8765 --workers 4
+
+API（リクエスト・レスポンスは JSON）:
+    POST   /jobs               {"url": "..."} または {"urls": [...]} -> 202 とジョブ（urls なら {"jobs": [...]}）
+    GET    /jobs               ジョブの一覧（?status=queued|running|done|failed|cancelled で絞り込み）
+    GET    /jobs/<id>          ジョブの状態
+    GET    /jobs/<id>/result   選手レコードの JSON（?format=csv で CSV）
+    DELETE /jobs/<id>          キャンセル（実行中なら残りの画像取得をやめ、取得済みの選手は結果に残す）
+    GET    /health             ワーカー数と状態ごとのジョブ数
+    GET    /metrics            リクエスト・処理時間の集計（Prometheus のテキスト形式）
+"""
+import argparse
+import io
+import json
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+DEFAULT_PORT = 8765
+DEFAULT_WORKERS = 4
+DEFAULT_REUSE_SECONDS = 300
+DEFAULT_MAX_JOBS = 1000
+DEFAULT_QUEUE_SIZE = 10000
+
+STATUSES = ('queued', 'running', 'done', 'failed', 'cancelled')
+FINISHED = ('done', 'failed', 'cancelled')
+
+
+class Job:
+    """1チームURLのスクレイピング。状態の更新は JobQueue のロックの下で行う。"""
+
+    def __init__(self, url):
+        self.id = uuid.uuid4().hex[:12]
+        self.url = url
+        self.status = 'queued'
+        self.records = []
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def summary(self):
+        seconds = None
+        if self.started is not None:
+            seconds = round((self.finished or time.time()) - self.started, 3)
+        return {
+            'id': self.id,
+            'url': self.url,
+            'status': self.status,
+            'players': len(self.records),
+            'error': self.error,
+            'submitted': round(self.submitted, 3),
+            'started': self.started and round(self.started, 3),
+            'finished': self.finished and round(self.finished, 3),
+            'seconds': seconds,
+        }
+
+
+class JobQueue:
+    """
+    ジョブキューとワーカースレッド。
+
+    Args:
+        scrape (callable): scrape(job) が選手レコードを1件ずつ返す iterable を返す。
+        workers (int): 同時に処理するジョブ数。
+        reuse_seconds (float): 同じURLの終わったジョブの結果を使い回す秒数（0 で使い回さない）。
+        max_jobs (int): 保持する終わったジョブの数。
+        queue_size (int): 待機できるジョブの数（超えると submit が queue.Full を送出する）。
+    """
+
+    def __init__(self, scrape, workers=DEFAULT_WORKERS, reuse_seconds=DEFAULT_REUSE_SECONDS,
+                 max_jobs=DEFAULT_MAX_JOBS, queue_size=DEFAULT_QUEUE_SIZE):
+        self.scrape = scrape
+        self.reuse_seconds = reuse_seconds
+        self.max_jobs = max_jobs
+        self._jobs = OrderedDict()  # id -> Job（投入順）
+        self._by_url = {}           # url -> そのURLの最新のジョブ
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._threads = [threading.Thread(target=self._work, name=f'scrape-worker-{i}', daemon=True)
+                         for i in range(max(1, workers))]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, url, fresh=False):
+        """url のジョブを返す（待機中・実行中・直近に終わった同じURLのジョブがあればそれを返す）。"""
+        with self._lock:
+            job = self._by_url.get(url)
+            if job is not None:
+                if job.status in ('queued', 'running'):
+                    return job
+                recent = job.status == 'done' and time.time() - job.finished < self.reuse_seconds
+                if recent and not fresh:
+                    return job
+            job = Job(url)
+            self._queue.put_nowait(job)
+            self._jobs[job.id] = job
+            self._by_url[url] = job
+            self._prune_locked()
+            return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self, status=None):
+        with self._lock:
+            return [job for job in self._jobs.values() if status is None or job.status == status]
+
+    def cancel(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.cancel()
+            if job.status == 'queued':
+                # ワーカーが取り出したときに読み飛ばす
+                job.status = 'cancelled'
+                job.finished = time.time()
+            return job
+
+    def counts(self):
+        with self._lock:
+            counts = dict.fromkeys(STATUSES, 0)
+            for job in self._jobs.values():
+                counts[job.status] += 1
+            return counts
+
+    @property
+    def workers(self):
+        return len(self._threads)
+
+    def _prune_locked(self):
+        # 古い順に、終わったジョブを max_jobs 件まで減らす
+        finished = [job for job in self._jobs.values() if job.status in FINISHED]
+        for job in finished[:max(0, len(finished) - self.max_jobs)]:
+            del self._jobs[job.id]
+            if self._by_url.get(job.url) is job:
+                del self._by_url[job.url]
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            with self._lock:
+                if job.status != 'queued':
+                    continue
+                job.status = 'running'
+                job.started = time.time()
+            try:
+                stream = self.scrape(job)
+                try:
+                    for record in stream:
+                        job.records.append(record)
+                        if job.cancelled:
+                            break
+                finally:
+                    close = getattr(stream, 'close', None)
+                    if close is not None:
+                        # 途中でやめた場合は残りの画像ジョブを取り消す
+                        close()
+                if job.cancelled:
+                    status, error = 'cancelled', None
+                elif job.records:
+                    status, error = 'done', None
+                else:
+                    status, error = 'failed', 'No player data found.'
+            except Exception as e:
+                print(f'Job {job.id} failed: {job.url} ({e})')
+                status, error = 'failed', str(e)
+            with self._lock:
+                job.status, job.error = status, error
+                job.finished = time.time()
+                self._prune_locked()
+
+    def shutdown(self):
+        """待機中のジョブは実行せず、実行中のジョブが終わるまで待つ。"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job.status == 'queued':
+                    job.cancel()
+                    job.status = 'cancelled'
+                    job.finished = time.time()
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    server_version = 'ScraperService/1.0'
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send(self, status, body=b'', content_type='application/json'):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload):
+        self.send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def send_error_json(self, status, message):
+        self.send_json(status, {'error': message})
+
+    def route(self):
+        """(パス要素のリスト, クエリ) を返す。"""
+        parsed = urlparse(self.path)
+        parts = [p for p in parsed.path.split('/') if p]
+        return parts, {k: v[-1] for k, v in parse_qs(parsed.query).items()}
+
+    def do_GET(self):
+        jobs = self.server.jobs
+        parts, query = self.route()
+        if parts == ['health']:
+            self.send_json(200, {'status': 'ok', 'workers': jobs.workers, 'jobs': jobs.counts()})
+        elif parts == ['metrics']:
+            self.send(200, self.server.client.metrics.prometheus_text().encode('utf-8'),
+                      'text/plain; version=0.0.4; charset=utf-8')
+        elif parts == ['jobs']:
+            status = query.get('status')
+            if status is not None and status not in STATUSES:
+                self.send_error_json(400, f'unknown status: {status}')
+                return
+            self.send_json(200, {'jobs': [job.summary() for job in jobs.jobs(status)]})
+        elif len(parts) in (2, 3) and parts[0] == 'jobs' and parts[2:] in ([], ['result']):
+            job = jobs.get(parts[1])
+            if job is None:
+                self.send_error_json(404, f'no such job: {parts[1]}')
+            elif len(parts) == 2:
+                self.send_json(200, job.summary())
+            elif job.status in ('queued', 'running'):
+                self.send_json(409, dict(job.summary(), error='job has not finished'))
+            elif query.get('format') == 'csv':
+                self.send_csv(job)
+            else:
+                self.send_json(200, dict(job.summary(), records=job.records))
+        else:
+            self.send_error_json(404, 'not found')
+
+    def do_POST(self):
+        parts, _ = self.route()
+        if parts != ['jobs']:
+            self.send_error_json(404, 'not found')
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            payload = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self.send_error_json(400, 'request body must be JSON')
+            return
+        if not isinstance(payload, dict):
+            self.send_error_json(400, 'request body must be a JSON object')
+            return
+        urls = payload.get('urls')
+        single = urls is None
+        if single:
+            urls = [payload.get('url')]
+        if not isinstance(urls, list) or not all(isinstance(u, str) and u.startswith(('http://', 'https://'))
+                                                 for u in urls):
+            self.send_error_json(400, 'expected "url" or "urls" with http(s) team page URLs')
+            return
+        fresh = bool(payload.get('fresh'))
+        submitted = []
+        for url in urls:
+            try:
+                submitted.append(self.server.jobs.submit(url.strip(), fresh=fresh))
+            except queue.Full:
+                self.send_error_json(503, f'job queue is full ({len(submitted)} of {len(urls)} URLs accepted)')
+                return
+        if single:
+            self.send_json(202, submitted[0].summary())
+        else:
+            self.send_json(202, {'jobs': [job.summary() for job in submitted]})
+
+    def do_DELETE(self):
+        parts, _ = self.route()
+        if len(parts) != 2 or parts[0] != 'jobs':
+            self.send_error_json(404, 'not found')
+            return
+        job = self.server.jobs.cancel(parts[1])
+        if job is None:
+            self.send_error_json(404, f'no such job: {parts[1]}')
+        else:
+            self.send_json(200, job.summary())
+
+    def send_csv(self, job):
+        from ehf import write_csv_rows
+        buf = io.StringIO(newline='')
+        write_csv_rows(buf, list(job.records))
+        self.send(200, buf.getvalue().encode('utf-8'), 'text/csv; charset=utf-8')
+
+
+class ScraperService(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+    def __init__(self, address, jobs, client, verbose=False):
+        super().__init__(address, ServiceHandler)
+        self.jobs = jobs
+        self.client = client
+        self.verbose = verbose
+
+
+def make_scrape(client, image_opts):
+    """JobQueue に渡す scrape(job)。レコードはロスター順に返す。"""
+    from scrap import iter_url
+
+    def scrape(job):
+        print(f'Job {job.id}: {job.url}')
+        try:
+            yield from iter_url(job.url, client, ordered=True, **image_opts)
+        finally:
+            client.flush_caches()
+    return scrape
+
+
+def main():
+    from scrap import add_client_arguments, build_client, build_enricher, build_image_opts, report_metrics
+    parser = argparse.ArgumentParser(description='Run the scrapers as a local HTTP/JSON service with a job queue')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='Port to listen on')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS, help='Teams scraped in parallel')
+    parser.add_argument('--reuse-seconds', type=float, default=DEFAULT_REUSE_SECONDS,
+                        help='Return the result of a finished job for the same URL if it is newer than this (0 = always scrape)')
+    parser.add_argument('--max-jobs', type=int, default=DEFAULT_MAX_JOBS, help='Finished jobs (with results) kept in memory')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE, help='Max jobs waiting; POST /jobs returns 503 beyond this')
+    parser.add_argument('--verbose', action='store_true', help='Log every API request')
+    add_client_arguments(parser)
+    parser.add_argument('--metrics-prom', metavar='FILE', help='Write request/timing metrics in Prometheus text format to FILE on exit')
+    parser.add_argument('--no-summary', action='store_true', help='Do not print the request/timing summary on exit')
+    args = parser.parse_args()
+
+    if args.parser:
+        import html_parsing
+        html_parsing.set_parser(args.parser)
+
+    client = build_client(args)
+    image_opts = build_image_opts(args)
+    # 選手の詳細はジョブ間で共有する（同じ選手を含むチームを続けて取得しても1回しか取りに行かない）
+    enricher = build_enricher(args, client)
+    if enricher is not None:
+        image_opts['details'] = enricher
+    # 最初のジョブを待たせないように、スクレイパーと画像処理のモジュールを先に読み込んでおく
+    import ehf, ihf, image_utils  # noqa: F401
+    jobs = JobQueue(make_scrape(client, image_opts), workers=args.workers, reuse_seconds=args.reuse_seconds,
+                    max_jobs=args.max_jobs, queue_size=args.queue_size)
+    server = ScraperService((args.host, args.port), jobs, client, verbose=args.verbose)
+    print(f'Listening on http://{args.host}:{server.server_address[1]} ({jobs.workers} workers)')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Shutting down; waiting for running jobs...')
+    finally:
+        server.server_close()
+        jobs.shutdown()
+        if enricher is not None:
+            enricher.close()
+        client.close()
+        report_metrics(args, client.metrics)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,262 @@
+"""選手レコードの出力先（CSV 以外）
+
+チームの処理が終わるたびに sink.write(records, team_url) でレコードを渡し、
+batch_size 件たまるごとにまとめて書き出す。最後に close() で残りを書く。
+レコードを1件ずつ流す場合は write(..., complete=False) で渡し、最後に write([], team_url) で
+ロスターの終わりを知らせる。
+
+- JsonlSink     1選手1行の JSON Lines
+- SqliteSink    SQLite の players テーブルに (team_url, player) をキーにした upsert。
+                チームのロスターを書くたびに、そのチームで居なくなった選手の行は消す
+- ParquetSink   Parquet ファイル（pyarrow が必要）。分析用の列指向の出力
+
+選手のキーは 'ID' 列（EHF は API の選手ID、IHF は選手ページURLのID）。ID の無いレコード
+（EHF の HTML テーブルから取ったものなど）は選手名と背番号。
+
+    with open_sink('sqlite', 'rosters.db') as sink:
+        sink.write(records, team_url)
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+DEFAULT_BATCH_SIZE = 500
+
+FORMATS = ('jsonl', 'sqlite', 'parquet')
+EXTENSIONS = {'jsonl': '.jsonl', 'sqlite': '.db', 'parquet': '.parquet'}
+
+# (列名, レコードのキー)。列指向・DB の出力ではこの順に並べ、残りのキーは extra（JSON）にまとめる
+COLUMNS = (
+    ('number', '背番号'),
+    ('name', '選手名'),
+    ('position', 'Position'),
+    ('age', 'Age'),
+    ('image', 'Image'),
+)
+_KNOWN_KEYS = {key for _, key in COLUMNS} | {'ID'}
+
+
+def player_key(record):
+    if record.get('ID'):
+        return str(record['ID'])
+    # 同じチームの同名の選手が1行にまとまらないように背番号も使う
+    name = str(record.get('選手名') or '')
+    number = str(record.get('背番号') or '')
+    return f'{name}#{number}' if number else name
+
+
+def _age(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _text(value):
+    return '' if value is None else str(value)
+
+
+def flat_row(record, team_url):
+    """列指向・DB 用の1行（dict）。"""
+    from batch import team_name
+    extra = {k: v for k, v in record.items() if k not in _KNOWN_KEYS}
+    return {
+        'team': team_name(team_url),
+        'team_url': team_url,
+        'player': player_key(record),
+        'number': _text(record.get('背番号')),
+        'name': _text(record.get('選手名')),
+        'position': _text(record.get('Position')),
+        'age': _age(record.get('Age')),
+        'image': _text(record.get('Image')),
+        'extra': json.dumps(extra, ensure_ascii=False) if extra else '',
+        'updated': time.time(),
+    }
+
+
+class Sink:
+    """
+    出力先の共通部分（スレッドから同時に write されてもよい）。
+
+    Args:
+        path (str): 出力ファイル。
+        batch_size (int): これだけのレコードがたまったらまとめて書く。
+    """
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.count = 0
+        self._lock = threading.Lock()
+        self._pending = []  # [(team_url, [レコード, ...], complete), ...]
+        self._pending_records = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def write(self, records, team_url='', complete=True):
+        """
+        チームのレコードを渡す。
+
+        complete=True は「このチームのロスターはこれで全部（complete=False で先に渡した分を含む）」の意味で、
+        SqliteSink はそこに含まれなかった選手の行を消す。
+        """
+        with self._lock:
+            self._pending.append((team_url, list(records), complete))
+            self._pending_records += len(records)
+            if self._pending_records >= self.batch_size:
+                self._flush_locked()
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        pending, self._pending, self._pending_records = self._pending, [], 0
+        if pending:
+            self._write_batch(pending)
+            self.count += sum(len(records) for _, records, _ in pending)
+
+    def _write_batch(self, teams):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+        print(f"{self.count} 件のレコードを '{self.path}' に保存しました。")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class JsonlSink(Sink):
+    """1選手1行の JSON Lines に書く（レコードに Team / TeamURL を付ける）。ファイルは実行ごとに作り直す。"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(path, batch_size)
+        open(path, 'w').close()
+
+    def _write_batch(self, teams):
+        from batch import team_name
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for team_url, records, _ in teams:
+                for record in records:
+                    line = dict(record, Team=team_name(team_url), TeamURL=team_url)
+                    f.write(json.dumps(line, ensure_ascii=False) + '\n')
+
+
+class SqliteSink(Sink):
+    """SQLite の players テーブルに (team_url, player) をキーにして upsert する。"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS players (
+            team_url TEXT NOT NULL,
+            player TEXT NOT NULL,
+            team TEXT,
+            number TEXT,
+            name TEXT,
+            position TEXT,
+            age INTEGER,
+            image TEXT,
+            extra TEXT,
+            updated REAL,
+            PRIMARY KEY (team_url, player)
+        );
+        CREATE INDEX IF NOT EXISTS players_team ON players (team);
+        CREATE INDEX IF NOT EXISTS players_name ON players (name);
+    """
+    FIELDS = ('team_url', 'player', 'team', 'number', 'name', 'position', 'age', 'image', 'extra', 'updated')
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        super().__init__(path, batch_size)
+        self._written = {}  # team_url -> 今回書いた選手のキー
+        # write() は複数のスレッドから呼ばれるが、接続の利用は self._lock で直列化している
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(self.SCHEMA)
+        columns = ', '.join(self.FIELDS)
+        placeholders = ', '.join('?' * len(self.FIELDS))
+        updates = ', '.join(f'{f} = excluded.{f}' for f in self.FIELDS[2:])
+        self._upsert = (f'INSERT INTO players ({columns}) VALUES ({placeholders}) '
+                        f'ON CONFLICT (team_url, player) DO UPDATE SET {updates}')
+
+    def _write_batch(self, teams):
+        with self._conn:  # 1バッチを1トランザクションで書く
+            for team_url, records, complete in teams:
+                rows = [flat_row(record, team_url) for record in records]
+                self._conn.executemany(self._upsert, [tuple(row[f] for f in self.FIELDS) for row in rows])
+                written = self._written.setdefault(team_url, set())
+                written.update(row['player'] for row in rows)
+                if not complete:
+                    continue
+                # 今回のロスターに居ない選手（退団）の行を消す
+                keys = list(self._written.pop(team_url))
+                self._conn.execute(
+                    f"DELETE FROM players WHERE team_url = ? AND player NOT IN ({', '.join('?' * len(keys))})",
+                    [team_url, *keys])
+
+    def close(self):
+        super().close()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class ParquetSink(Sink):
+    """Parquet に書く（バッチごとに row group を1つ追加する）。pyarrow が必要。"""
+
+    def __init__(self, path, batch_size=DEFAULT_BATCH_SIZE):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise ImportError("Parquet の出力には pyarrow が必要です: pip install pyarrow")
+        super().__init__(path, batch_size)
+        self._pa = pa
+        self._schema = pa.schema([
+            ('team', pa.string()),
+            ('team_url', pa.string()),
+            ('player', pa.string()),
+            ('number', pa.string()),
+            ('name', pa.string()),
+            ('position', pa.string()),
+            ('age', pa.int32()),
+            ('image', pa.string()),
+            ('extra', pa.string()),
+            ('updated', pa.float64()),
+        ])
+        self._writer = pq.ParquetWriter(path, self._schema)
+
+    def _write_batch(self, teams):
+        rows = [flat_row(record, team_url) for team_url, records, _ in teams for record in records]
+        if rows:
+            self._writer.write_table(self._pa.Table.from_pylist(rows, schema=self._schema))
+
+    def close(self):
+        super().close()
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+def output_path(path, fmt):
+    """CSV 用の出力名なら拡張子を fmt に合わせる（player_roster.csv -> player_roster.db など）。"""
+    root, ext = os.path.splitext(path)
+    return root + EXTENSIONS[fmt] if ext.lower() in ('', '.csv') else path
+
+
+def open_sink(fmt, path, batch_size=DEFAULT_BATCH_SIZE):
+    """fmt（FORMATS のいずれか）の Sink を作る。"""
+    if fmt == 'jsonl':
+        return JsonlSink(path, batch_size)
+    if fmt == 'sqlite':
+        return SqliteSink(path, batch_size)
+    if fmt == 'parquet':
+        return ParquetSink(path, batch_size)
+    raise ValueError(f"unknown output format: {fmt}")
@@ -0,0 +1,92 @@
+"""async_engine の出力が同期版（ehf / ihf）と同じになること（bench のスタブサーバーを相手に）"""
+import asyncio
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'bench'))
+
+pytest.importorskip('aiohttp')
+
+import async_engine  # noqa: E402
+import ehf  # noqa: E402
+import ihf  # noqa: E402
+import image_store  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from stub_server import serve  # noqa: E402
+
+
+@pytest.fixture
+def stub(tmp_path, monkeypatch):
+    # 画像の実体は両方の実行で共有し、選手ごとのリンク（images/...）は別々のディレクトリに作る
+    monkeypatch.setattr(image_store, '_default_store', image_store.ImageStore(str(tmp_path / 'store')))
+    server = serve(players=4)
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def run_sync(scrape, url, workdir, monkeypatch, **kwargs):
+    os.makedirs(workdir)
+    monkeypatch.chdir(workdir)
+    client = HttpClient(metrics=Metrics())
+    try:
+        return scrape(url, client=client, **kwargs)
+    finally:
+        client.close()
+
+
+def run_async(scraper, url, workdir, monkeypatch, **kwargs):
+    os.makedirs(workdir)
+    monkeypatch.chdir(workdir)
+
+    async def main():
+        async with async_engine.AsyncHttpClient(metrics=Metrics()) as client:
+            return await scraper(url, client, **kwargs)
+
+    return asyncio.run(main())
+
+
+def assert_same_images(records, sync_dir, async_dir):
+    for record in records:
+        with open(os.path.join(sync_dir, record['Image']), 'rb') as a, \
+                open(os.path.join(async_dir, record['Image']), 'rb') as b:
+            assert a.read() == b.read()
+
+
+def test_ehf_records_match_the_sync_scraper(stub, tmp_path, monkeypatch):
+    url = f'{stub}/en/team/1/'
+    expected = run_sync(ehf.scrape_player_data, url, tmp_path / 'sync', monkeypatch)
+    records = run_async(async_engine.scrape_ehf, url, tmp_path / 'async', monkeypatch)
+    assert len(expected) == 4
+    assert all(r['Image'] for r in expected)
+    assert records == expected
+    assert_same_images(records, tmp_path / 'sync', tmp_path / 'async')
+
+
+def test_ihf_records_match_the_sync_scraper(stub, tmp_path, monkeypatch):
+    url = f'{stub}/ihf/teams/1'
+    expected = run_sync(ihf.scrape_player_data, url, tmp_path / 'sync', monkeypatch, transcoder=False)
+    records = run_async(async_engine.scrape_ihf, url, tmp_path / 'async', monkeypatch, transcoder=False)
+    assert len(expected) == 4
+    assert all(r['Image'] for r in expected)
+    assert records == expected
+    assert_same_images(records, tmp_path / 'sync', tmp_path / 'async')
+
+
+def test_without_images_no_image_requests_are_sent(stub, tmp_path, monkeypatch):
+    url = f'{stub}/en/team/2/'
+    metrics = Metrics()
+
+    async def main():
+        async with async_engine.AsyncHttpClient(metrics=metrics) as client:
+            return await async_engine.scrape_ehf(url, client, images=False)
+
+    monkeypatch.chdir(tmp_path)
+    records = asyncio.run(main())
+    assert [r['Image'] for r in records] == [''] * 4
+    assert sorted(row[0] for row in metrics.request_rows()) == ['api', 'page']
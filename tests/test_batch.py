@@ -0,0 +1,91 @@
+"""batch の URL 一覧・大会ページからのチームURL・ドメインごとの同時数と出力"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import batch  # noqa: E402
+from metrics import Metrics  # noqa: E402
+
+EHF = 'https://www.eurohandball.com'
+IHF = 'https://www.ihf.info'
+
+
+def test_read_url_file_skips_comments_blanks_and_duplicates(tmp_path):
+    path = tmp_path / 'urls.txt'
+    path.write_text(f'# teams\n{EHF}/en/team/1/\n\n  {EHF}/en/team/2/  \n{EHF}/en/team/1/\n', encoding='utf-8')
+    assert batch.read_url_file(str(path)) == [f'{EHF}/en/team/1/', f'{EHF}/en/team/2/']
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self, content):
+        self.content = content
+        self.metrics = Metrics()
+
+    def get(self, url, **kwargs):
+        return FakeResponse(self.content)
+
+
+def test_discover_team_urls_keeps_page_order_without_duplicates():
+    competition = f'{EHF}/en/competitions/ec/teams/'
+    page = (b'<a href="/en/team/b/Spain/">Spain</a><a href="/en/news/1/">News</a>'
+            b'<a href="/en/team/a/Hungary/#squad">Hungary</a><a href="/en/team/b/Spain/">Spain</a>'
+            b'<a href="/en/competitions/ec/teams/">All teams</a>')
+    assert batch.discover_team_urls(competition, FakeClient(page)) == [
+        f'{EHF}/en/team/b/Spain/', f'{EHF}/en/team/a/Hungary/']
+
+
+def test_team_names_and_filenames():
+    url = f'{EHF}/en/team/stIn7uQUXZbN8q_hMoZNlw/Hungary/'
+    assert batch.team_name(url) == 'Hungary'
+    assert batch.team_filename(url) == 'stIn7uQUXZbN8q_hMoZNlw_Hungary.csv'
+    assert batch.team_filename('https://example.com/') == 'example_com.csv'
+
+
+def test_interleave_by_domain():
+    urls = [f'{EHF}/1', f'{EHF}/2', f'{EHF}/3', f'{IHF}/1', f'{IHF}/2']
+    assert batch.interleave_by_domain(urls) == [f'{EHF}/1', f'{IHF}/1', f'{EHF}/2', f'{IHF}/2', f'{EHF}/3']
+
+
+def test_run_batch_limits_each_domain_and_writes_outputs(tmp_path):
+    urls = [f'{EHF}/en/team/{i}/T{i}/' for i in range(4)] + [f'{IHF}/teams/{i}' for i in range(4)]
+    lock = threading.Lock()
+    running = {}
+    peak = {}
+
+    def scrape(url):
+        host = url.split('/')[2]
+        with lock:
+            running[host] = running.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), running[host])
+        time.sleep(0.02)
+        with lock:
+            running[host] -= 1
+        if url.endswith('/teams/3'):
+            raise RuntimeError('boom')
+        return [{'選手名': url.rsplit('/', 2)[-2]}]
+
+    saved = {}
+
+    def save(data, filename):
+        saved[os.path.basename(filename)] = list(data)
+
+    results = batch.run_batch(urls, scrape, workers=8, per_domain=2, output_dir=str(tmp_path),
+                              combined=str(tmp_path / 'all.csv'), save=save)
+    assert peak == {'www.eurohandball.com': 2, 'www.ihf.info': 2}
+    # 失敗したチームは空のリストで、出力も作らない
+    assert results[f'{IHF}/teams/3'] == []
+    assert sorted(name for name in saved if name != 'all.csv') == sorted(
+        batch.team_filename(url) for url in urls[:7])
+    combined = saved['all.csv']
+    assert [row['Team'] for row in combined] == ['T0', 'T1', 'T2', 'T3', '0', '1', '2']
@@ -0,0 +1,31 @@
+"""crawler.Frontier の永続化"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crawler import Frontier, normalize_url  # noqa: E402
+
+
+def test_normalize_url():
+    assert normalize_url('HTTPS://Www.IHF.info:443/teams/1#roster') == 'https://www.ihf.info/teams/1/'
+
+
+def test_torn_last_line_does_not_swallow_the_next_entry(tmp_path):
+    path = str(tmp_path / 'frontier.jsonl')
+    frontier = Frontier(path)
+    frontier.add_team('https://www.ihf.info/teams/1')
+    frontier.add_team('https://www.ihf.info/teams/2')
+    # close() は詰め直すので、追記ログのまま途中で止まった状態を作る
+    frontier._file.close()
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-5])
+
+    frontier = Frontier(path)
+    frontier.add_team('https://www.ihf.info/teams/3')
+    frontier._file.close()
+
+    teams = Frontier(path).teams
+    assert set(teams) == {'https://www.ihf.info/teams/1/', 'https://www.ihf.info/teams/3/'}
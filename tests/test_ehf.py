@@ -0,0 +1,141 @@
+"""ehf.iter_player_data のページ取得"""
+import io
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ehf  # noqa: E402
+from metrics import Metrics  # noqa: E402
+
+
+class FakeResponse:
+    def __init__(self, status):
+        self.status_code = status
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.exceptions.HTTPError(f'{self.status_code} error')
+
+    def iter_content(self, size):
+        return iter([b'<html>'])
+
+    def close(self):
+        self.closed = True
+
+
+class FakeClient:
+    def __init__(self, response):
+        self.response = response
+        self.metrics = Metrics()
+        self.bodies = {}
+
+    def get(self, url, **kwargs):
+        return self.response
+
+    def remember_body(self, url, body):
+        self.bodies[url] = body
+
+
+def test_error_status_closes_the_streamed_response():
+    response = FakeResponse(503)
+    client = FakeClient(response)
+    assert list(ehf.iter_player_data('https://www.eurohandball.com/en/team/1/', client=client)) == []
+    assert response.closed
+
+
+TAG = b'<div class="roster" data-club-details-url="/api/clubdetails" data-club-id="42">'
+
+
+def test_marker_split_across_chunks_is_found():
+    page = b'<html>' + b'a' * 100 + TAG + b'rest'
+    cut = 106 + len(TAG) // 2
+    attrs, head = ehf.extract_club_details(iter([page[:cut], page[cut:]]))
+    assert attrs['data-club-id'] == '42'
+    assert head == page
+
+
+def test_no_marker_reads_everything_for_the_table_fallback():
+    page = b'<table><tr><td>7</td><td>A B</td></tr></table>'
+    chunks = [page[i:i + 10] for i in range(0, len(page), 10)]
+    attrs, head = ehf.extract_club_details(iter(chunks))
+    assert attrs is None
+    assert head == page
+    assert ehf.parse_table_rows(head) == [{'背番号': '7', '選手名': 'A B'}]
+
+
+def test_stops_before_the_last_chunk():
+    chunks = iter([b'<html>', TAG, b'x' * 100, b'y' * 100])
+    attrs, head = ehf.extract_club_details(chunks)
+    assert attrs['data-club-details-url'] == '/api/clubdetails'
+    assert head == b'<html>' + TAG
+    # 残りのチャンクは読まれていない
+    assert list(chunks) == [b'x' * 100, b'y' * 100]
+
+
+class StreamResponse(FakeResponse):
+    def __init__(self, chunks, json_data=None):
+        super().__init__(200)
+        self.chunks = iter(chunks)
+        self.json_data = json_data
+        self.content = b''
+
+    def iter_content(self, size):
+        return self.chunks
+
+    def json(self):
+        return self.json_data
+
+
+class RoutedClient(FakeClient):
+    def __init__(self, responses):
+        super().__init__(None)
+        self.responses = responses
+
+    def get(self, url, **kwargs):
+        return self.responses[url]
+
+    def host_limiter(self, per_host):
+        return None
+
+    def flush_caches(self):
+        pass
+
+
+def test_empty_api_roster_remembers_the_page_for_debug():
+    url = 'https://www.eurohandball.com/en/team/1/'
+    page = StreamResponse([b'<html>', TAG, b'<p>rest</p>'])
+    api = StreamResponse([], json_data={'players': []})
+    client = RoutedClient({url: page, 'https://www.eurohandball.com/api/clubdetails': api})
+    assert list(ehf.iter_player_data(url, client=client, images=False)) == []
+    assert client.bodies[url] == b'<html>' + TAG + b'<p>rest</p>'
+    assert page.closed
+
+
+class FlushCounter(io.StringIO):
+    def __init__(self):
+        super().__init__(newline='')
+        self.flushes = 0
+
+    def flush(self):
+        self.flushes += 1
+        super().flush()
+
+
+def test_csv_rows_from_a_generator_are_flushed_in_batches(monkeypatch):
+    monkeypatch.setattr(ehf, 'CSV_FLUSH_SECONDS', 3600)
+    out = FlushCounter()
+    rows = ({'選手名': f'P{i}', 'ID': str(i)} for i in range(120))
+    assert ehf.write_csv_rows(out, rows) == 120
+    # 50 行ごと（残りはファイルを閉じるときに書き出される）
+    assert out.flushes == 2
+    assert len(out.getvalue().splitlines()) == 121
+
+    # 時間の間隔でも書き出す（遅い画像取得で行がなかなか揃わない場合）
+    monkeypatch.setattr(ehf, 'CSV_FLUSH_SECONDS', 0)
+    out = FlushCounter()
+    ehf.write_csv_rows(out, ({'選手名': f'P{i}'} for i in range(3)))
+    assert out.flushes == 2
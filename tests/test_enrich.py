@@ -0,0 +1,50 @@
+"""enrich の選手ページの解析と、詳細キャッシュの期限"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from enrich import DETAIL_FIELDS, DetailCache, Enricher, parse_details  # noqa: E402
+
+FULL = {'Nationality': 'Norway', 'Club': 'Kolstad', 'Height': '190 cm', 'Birthdate': '1998-04-12'}
+
+
+def test_parse_details_from_json_ld_and_definition_list():
+    page = (b'<html><head><script type="application/ld+json">'
+            b'{"@type": "Person", "nationality": {"name": "Norway"}, "birthDate": "1998-04-12"}'
+            b'</script></head><body><dl><dt>Club</dt><dd>Kolstad</dd><dt>Height:</dt><dd>190 cm</dd></dl>'
+            b'</body></html>')
+    assert parse_details(page) == FULL
+
+
+def test_covers_follows_the_cache_ttl(tmp_path):
+    cache = DetailCache(str(tmp_path / 'details.json'), ttl=60, negative_ttl=10)
+    enricher = Enricher(client=None, cache=cache)
+    record = dict(FULL, 選手名='A')
+
+    # 前回の出力に列があっても、キャッシュに無ければ取り直す
+    assert not enricher.covers('ehf:1', record)
+    cache.store('ehf:1', FULL)
+    assert enricher.covers('ehf:1', record)
+    # 列の無いレコード（--details 無しで出力したもの）は使い回さない
+    assert not enricher.covers('ehf:1', {'選手名': 'A'})
+
+    # 期限が切れたら取り直す（取得できなかった選手は negative_ttl で）
+    cache.store('ehf:2', {})
+    cache._players['ehf:1']['ts'] = time.time() - 61
+    cache._players['ehf:2']['ts'] = time.time() - 11
+    assert not enricher.covers('ehf:1', record)
+    assert not enricher.covers('ehf:2', dict.fromkeys(DETAIL_FIELDS, ''))
+
+
+def test_players_without_a_page_request_are_still_current(tmp_path):
+    cache = DetailCache(str(tmp_path / 'details.json'))
+    enricher = Enricher(client=None, cache=cache)
+    # ロスターの応答で全項目が分かる選手・選手ページの無い選手は取得しないが、キャッシュには記録する
+    assert enricher.submit('ehf:1', 'https://www.eurohandball.com/p/1', FULL).result() == FULL
+    assert enricher.submit('ehf:2', '', {'Club': 'Kolstad'}).result() == {'Club': 'Kolstad'}
+    assert enricher.covers('ehf:1', dict(FULL))
+    assert enricher.covers('ehf:2', dict.fromkeys(DETAIL_FIELDS, ''))
+    enricher.close()
+    assert DetailCache(str(tmp_path / 'details.json')).lookup('ehf:1') == FULL
@@ -0,0 +1,43 @@
+"""ihf.parse_players の選手と画像の対応付け"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from html_parsing import make_soup  # noqa: E402
+import ihf  # noqa: E402
+
+PAGE = b'''<html><body>
+<div class="roster">
+  <div class="card"><a href="/players/1">Alice</a><img src="/img/alice.jpg"></div>
+  <div class="card"><a href="/players/2">Bob</a><img src="/img/bob.jpg"></div>
+  <div class="card"><figure><img src="/img/carl.jpg"></figure><p><a href="/players/3">Carl</a></p></div>
+  <div class="card"><a href="/players/4">Dan</a></div>
+  <a href="/players/5"><img src="/img/eve.jpg">Eve</a>
+</div>
+</body></html>'''
+
+
+def images_by_name(page=PAGE):
+    soup = make_soup(page)
+    return {record['選手名']: image and image[0]
+            for record, image, _ in ihf.parse_players(soup, 'https://www.ihf.info/teams/1')}
+
+
+def test_image_is_taken_from_the_players_own_card():
+    images = images_by_name()
+    assert images['Alice'] == 'https://www.ihf.info/img/alice.jpg'
+    assert images['Bob'] == 'https://www.ihf.info/img/bob.jpg'
+    assert images['Carl'] == 'https://www.ihf.info/img/carl.jpg'
+    assert images['Eve'] == 'https://www.ihf.info/img/eve.jpg'
+
+
+def test_player_without_photo_gets_no_image():
+    assert images_by_name()['Dan'] is None
+
+
+def test_player_link_and_id():
+    soup = make_soup(PAGE)
+    players = [player for _, _, player in ihf.parse_players(soup, 'https://www.ihf.info/teams/1')]
+    assert players[0] == ('1', 'https://www.ihf.info/players/1')
+    assert len(players) == 5
@@ -0,0 +1,76 @@
+"""image_utils.iter_image_fetch の手順（同期版・asyncio 版で共通）"""
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_store import ImageStore  # noqa: E402
+from image_utils import (iter_image_fetch, PROBE, CONTENT_TYPE, IMAGE_SIZE, DOWNLOAD,  # noqa: E402
+                         TRANSCODE)
+
+BASE = 'https://cdn.example/img/w180/a.jpg'
+
+
+def candidates(url):
+    return [(token, url.replace('w180', token)) for token in ('w2048', 'w1024')]
+
+
+def drive(steps, results):
+    """results[種類](op) で各ステップを実行し、(実行したステップ, 保存先のパス) を返す。"""
+    ops = []
+    try:
+        op = next(steps)
+        while True:
+            ops.append(op)
+            op = steps.send(results[op[0]](op))
+    except StopIteration as done:
+        return ops, done.value
+
+
+def write(op, body=b'image'):
+    with open(op[2], 'wb') as f:
+        f.write(body)
+    return hashlib.sha256(body).hexdigest()
+
+
+def test_small_images_are_not_downloaded(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    steps = iter_image_fetch(BASE, str(tmp_path / 'ihf'), '1', 'A B', store, variants=(candidates,),
+                             check_size=True, transcode=True)
+    ops, path = drive(steps, {PROBE: lambda op: '/w1024/' in op[1], IMAGE_SIZE: lambda op: (300, 300)})
+    assert path == ''
+    assert [op[0] for op in ops] == [PROBE, PROBE, IMAGE_SIZE]
+    assert ops[-1][1].endswith('/w1024/a.jpg')
+
+
+def test_download_is_linked_and_reused(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    images_dir = str(tmp_path / 'ehf')
+    url = 'https://cdn.example/photo'
+    steps = iter_image_fetch(url, images_dir, 'p1', 'A B', store)
+    ops, path = drive(steps, {CONTENT_TYPE: lambda op: 'image/png', DOWNLOAD: write})
+    assert [op[0] for op in ops] == [CONTENT_TYPE, DOWNLOAD]
+    assert path == os.path.join(images_dir, 'p1_A_B.png')
+    assert open(path, 'rb').read() == b'image'
+
+    # 取得済みのURLは名前が変わってもストアの実体にリンクするだけ
+    ops, renamed = drive(iter_image_fetch(url, images_dir, 'p1', 'A C', store), {})
+    assert ops == []
+    assert renamed == os.path.join(images_dir, 'p1_A_C.png')
+
+
+def test_transcoded_file_is_stored(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    images_dir = str(tmp_path / 'ihf')
+
+    def transcode(op):
+        converted = os.path.splitext(op[1])[0] + '.webp'
+        os.replace(op[1], converted)
+        return converted
+
+    steps = iter_image_fetch(BASE, images_dir, '1', 'A B', store, check_size=True, transcode=True)
+    ops, path = drive(steps, {IMAGE_SIZE: lambda op: None, DOWNLOAD: write, TRANSCODE: transcode})
+    assert [op[0] for op in ops] == [IMAGE_SIZE, DOWNLOAD, TRANSCODE]
+    assert path == os.path.join(images_dir, '1_A_B.webp')
+    assert store.blob_for_url(BASE).endswith('.webp')
@@ -0,0 +1,37 @@
+"""image_jobs の同一ホストの同時数制限"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import HttpClient  # noqa: E402
+from image_jobs import ImageJob, run_image_jobs  # noqa: E402
+
+
+def test_per_host_limit_is_shared_between_concurrent_teams():
+    client = HttpClient()
+    lock = threading.Lock()
+    running = {'now': 0, 'max': 0}
+
+    def fetch():
+        with lock:
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+        time.sleep(0.02)
+        with lock:
+            running['now'] -= 1
+        return 'x.jpg'
+
+    def team():
+        jobs = [ImageJob({}, 'https://img.example/a.jpg', fetch) for _ in range(4)]
+        run_image_jobs(jobs, max_workers=4, limiter=client.host_limiter(2))
+
+    teams = [threading.Thread(target=team) for _ in range(3)]
+    for t in teams:
+        t.start()
+    for t in teams:
+        t.join()
+    assert running['max'] == 2
+    assert client.host_limiter(2) is client.host_limiter(2)
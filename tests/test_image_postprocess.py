@@ -0,0 +1,49 @@
+"""image_postprocess.TranscodePool と、変換済みファイルの読み飛ばし"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip('PIL')
+from PIL import Image  # noqa: E402
+
+from image_postprocess import TranscodePool, iter_image_files  # noqa: E402
+from image_utils import MIN_DIMENSION  # noqa: E402
+
+
+def make_image(path, size, fmt):
+    Image.new('RGB', (size, size), (30, 90, 160)).save(path, fmt)
+    return str(path)
+
+
+def test_pool_converts_in_worker_processes(tmp_path):
+    gif = make_image(tmp_path / 'a.gif', MIN_DIMENSION, 'GIF')
+    jpg = make_image(tmp_path / 'b.jpg', MIN_DIMENSION, 'JPEG')
+    small = make_image(tmp_path / 'c.jpg', MIN_DIMENSION // 2, 'JPEG')
+
+    with TranscodePool(max_workers=2) as pool:
+        futures = [pool.submit(path) for path in (gif, jpg, small)]
+        results = [fut.result(timeout=60) for fut in futures]
+        assert pool._pool is not None
+    assert pool._pool is None
+
+    # GIF は PNG に、JPEG はそのまま再保存、小さい画像は削除
+    assert results == [str(tmp_path / 'a.png'), jpg, '']
+    assert sorted(os.listdir(tmp_path)) == ['a.png', 'b.jpg', 'manifest.jsonl']
+    with Image.open(results[0]) as img:
+        assert img.format == 'PNG'
+
+    # 変換済み（manifest の sha256 と一致する）ファイルは次回の対象にしない
+    assert list(iter_image_files(str(tmp_path))) == []
+    assert list(iter_image_files(str(tmp_path), force=True)) == [results[0], jpg]
+    with open(jpg, 'ab') as f:
+        f.write(b'changed')
+    assert list(iter_image_files(str(tmp_path))) == [jpg]
+
+
+def test_pool_starts_on_first_submit():
+    pool = TranscodePool(max_workers=1)
+    assert pool._pool is None
+    pool.shutdown()
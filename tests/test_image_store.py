@@ -0,0 +1,77 @@
+"""image_store.ImageStore の内容アドレスでの重複排除とリンクの張り替え"""
+import hashlib
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_store import ImageStore  # noqa: E402
+
+
+def put(store, body, url, ext='.jpg'):
+    path = store.temp_path(ext)
+    with open(path, 'wb') as f:
+        f.write(body)
+    return store.ingest(path, url)
+
+
+def test_same_content_is_stored_once(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    first = put(store, b'photo', 'https://cdn.example/w180/a.jpg')
+    second = put(store, b'photo', 'https://cdn.example/w1024/a.jpg')
+    other = put(store, b'other', 'https://cdn.example/b.jpg')
+
+    sha = hashlib.sha256(b'photo').hexdigest()
+    assert first == second == os.path.join(store.root, 'blobs', sha[:2], sha + '.jpg')
+    assert other != first
+    blobs = [name for _, _, names in os.walk(store.blob_dir) for name in names]
+    assert len(blobs) == 2
+    # 取り込んだ作業用ファイルは残らない
+    assert os.listdir(store.tmp_dir) == []
+    assert store.blob_for_url('https://cdn.example/w1024/a.jpg') == first
+
+    # 対応表は flush() で書き出し、次回の起動で読み戻す
+    store.flush()
+    assert ImageStore(store.root).blob_for_url('https://cdn.example/w180/a.jpg') == first
+
+
+def test_missing_blob_is_fetched_again(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    blob = put(store, b'photo', 'https://cdn.example/a.jpg')
+    os.remove(blob)
+    assert store.blob_for_url('https://cdn.example/a.jpg') is None
+
+
+def test_player_link_follows_renames_and_new_photos(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    images_dir = tmp_path / 'ehf'
+    old = put(store, b'old photo', 'https://cdn.example/old.jpg')
+    new = put(store, b'new photo', 'https://cdn.example/new.jpg')
+
+    first = str(images_dir / 'p1_A_B.jpg')
+    store.link(old, first, player_key='ehf/p1', url='https://cdn.example/old.jpg')
+    assert os.path.islink(first)
+    assert open(first, 'rb').read() == b'old photo'
+
+    # 選手名が変わったら新しい名前でリンクし、前のリンクは消す（実体は残す）
+    renamed = str(images_dir / 'p1_A_C.jpg')
+    store.link(old, renamed, player_key='ehf/p1', url='https://cdn.example/old.jpg')
+    assert not os.path.lexists(first)
+    assert os.path.exists(old)
+    assert store.player('ehf/p1')['path'] == renamed
+
+    # 同じ名前で写真が変わったらリンク先を張り替える
+    store.link(new, renamed, player_key='ehf/p1', url='https://cdn.example/new.jpg')
+    assert open(renamed, 'rb').read() == b'new photo'
+    assert os.path.realpath(renamed) == os.path.realpath(new)
+    assert sorted(os.listdir(images_dir)) == ['manifest.jsonl', 'p1_A_C.jpg']
+    assert len((images_dir / 'manifest.jsonl').read_text().splitlines()) == 3
+
+
+def test_relinking_the_same_blob_is_a_no_op(tmp_path):
+    store = ImageStore(str(tmp_path / 'store'))
+    blob = put(store, b'photo', 'https://cdn.example/a.jpg')
+    dest = str(tmp_path / 'ehf' / 'p1.jpg')
+    store.link(blob, dest)
+    store.link(blob, dest)
+    assert len((tmp_path / 'ehf' / 'manifest.jsonl').read_text().splitlines()) == 1
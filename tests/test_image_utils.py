@@ -0,0 +1,86 @@
+"""image_utils.download_to_file の一時ファイルと rename"""
+import hashlib
+import json
+import os
+import sys
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from image_utils import MANIFEST_NAME, download_to_file  # noqa: E402
+
+URL = 'https://cdn.example/a.jpg'
+
+
+class FakeResponse:
+    def __init__(self, chunks, status_code=200, headers=None, fail_after=None):
+        self.chunks = chunks
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.fail_after = fail_after
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f'{self.status_code} error')
+
+    def iter_content(self, size):
+        for i, chunk in enumerate(self.chunks):
+            if i == self.fail_after:
+                raise requests.exceptions.ChunkedEncodingError('connection broken')
+            yield chunk
+
+
+class FakeClient:
+    def __init__(self, response):
+        self.response = response
+
+    def get(self, url, **kwargs):
+        assert kwargs['stream'] and kwargs['phase'] == 'download'
+        return self.response
+
+
+def leftovers(directory):
+    return [name for name in os.listdir(directory) if name.endswith('.part')]
+
+
+def test_download_is_renamed_into_place_and_recorded(tmp_path):
+    path = str(tmp_path / 'a.jpg')
+    body = [b'abc', b'def']
+    digest = download_to_file(URL, path, FakeClient(FakeResponse(body, headers={'Content-Length': '6'})))
+    assert digest == hashlib.sha256(b'abcdef').hexdigest()
+    assert open(path, 'rb').read() == b'abcdef'
+    assert leftovers(tmp_path) == []
+    entry = json.loads((tmp_path / MANIFEST_NAME).read_text(encoding='utf-8'))
+    assert (entry['file'], entry['sha256'], entry['bytes'], entry['url']) == ('a.jpg', digest, 6, URL)
+
+
+@pytest.mark.parametrize('response, error', [
+    (FakeResponse([b'abc', b'def'], fail_after=1), requests.exceptions.ChunkedEncodingError),
+    (FakeResponse([b'abc'], headers={'Content-Length': '6'}), IOError),
+    (FakeResponse([b'not found'], status_code=404), requests.HTTPError),
+])
+def test_failed_download_leaves_no_partial_file(tmp_path, response, error):
+    path = tmp_path / 'a.jpg'
+    # 前回の画像は途中で失敗しても壊さない
+    path.write_bytes(b'old')
+    with pytest.raises(error):
+        download_to_file(URL, str(path), FakeClient(response))
+    assert path.read_bytes() == b'old'
+    assert leftovers(tmp_path) == []
+    assert not (tmp_path / MANIFEST_NAME).exists()
+
+
+def test_compressed_download_skips_the_length_check(tmp_path):
+    path = str(tmp_path / 'a.jpg')
+    response = FakeResponse([b'abcdef'], headers={'Content-Length': '3', 'Content-Encoding': 'gzip'})
+    download_to_file(URL, path, FakeClient(response), manifest=False)
+    assert open(path, 'rb').read() == b'abcdef'
+    assert not (tmp_path / MANIFEST_NAME).exists()
@@ -0,0 +1,42 @@
+"""journal.JobJournal の再開と、書き込み途中で止まった最終行の扱い"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from journal import JobJournal  # noqa: E402
+
+
+def tear_last_line(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-10])
+
+
+def test_torn_last_line_is_dropped_and_later_entries_survive(tmp_path):
+    path = str(tmp_path / 'job.jsonl')
+    with JobJournal(path) as journal:
+        journal.record_urls(['a', 'b', 'c'])
+        journal.record_team('a', [{'選手名': 'A'}])
+        journal.record_team('b', [{'選手名': 'B'}])
+    tear_last_line(path)
+
+    # 1回目の再開: 途中で切れた b は取り直し、c を記録する
+    with JobJournal(path, resume=True) as journal:
+        assert set(journal.completed) == {'a'}
+        journal.record_team('c', [{'選手名': 'C'}])
+
+    # 2回目の再開: 1回目に追記した c が読める
+    with JobJournal(path, resume=True) as journal:
+        assert journal.urls == ['a', 'b', 'c']
+        assert set(journal.completed) == {'a', 'c'}
+        journal.record_team('b', [{'選手名': 'B'}])
+
+    with JobJournal(path, resume=True) as journal:
+        assert set(journal.completed) == {'a', 'b', 'c'}
+
+
+def test_resume_without_a_journal_starts_empty(tmp_path):
+    with JobJournal(str(tmp_path / 'jobs' / 'new.jsonl'), resume=True) as journal:
+        assert journal.urls is None and journal.completed == {}
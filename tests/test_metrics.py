@@ -0,0 +1,123 @@
+"""metrics.Metrics の集計・JSON Lines・Prometheus 出力と、HttpClient のストリーム応答のバイト数"""
+import io
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import HttpClient  # noqa: E402
+from metrics import Metrics  # noqa: E402
+
+PAGE = 'https://www.eurohandball.com/en/team/1/'
+IMAGE = 'https://www.eurohandball.com/img/a.jpg'
+
+
+def sample(metrics):
+    metrics.record_request('GET', PAGE, 'page', 200, 0.25, cache='miss', nbytes=1000)
+    metrics.record_request('GET', PAGE, 'page', 200, 0.05, cache='hit', nbytes=0)
+    metrics.record_request('HEAD', IMAGE, 'probe', 404, 0.01)
+    metrics.record_request('GET', IMAGE, 'download', None, 1.5)
+    with metrics.timer('parse.page'):
+        pass
+
+
+def test_request_rows_and_jsonl(tmp_path):
+    path = tmp_path / 'requests.jsonl'
+    metrics = Metrics(jsonl_path=str(path))
+    sample(metrics)
+    metrics.close()
+
+    host = 'www.eurohandball.com'
+    assert [row[:6] for row in metrics.request_rows()] == [
+        ('page', host, 2, 0, 1, 1000),
+        ('probe', host, 1, 1, 0, 0),
+        ('download', host, 1, 1, 0, 0),
+    ]
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [(e['method'], e['phase'], e['status'], e['bytes'], e['cache']) for e in lines] == [
+        ('GET', 'page', 200, 1000, 'miss'),
+        ('GET', 'page', 200, 0, 'hit'),
+        ('HEAD', 'probe', 404, 0, ''),
+        ('GET', 'download', None, 0, ''),
+    ]
+    assert lines[0]['host'] == host and lines[0]['latency'] == 0.25
+
+
+def test_prometheus_text(tmp_path):
+    metrics = Metrics()
+    sample(metrics)
+    path = tmp_path / 'metrics.prom'
+    metrics.write_prometheus(str(path))
+    text = path.read_text()
+    labels = 'phase="page",host="www.eurohandball.com",status="200",cache="miss"'
+    assert f'scraper_http_requests_total{{{labels}}} 1' in text
+    assert f'scraper_http_response_bytes_total{{{labels}}} 1000' in text
+    assert f'scraper_http_request_seconds_sum{{{labels}}} 0.250000' in text
+    assert 'scraper_http_requests_total{phase="download",host="www.eurohandball.com",status="error",cache="none"} 1' in text
+    assert 'scraper_stage_seconds_count{stage="parse.page"} 1' in text
+    # HELP / TYPE 以外の行は「名前{ラベル} 値」
+    for line in text.splitlines():
+        if not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            assert name.endswith('}') and float(value) >= 0
+
+
+class FakeSession:
+    def __init__(self, body):
+        self.body = body
+
+    def request(self, method, url, **kwargs):
+        resp = requests.Response()
+        resp.url = url
+        resp.status_code = 200
+        resp.raw = io.BytesIO(self.body)
+        return resp
+
+
+def client_for(body, tmp_path):
+    metrics = Metrics(jsonl_path=str(tmp_path / 'requests.jsonl'))
+    client = HttpClient(metrics=metrics)
+    client._sessions['www.eurohandball.com'] = FakeSession(body)
+    return client, metrics
+
+
+def recorded_bytes(metrics):
+    return sum(row[5] for row in metrics.request_rows())
+
+
+def test_streamed_body_is_counted_when_read(tmp_path):
+    body = b'x' * 10000
+    client, metrics = client_for(body, tmp_path)
+
+    # iter_content で最後まで読んだ応答
+    resp = client.get(IMAGE, stream=True, phase='download')
+    assert b''.join(resp.iter_content(4096)) == body
+    assert recorded_bytes(metrics) == 10000
+
+    # 先頭だけ読んでやめた応答は読んだ分だけ
+    resp = client.get(IMAGE, stream=True, phase='probe')
+    chunks = resp.iter_content(1024)
+    next(chunks)
+    chunks.close()
+    resp.close()
+    assert recorded_bytes(metrics) == 11024
+
+    # resp.content も iter_content を通る
+    resp = client.get(PAGE, stream=True)
+    assert resp.content == body
+    assert recorded_bytes(metrics) == 21024
+
+    # 読まなかった応答は report 時に 0 バイトで確定する
+    client.get(IMAGE, stream=True, phase='probe').close()
+    metrics.close()
+    lines = (tmp_path / 'requests.jsonl').read_text().splitlines()
+    assert [json.loads(line)['bytes'] for line in lines] == [10000, 1024, 10000, 0]
+
+
+def test_non_streamed_body_is_counted_immediately(tmp_path):
+    client, metrics = client_for(b'y' * 300, tmp_path)
+    client.get(PAGE)
+    assert recorded_bytes(metrics) == 300
@@ -0,0 +1,74 @@
+"""probe_cache.resolve_variant の候補の順序とキャッシュ（ホストごとのトークンの学習を含む）"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from probe_cache import ProbeCache, resolve_variant, RECHECK_AFTER  # noqa: E402
+
+BASE = 'https://cdn.example/img/'
+TOKENS = ('w2048', 'w1024', 'w512')
+
+
+def candidates(name):
+    return [(token, f'{BASE}{token}/{name}.jpg') for token in TOKENS]
+
+
+def recording(exists):
+    probed = []
+
+    def probe(url):
+        probed.append(url)
+        return exists(url)
+    return probe, probed
+
+
+def test_second_player_skips_tokens_that_never_resolved_on_the_host(tmp_path):
+    cache = ProbeCache(str(tmp_path / 'probe.json'))
+    probe, probed = recording(lambda u: '/w2048/' not in u)
+    assert resolve_variant(BASE + 'a.jpg', candidates('a'), probe, cache).endswith('/w1024/a.jpg')
+    assert len(probed) == 2
+
+    probed.clear()
+    assert resolve_variant(BASE + 'b.jpg', candidates('b'), probe, cache).endswith('/w1024/b.jpg')
+    # w2048 はこのホストで存在したことが無いので確認しない
+    assert probed == [f'{BASE}w1024/b.jpg']
+
+    # 別のホストでは学習結果を使わない
+    other = 'https://other.example/img/'
+    probed.clear()
+    resolve_variant(other + 'c.jpg', [(t, f'{other}{t}/c.jpg') for t in TOKENS], probe, cache)
+    assert probed[0] == f'{other}w2048/c.jpg'
+
+
+def test_order_is_kept_and_skipped_tokens_are_rechecked(tmp_path):
+    cache = ProbeCache(str(tmp_path / 'probe.json'))
+    # 1人目は w512 しか無い
+    resolve_variant(BASE + 'a.jpg', candidates('a'), lambda u: '/w512/' in u, cache)
+    probe, probed = recording(lambda u: True)
+    for i in range(RECHECK_AFTER):
+        resolve_variant(f'{BASE}p{i}.jpg', candidates(f'p{i}'), probe, cache)
+    assert all('/w512/' in u for u in probed)
+
+    # RECHECK_AFTER 回飛ばしたら大きいサイズから確認し直し、存在すれば以後はそれを使う
+    probed.clear()
+    assert resolve_variant(BASE + 'b.jpg', candidates('b'), probe, cache).endswith('/w2048/b.jpg')
+    assert probed == [f'{BASE}w2048/b.jpg']
+    probed.clear()
+    assert resolve_variant(BASE + 'c.jpg', candidates('c'), probe, cache).endswith('/w2048/c.jpg')
+    assert probed == [f'{BASE}w2048/c.jpg']
+
+
+def test_known_misses_are_skipped_after_reload(tmp_path):
+    path = str(tmp_path / 'probe.json')
+    cache = ProbeCache(path)
+    resolve_variant(BASE + 'a.jpg', candidates('a'), lambda u: '/w512/' in u, cache)
+    cache.save()
+
+    probed = []
+    reloaded = ProbeCache(path)
+    # 元URLの解決結果を捨てても、存在しなかった候補・存在した候補は確認し直さない
+    reloaded._resolved.clear()
+    url = resolve_variant(BASE + 'a.jpg', candidates('a'), lambda u: probed.append(u) or True, reloaded)
+    assert url.endswith('/w512/a.jpg')
+    assert probed == []
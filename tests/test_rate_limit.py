@@ -0,0 +1,89 @@
+"""rate_limit.RequestScheduler のトークンバケットと優先度"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limit import RequestScheduler, parse_retry_after  # noqa: E402
+
+URL = 'https://cdn.example/a.jpg'
+OTHER = 'https://other.example/a.jpg'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill_at_rate():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=4.0, burst=3, clock=clock)
+    for _ in range(3):
+        assert scheduler.delay(URL) == 0
+        scheduler.acquire(URL)
+    assert scheduler.delay(URL) == 0.25
+
+    clock.now += 0.5
+    # 0.5 秒で 2 トークン戻る
+    scheduler.acquire(URL)
+    scheduler.acquire(URL)
+    assert scheduler.delay(URL) == 0.25
+
+    # 長く空いてもバケットの容量（burst）までしか溜まらない
+    clock.now += 60
+    for _ in range(3):
+        scheduler.acquire(URL)
+    assert scheduler.delay(URL) > 0
+
+
+def test_hosts_have_separate_buckets():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=1.0, burst=1, clock=clock)
+    scheduler.acquire(URL)
+    assert scheduler.delay(URL) == 1.0
+    assert scheduler.delay(OTHER) == 0
+    scheduler.defer(URL, 30)
+    assert scheduler.delay(URL) == 30
+    assert scheduler.delay(OTHER) == 0
+
+
+def test_retry_after_values():
+    assert parse_retry_after('5') == 5.0
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT', now=1445412470.0) == 10.0
+    assert parse_retry_after('soon') is None
+
+
+def test_pages_and_api_go_before_images_and_probes():
+    clock = FakeClock()
+    scheduler = RequestScheduler(rate=10.0, burst=1, clock=clock)
+    scheduler.acquire(URL)
+    state = scheduler._host(URL)
+    order = []
+
+    def request(phase):
+        scheduler.acquire(URL, phase)
+        order.append(phase)
+
+    threads = []
+    for phase in ('probe', 'download', 'page', 'api'):
+        thread = threading.Thread(target=request, args=(phase,))
+        thread.start()
+        threads.append(thread)
+        # 到着順を確定させてから次を並べる
+        while len(state.waiting) < len(threads):
+            time.sleep(0.001)
+
+    for sent in range(1, 5):
+        clock.now += 0.1
+        deadline = time.monotonic() + 5
+        while len(order) < sent and time.monotonic() < deadline:
+            time.sleep(0.005)
+        assert len(order) == sent
+    for thread in threads:
+        thread.join(5)
+    assert order == ['page', 'api', 'download', 'probe']
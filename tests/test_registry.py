@@ -0,0 +1,51 @@
+"""registry のホストによるスクレイパーの振り分け"""
+import os
+import sys
+import types
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import registry  # noqa: E402
+import scrap  # noqa: E402
+from registry import DEFAULT_SCRAPER, SCRAPERS, find_scraper  # noqa: E402
+
+
+@pytest.mark.parametrize('url, module', [
+    ('https://www.eurohandball.com/en/team/1/', 'ehf'),
+    ('https://eurohandball.com/en/team/1/', 'ehf'),
+    ('https://www.ihf.info/competitions/men/teams/1', 'ihf'),
+    ('https://ihf.info/teams/1', 'ihf'),
+    ('https://WWW.IHF.INFO:443/teams/1', 'ihf'),
+    ('https://live.stats.ihf.info/teams/1', 'ihf'),
+    # 登録ホストを含むだけの別ドメインはサブドメインではない
+    ('https://notihf.info/teams/1', 'ehf'),
+    ('https://ihf.info.example.com/teams/1', 'ehf'),
+    ('https://example.com/roster', 'ehf'),
+])
+def test_host_and_subdomain_matching(url, module):
+    assert find_scraper(url).module == module
+
+
+def test_unknown_hosts_use_the_default_scraper():
+    assert find_scraper('http://127.0.0.1:8765/en/team/1/') is DEFAULT_SCRAPER
+
+
+def test_async_engine_covers_every_registered_module():
+    import async_engine
+    assert {scraper.module for scraper in SCRAPERS.values()} == set(async_engine.SCRAPERS)
+
+
+def test_iter_url_passes_only_the_options_the_scraper_accepts(monkeypatch):
+    calls = []
+
+    def iter_player_data(url, client=None, ordered=False, **opts):
+        calls.append((url, ordered, opts))
+        return iter(())
+
+    fake = types.SimpleNamespace(iter_player_data=iter_player_data)
+    monkeypatch.setattr(registry.importlib, 'import_module', lambda name: fake)
+    opts = {'image_workers': 2, 'transcoder': False, 'state': object()}
+    list(scrap.iter_url('https://www.ihf.info/teams/1', None, ordered=True, **opts))
+    assert calls == [('https://www.ihf.info/teams/1', True, {'image_workers': 2, 'transcoder': False})]
@@ -0,0 +1,105 @@
+"""response_cache.ResponseCache のインデックスの書き出しとストリームの応答"""
+import io
+import json
+import os
+import sys
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ehf  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from response_cache import ResponseCache, cache_key  # noqa: E402
+
+URL = 'https://www.eurohandball.com/en/team/1/'
+
+
+class FakeResponse:
+    def __init__(self, body, etag):
+        self.content = body
+        self.headers = {'ETag': etag, 'Content-Type': 'text/html'}
+
+
+def test_hits_update_atime_in_memory_and_flush_on_save(tmp_path):
+    cache = ResponseCache(str(tmp_path))
+    cache.store('k', 'https://example.com/', FakeResponse(b'<html>', '"v1"'))
+    index_path = tmp_path / 'index.json'
+    stored = json.loads(index_path.read_text())['k']['atime']
+    mtime = os.stat(index_path).st_mtime_ns
+
+    for _ in range(5):
+        assert cache.read_body('k') == b'<html>'
+    # ヒットではインデックスを書き直さない
+    assert os.stat(index_path).st_mtime_ns == mtime
+
+    cache.save()
+    assert json.loads(index_path.read_text())['k']['atime'] > stored
+    assert ResponseCache(str(tmp_path)).lookup('k')['etag'] == '"v1"'
+
+
+class CountingRaw(io.BytesIO):
+    """requests.Response.raw の代わり（読まれたバイト数を数える）。"""
+
+    def __init__(self, data):
+        super().__init__(data)
+        self.read_bytes = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+
+class FakeSession:
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+        self.raws = []
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.requests.append(dict(headers or {}))
+        resp = requests.Response()
+        resp.url = url
+        if (headers or {}).get('If-None-Match') == '"v1"':
+            resp.status_code = 304
+            resp.raw = CountingRaw(b'')
+        else:
+            resp.status_code = 200
+            resp.headers.update({'ETag': '"v1"', 'Content-Type': 'text/html'})
+            resp.raw = CountingRaw(self.body)
+        self.raws.append(resp.raw)
+        return resp
+
+
+def client_for(tmp_path, body):
+    client = HttpClient(response_cache=ResponseCache(str(tmp_path)), metrics=Metrics())
+    session = client._sessions['www.eurohandball.com'] = FakeSession(body)
+    return client, session
+
+
+def test_streamed_page_stops_early_with_the_cache_on(tmp_path):
+    tag = b'<div data-club-details-url="/api" data-club-id="1">'
+    body = b'<html>' + tag + b'x' * 400000
+    client, session = client_for(tmp_path, body)
+    resp = client.get(URL, cacheable=True, stream=True)
+    attrs, head = ehf.extract_club_details(resp.iter_content(ehf.CHUNK_SIZE))
+    resp.close()
+    assert attrs['data-club-id'] == '1'
+    assert session.raws[0].read_bytes <= ehf.CHUNK_SIZE
+    # 途中までしか読んでいない応答は保存しない
+    assert client.response_cache.lookup(cache_key(URL)) is None
+
+
+def test_streamed_page_read_to_the_end_is_cached(tmp_path):
+    body = b'<table>' + b'x' * 50000 + b'</table>'
+    client, session = client_for(tmp_path, body)
+    resp = client.get(URL, cacheable=True, stream=True)
+    assert b''.join(resp.iter_content(ehf.CHUNK_SIZE)) == body
+    assert session.raws[0].read_bytes == len(body)
+
+    again = client.get(URL, cacheable=True, stream=True)
+    assert session.requests[-1]['If-None-Match'] == '"v1"'
+    assert again.from_cache
+    assert b''.join(again.iter_content(ehf.CHUNK_SIZE)) == body
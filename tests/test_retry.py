@@ -0,0 +1,164 @@
+"""retry.RetryPolicy / CircuitBreaker と HttpClient.request の再試行"""
+import os
+import random
+import sys
+
+import pytest
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from http_client import HttpClient  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from retry import (RetryPolicy, CircuitBreaker, CircuitOpenError, classify_status, classify_exception,  # noqa: E402
+                   CONNECTION, TIMEOUT, SERVER, THROTTLED, NOT_FOUND, CLIENT, OK)
+
+URL = 'https://cdn.example/a.jpg'
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+        self.content = b''
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """results を順に返す（例外なら送出する）。"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def request(self, method, url, **kwargs):
+        self.calls.append(method)
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def client_with(results, **kwargs):
+    sleeps = []
+    client = HttpClient(metrics=Metrics(), sleep=sleeps.append, **kwargs)
+    session = client._sessions['cdn.example'] = FakeSession(results)
+    return client, session, sleeps
+
+
+def test_classification():
+    assert classify_status(200) == OK
+    assert classify_status(429) == THROTTLED
+    assert classify_status(503) == SERVER
+    assert classify_status(404) == NOT_FOUND
+    assert classify_status(410) == NOT_FOUND
+    assert classify_status(403) == CLIENT
+    assert classify_exception(requests.exceptions.ReadTimeout()) == TIMEOUT
+    assert classify_exception(requests.exceptions.ConnectionError()) == CONNECTION
+    assert classify_exception(requests.exceptions.InvalidURL()) is None
+
+
+def test_backoff_stays_within_full_jitter_bounds():
+    policy = RetryPolicy(base_delay=0.5, max_delay=3.0, rng=random.Random(1))
+    for attempt in range(6):
+        for _ in range(50):
+            assert 0 <= policy.delay(attempt) <= min(3.0, 0.5 * 2 ** attempt)
+    # Retry-After は短くしないが、max_delay で頭打ちにする
+    assert policy.delay(0, retry_after=2.0) >= 2.0
+    assert policy.delay(0, retry_after=60.0) == 3.0
+
+
+def test_non_idempotent_methods_only_retry_throttling():
+    policy = RetryPolicy(max_attempts=3)
+    assert policy.should_retry(SERVER, 0, 'GET')
+    assert not policy.should_retry(SERVER, 2, 'GET')
+    assert not policy.should_retry(SERVER, 0, 'POST')
+    assert not policy.should_retry(CONNECTION, 0, 'POST')
+    assert policy.should_retry(THROTTLED, 0, 'POST')
+    assert not policy.should_retry(NOT_FOUND, 0, 'GET')
+
+
+def test_transient_errors_are_retried_then_returned():
+    client, session, sleeps = client_with([requests.exceptions.ConnectionError('reset'), FakeResponse(503),
+                                           FakeResponse(200)], retry=RetryPolicy(max_attempts=3))
+    assert client.request('GET', URL).status_code == 200
+    assert len(session.calls) == 3
+    assert len(sleeps) == 2
+
+
+def test_final_statuses_are_not_retried():
+    client, session, sleeps = client_with([FakeResponse(404)])
+    assert client.request('GET', URL).status_code == 404
+    assert len(session.calls) == 1
+    assert sleeps == []
+
+
+def test_last_transient_response_is_returned_after_max_attempts():
+    first = FakeResponse(502)
+    client, session, _ = client_with([first, FakeResponse(502)], retry=RetryPolicy(max_attempts=2))
+    assert client.request('GET', URL).status_code == 502
+    assert first.closed
+    assert len(session.calls) == 2
+
+
+def test_post_is_not_resent_after_a_connection_error():
+    client, session, _ = client_with([requests.exceptions.ConnectionError('reset'), FakeResponse(200)])
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.request('POST', URL)
+    assert session.calls == ['POST']
+
+
+def test_retry_after_is_honoured():
+    client, _, sleeps = client_with([FakeResponse(429, {'Retry-After': '4'}), FakeResponse(200)],
+                                    retry=RetryPolicy(base_delay=0.1, max_delay=10.0))
+    assert client.request('GET', URL).status_code == 200
+    assert sleeps[0] >= 4.0
+
+
+def test_circuit_opens_then_allows_one_trial():
+    clock = FakeClock()
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=30.0, clock=clock)
+    breaker.before(URL)
+    breaker.failure(URL)
+    breaker.before(URL)
+    breaker.failure(URL)
+    with pytest.raises(CircuitOpenError):
+        breaker.before(URL)
+    # 他のホストには影響しない
+    breaker.before('https://other.example/')
+
+    clock.now += 30.0
+    breaker.before(URL)          # half-open: 1件だけ通す
+    with pytest.raises(CircuitOpenError):
+        breaker.before(URL)
+    breaker.failure(URL)         # 試行が失敗したらまた開く
+    clock.now += 29.0
+    with pytest.raises(CircuitOpenError):
+        breaker.before(URL)
+
+    clock.now += 1.0
+    breaker.before(URL)
+    breaker.success(URL)         # 試行が成功したら閉じる
+    breaker.before(URL)
+    breaker.before(URL)
+
+
+def test_open_circuit_stops_requests_without_sending():
+    clock = FakeClock()
+    client, session, _ = client_with([FakeResponse(500)] * 2, retry=RetryPolicy(max_attempts=2),
+                                     breaker=CircuitBreaker(failure_threshold=2, clock=clock))
+    assert client.request('GET', URL).status_code == 500
+    with pytest.raises(CircuitOpenError):
+        client.request('GET', URL)
+    assert len(session.calls) == 2
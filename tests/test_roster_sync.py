@@ -0,0 +1,127 @@
+"""roster_sync.RosterState と ehf の差分同期（--incremental）"""
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ehf  # noqa: E402
+from metrics import Metrics  # noqa: E402
+from roster_sync import RosterState  # noqa: E402
+
+URL = 'https://www.eurohandball.com/en/team/1/'
+API = 'https://www.eurohandball.com/api/clubdetails'
+PAGE = b'<div data-club-details-url="/api/clubdetails" data-club-id="1">'
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, size):
+        return iter([self.content])
+
+    def json(self):
+        return json.loads(self.content)
+
+    def close(self):
+        pass
+
+
+class FakeClient:
+    def __init__(self):
+        self.metrics = Metrics()
+        self.api_body = b''
+
+    def get(self, url, **kwargs):
+        return FakeResponse(PAGE if url == URL else self.api_body)
+
+    def remember_body(self, url, body):
+        pass
+
+    def host_limiter(self, per_host):
+        return None
+
+    def flush_caches(self):
+        pass
+
+
+def player(pid, age=20):
+    return {'id': pid, 'shirtNumber': 1, 'person': {'firstName': 'A', 'lastName': pid, 'age': age},
+            'photo': f'https://img.example/{pid}.jpg'}
+
+
+@pytest.fixture
+def setup(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    fetched = []
+
+    def fake_fetch(img_url, images_dir, pid, name, client, store=None):
+        fetched.append(pid)
+        path = os.path.join(images_dir, f'{pid}.jpg')
+        with open(path, 'wb') as f:
+            f.write(b'jpg')
+        return path
+
+    monkeypatch.setattr(ehf, 'fetch_player_image', fake_fetch)
+    monkeypatch.setattr(ehf, 'select_photo_url', lambda item: item.get('photo'))
+    state = RosterState(str(tmp_path / 'rosters'), change_log=str(tmp_path / 'changes.jsonl'))
+    client = FakeClient()
+
+    def run(players):
+        client.api_body = json.dumps({'players': players}).encode('utf-8')
+        fetched.clear()
+        records = ehf.scrape_player_data(URL, client=client, state=state)
+        return records, list(fetched)
+
+    return run, state, tmp_path / 'changes.jsonl'
+
+
+def read_changes(path):
+    if not path.exists():
+        return []
+    return [(e['change'], e['player']) for e in map(json.loads, path.read_text().splitlines())]
+
+
+def test_added_changed_removed_and_image_repaired(setup):
+    run, state, log = setup
+    records, fetched = run([player('p1'), player('p2')])
+    assert [r['ID'] for r in records] == ['p1', 'p2']
+    assert sorted(fetched) == ['p1', 'p2']
+    assert read_changes(log) == [('added', 'p1'), ('added', 'p2')]
+
+    # 同一の応答: 選手ごとの処理も画像取得もしない
+    again, fetched = run([player('p1'), player('p2')])
+    assert again == records
+    assert fetched == []
+    assert len(read_changes(log)) == 2
+
+    records, fetched = run([player('p1', age=21), player('p3')])
+    assert sorted(fetched) == ['p1', 'p3']
+    assert read_changes(log)[2:] == [('changed', 'p1'), ('added', 'p3'), ('removed', 'p2')]
+
+    # 情報は同じで画像ファイルだけ消えた選手は取り直し、image_repaired として記録する
+    os.remove(records[1]['Image'])
+    _, fetched = run([player('p1', age=21), player('p3')])
+    assert fetched == ['p3']
+    assert read_changes(log)[5:] == [('image_repaired', 'p3')]
+
+
+def test_state_file_round_trip(setup):
+    run, state, _ = setup
+    records, _ = run([player('p1')])
+    saved = state.load(URL)
+    assert [p['key'] for p in saved['players']] == ['p1']
+    assert saved['players'][0]['record'] == records[0]
+    assert saved['digest']
+    # 状態ファイルが無い・壊れている場合は None（全選手を処理し直す）
+    assert state.load('https://www.eurohandball.com/en/team/2/') is None
+    with open(state._path(URL), 'w') as f:
+        f.write('{broken')
+    assert state.load(URL) is None
@@ -0,0 +1,69 @@
+"""runner.ScrapeRunner のイベントと Cancel"""
+import os
+import sys
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scrap  # noqa: E402
+from runner import ScrapeRunner  # noqa: E402
+
+URL = 'https://www.eurohandball.com/en/team/1/'
+
+
+class FakeClient:
+    def flush_caches(self):
+        pass
+
+    def recent_body(self, url):
+        return None
+
+
+def next_event(run, kind):
+    while True:
+        event = run.events.get(timeout=5)
+        if event.kind == kind:
+            return event
+
+
+def test_events_and_cancel_while_waiting_for_the_next_player(tmp_path, monkeypatch):
+    release = threading.Event()
+    closed = threading.Event()
+
+    def fake_iter_url(url, client, ordered=True, **opts):
+        try:
+            yield {'選手名': 'A', 'Image': 'images/a.jpg'}
+            # 2人目の画像取得がなかなか終わらない
+            release.wait(5)
+            yield {'選手名': 'B', 'Image': ''}
+        finally:
+            closed.set()
+
+    monkeypatch.setattr(scrap, 'iter_url', fake_iter_url)
+    runner = ScrapeRunner(client=FakeClient())
+    run = runner.submit(URL, str(tmp_path / 'out.csv'))
+
+    assert run.events.get(timeout=5) == ('log', f'Starting scrape for URL: {URL}')
+    assert next_event(run, 'player').data['選手名'] == 'A'
+    assert next_event(run, 'image').data == 'images/a.jpg'
+
+    # 次の選手を待っている間でも Cancel で終わる
+    run.cancel()
+    done = next_event(run, 'done').data
+    assert done['cancelled'] and done['players'] == 1 and done['images'] == 1
+    assert run.future.result(timeout=5) is None
+    assert (tmp_path / 'out.csv').read_text(encoding='utf-8').count('\n') == 2
+
+    # 処理中の取得が終わったらジェネレータを閉じる（画像のプールが止まる）
+    assert not closed.is_set()
+    release.set()
+    assert closed.wait(5)
+    runner.shutdown()
+    assert not runner._worker.is_alive()
+
+
+def test_worker_thread_does_not_block_exit():
+    runner = ScrapeRunner(client=FakeClient())
+    assert runner._worker.daemon
+    assert runner.warm().result(timeout=30) is None
+    runner.shutdown()
@@ -0,0 +1,141 @@
+"""service.py の HTTP/JSON API（プロセス内のサーバーを空いているポートで起動して叩く）"""
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from metrics import Metrics  # noqa: E402
+from service import JobQueue, ScraperService  # noqa: E402
+
+TEAM = 'https://www.eurohandball.com/en/team/1/'
+SLOW = 'https://www.eurohandball.com/en/team/slow/'
+EMPTY = 'https://www.eurohandball.com/en/team/empty/'
+
+
+class FakeClient:
+    def __init__(self):
+        self.metrics = Metrics()
+
+
+@pytest.fixture
+def service():
+    release = threading.Event()
+    calls = []
+
+    def scrape(job):
+        calls.append(job.url)
+        if job.url == EMPTY:
+            return
+        yield {'背番号': '1', '選手名': 'A'}
+        if job.url == SLOW:
+            release.wait(5)
+        yield {'背番号': '2', '選手名': 'B'}
+
+    jobs = JobQueue(scrape, workers=2)
+    server = ScraperService(('127.0.0.1', 0), jobs, FakeClient())
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+    base = f'http://127.0.0.1:{server.server_address[1]}'
+    yield base, release, calls
+    release.set()
+    server.shutdown()
+    server.server_close()
+    jobs.shutdown()
+
+
+def call(base, method, path, body=None):
+    """(ステータス, 本文) を返す。本文は JSON なら解析したもの。"""
+    data = body if isinstance(body, bytes) or body is None else json.dumps(body).encode('utf-8')
+    request = urllib.request.Request(base + path, data=data, method=method)
+    try:
+        with urllib.request.urlopen(request, timeout=5) as resp:
+            status, content, ctype = resp.status, resp.read(), resp.headers.get('Content-Type', '')
+    except urllib.error.HTTPError as e:
+        status, content, ctype = e.code, e.read(), e.headers.get('Content-Type', '')
+    return status, json.loads(content) if ctype.startswith('application/json') else content.decode('utf-8')
+
+
+def wait_for(base, job_id, status):
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        _, job = call(base, 'GET', f'/jobs/{job_id}')
+        if job['status'] == status:
+            return job
+        time.sleep(0.01)
+    raise AssertionError(f'job {job_id} did not become {status}: {job}')
+
+
+def test_submit_status_and_result(service):
+    base, _, calls = service
+    status, job = call(base, 'POST', '/jobs', {'url': TEAM})
+    assert status == 202 and job['url'] == TEAM
+    done = wait_for(base, job['id'], 'done')
+    assert done['players'] == 2 and done['error'] is None
+
+    status, result = call(base, 'GET', f'/jobs/{job["id"]}/result')
+    assert status == 200
+    assert [r['選手名'] for r in result['records']] == ['A', 'B']
+    status, text = call(base, 'GET', f'/jobs/{job["id"]}/result?format=csv')
+    assert status == 200 and text.splitlines() == ['背番号,選手名', '1,A', '2,B']
+
+    # 直近に終わった同じURLは取り直さない（fresh なら取り直す）
+    assert call(base, 'POST', '/jobs', {'url': TEAM})[1]['id'] == job['id']
+    status, again = call(base, 'POST', '/jobs', {'url': TEAM, 'fresh': True})
+    assert again['id'] != job['id']
+    wait_for(base, again['id'], 'done')
+    assert calls == [TEAM, TEAM]
+
+    status, listing = call(base, 'GET', '/jobs?status=done')
+    assert {j['id'] for j in listing['jobs']} == {job['id'], again['id']}
+    status, health = call(base, 'GET', '/health')
+    assert health['workers'] == 2 and health['jobs']['done'] == 2
+
+
+def test_running_job_result_conflicts_and_cancel(service):
+    base, release, _ = service
+    _, jobs = call(base, 'POST', '/jobs', {'urls': [SLOW, EMPTY]})
+    slow, empty = jobs['jobs']
+    assert wait_for(base, empty['id'], 'failed')['error'] == 'No player data found.'
+
+    wait_for(base, slow['id'], 'running')
+    status, body = call(base, 'GET', f'/jobs/{slow["id"]}/result')
+    assert status == 409 and body['error'] == 'job has not finished'
+    # 同じURLの実行中のジョブがあれば新しいジョブは作らない
+    assert call(base, 'POST', '/jobs', {'url': SLOW})[1]['id'] == slow['id']
+
+    assert call(base, 'DELETE', f'/jobs/{slow["id"]}')[0] == 200
+    release.set()
+    cancelled = wait_for(base, slow['id'], 'cancelled')
+    assert cancelled['players'] == 2
+
+
+@pytest.mark.parametrize('method, path, body, status', [
+    ('POST', '/jobs', b'{not json', 400),
+    ('POST', '/jobs', [TEAM], 400),
+    ('POST', '/jobs', {'url': 'ftp://example.com/team'}, 400),
+    ('POST', '/jobs', {'urls': [TEAM, 3]}, 400),
+    ('POST', '/other', {'url': TEAM}, 404),
+    ('GET', '/jobs?status=bogus', None, 400),
+    ('GET', '/jobs/missing', None, 404),
+    ('GET', '/jobs/missing/result', None, 404),
+    ('DELETE', '/jobs/missing', None, 404),
+    ('GET', '/nowhere', None, 404),
+])
+def test_bad_requests(service, method, path, body, status):
+    base, _, calls = service
+    code, payload = call(base, method, path, body)
+    assert code == status
+    assert payload['error']
+    assert calls == []
+
+
+def test_metrics_endpoint(service):
+    base, _, _ = service
+    status, text = call(base, 'GET', '/metrics')
+    assert status == 200 and isinstance(text, str)
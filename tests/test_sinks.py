@@ -0,0 +1,32 @@
+"""sinks の選手キー（同名の選手が1行にまとまらないこと）"""
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ehf  # noqa: E402
+from sinks import SqliteSink, player_key  # noqa: E402
+
+TEAM = 'https://www.eurohandball.com/en/team/1/'
+
+
+def api_item(pid, first, last, number):
+    return {'id': pid, 'shirtNumber': number, 'person': {'firstName': first, 'lastName': last}}
+
+
+def test_players_with_the_same_name_keep_separate_rows(tmp_path):
+    records = [ehf.player_record(api_item('p1', 'Jonas', 'Berg', 5)),
+               ehf.player_record(api_item('p2', 'Jonas', 'Berg', 17))]
+    assert [r['ID'] for r in records] == ['p1', 'p2']
+
+    path = str(tmp_path / 'rosters.db')
+    with SqliteSink(path) as sink:
+        sink.write(records, TEAM)
+    with sqlite3.connect(path) as conn:
+        rows = conn.execute('SELECT player, number FROM players ORDER BY player').fetchall()
+    assert rows == [('p1', '5'), ('p2', '17')]
+
+
+def test_key_without_id_uses_name_and_number():
+    assert player_key({'選手名': 'Jonas Berg', '背番号': '5'}) != player_key({'選手名': 'Jonas Berg', '背番号': '17'})